@@ -1,101 +1,145 @@
-from fastapi import APIRouter, HTTPException, Body, Query
+from fastapi import APIRouter, HTTPException, Body, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from firebase.config import db
+from firebase.config import async_db
 from datetime import datetime
-from twilio.rest import Client
+import asyncio
+import hashlib
+import json
 import os
-from typing import Optional
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
 import logging
+from .events import broker
+from .metrics import span
+from .notifications import FakeSMSProvider, SMSDispatcher, TwilioSMSProvider
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Every backend call gets a deadline so one slow dependency can't hold a request forever
+FIRESTORE_TIMEOUT = float(os.getenv("FIRESTORE_TIMEOUT", "10"))
+SMS_TIMEOUT = float(os.getenv("SMS_TIMEOUT", "10"))
+SMS_PROVIDER = os.getenv("SMS_PROVIDER", "twilio")  # "fake" records messages locally instead of sending
+
 class AlertUpdate(BaseModel):
     status: str
 
+# Station lists change rarely; cache them per forest location
+STATIONS_CACHE_TTL = float(os.getenv("STATIONS_CACHE_TTL", "60"))
+_stations_cache: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+
+DEFAULT_ALERTS_LIMIT = 100
+MAX_ALERTS_LIMIT = 500
+
+async def _fetch_fire_stations(location_id) -> List[Dict[str, Any]]:
+    stations_ref = async_db.collection("forestLocations").document(location_id).collection("firestations")
+    stations = []
+    with span("firestore.stations"):
+        async for doc in stations_ref.stream(timeout=FIRESTORE_TIMEOUT):
+            station_data = doc.to_dict()
+            stations.append({
+                "id": doc.id,
+                "name": station_data.get("station_name", f"Station {doc.id}"),
+                "phone": station_data.get("phone", "")
+            })
+    return stations
+
+async def get_all_fire_stations(location_id) -> List[Dict[str, Any]]:
+    """All fire stations of a location, served from a TTL cache."""
+    cached = _stations_cache.get(location_id)
+    if cached and time.monotonic() - cached[0] < STATIONS_CACHE_TTL:
+        return cached[1]
+    logger.info(f"Fetching fire stations for location {location_id}")
+    stations = await _fetch_fire_stations(location_id)
+    _stations_cache[location_id] = (time.monotonic(), stations)
+    logger.info(f"Found {len(stations)} stations for location {location_id}")
+    return stations
+
 async def get_fire_stations(location_id, station_id: Optional[str] = None):
     """Helper function to get fire stations for a location, optionally filtered by station_id"""
     try:
-        logger.info(f"Fetching fire stations for location {location_id}, station_id: {station_id}")
-        stations_ref = db.collection("forestLocations").document(location_id).collection("firestations")
-        
+        stations = await get_all_fire_stations(location_id)
         if station_id:
-            # Get specific station if ID provided
-            station_doc = stations_ref.document(station_id).get()
-            if not station_doc.exists:
+            matching = [station for station in stations if station["id"] == station_id]
+            if not matching:
                 logger.warning(f"Station {station_id} not found in location {location_id}")
-                return []
-            
-            station_data = station_doc.to_dict()
-            logger.info(f"Found station {station_id}: {station_data}")
-            return [{
-                "id": station_id,
-                "name": station_data.get("station_name", f"Station {station_id}"),
-                "phone": station_data.get("phone", "")
-            }]
-        else:
-            # Get all stations if no ID provided
-            docs = stations_ref.stream()
-            stations = []
-            for doc in docs:
-                station_data = doc.to_dict()
-                stations.append({
-                    "id": doc.id,
-                    "name": station_data.get("station_name", f"Station {doc.id}"),
-                    "phone": station_data.get("phone", "")
-                })
-            logger.info(f"Found {len(stations)} stations for location {location_id}")
-            return stations
-            
+            return matching
+        return stations
+
     except Exception as e:
         logger.error(f"Error fetching fire stations for location {location_id}: {str(e)}", exc_info=True)
         return []
 
 @router.get("/")
 async def get_alerts(
+    request: Request,
     forest_id: Optional[str] = Query(None, description="Filter alerts by forest ID"),
-    station_id: Optional[str] = Query(None, description="Filter fire stations by station ID")
+    station_id: Optional[str] = Query(None, description="Filter fire stations by station ID"),
+    limit: int = Query(DEFAULT_ALERTS_LIMIT, ge=1, le=MAX_ALERTS_LIMIT, description="Maximum alerts per page"),
+    start_after: Optional[str] = Query(None, description="Alert ID cursor from the X-Next-Cursor header")
 ):
-    """Get alerts with associated fire stations, optionally filtered by forest and station"""
+    """Get alerts with associated fire stations, optionally filtered by forest and station.
+
+    Alerts come newest first, one page at a time: without limit a request returns
+    at most DEFAULT_ALERTS_LIMIT alerts, and the X-Next-Cursor response header
+    holds the start_after value for the next page (absent once a page comes back short).
+    Responses carry an ETag and honour If-None-Match. Needs two composite
+    indexes on alerts: (detection_status, forest_location_id, timestamp desc)
+    when forest_id is given, and (detection_status, timestamp desc) otherwise.
+    """
     try:
-        logger.info(f"Fetching alerts - forest_id: {forest_id}, station_id: {station_id}")
-        
-        # First get all active alerts (without ordering)
-        alerts_ref = db.collection("alerts").where("detection_status", "==", "active")
-        
+        logger.info(f"Fetching alerts - forest_id: {forest_id}, station_id: {station_id}, limit: {limit}, start_after: {start_after}")
+
+        alerts_ref = async_db.collection("alerts").where("detection_status", "==", "active")
+
         # Apply forest filter if provided
         if forest_id:
             alerts_ref = alerts_ref.where("forest_location_id", "==", forest_id)
-        
+
+        # Ordering and paging happen in Firestore instead of sorting everything in memory
+        alerts_ref = alerts_ref.order_by("timestamp", direction="DESCENDING").limit(limit)
+        if start_after:
+            with span("firestore.alert_get"):
+                cursor_doc = await async_db.collection("alerts").document(start_after).get(timeout=FIRESTORE_TIMEOUT)
+            if not cursor_doc.exists:
+                raise HTTPException(status_code=400, detail="Unknown start_after cursor")
+            alerts_ref = alerts_ref.start_after(cursor_doc)
+
+        with span("firestore.alerts_list"):
+            docs = await alerts_ref.get(timeout=FIRESTORE_TIMEOUT)
+        rows = [(doc.id, doc.to_dict()) for doc in docs]
+
+        # One station lookup per forest, all forests in parallel
+        location_ids = list({data["forest_location_id"] for _, data in rows if "forest_location_id" in data})
+        station_lists = await asyncio.gather(*(get_fire_stations(loc_id, station_id) for loc_id in location_ids))
+        stations_by_location = dict(zip(location_ids, station_lists))
+
         alerts = []
-        for doc in alerts_ref.stream():
-            alert_data = doc.to_dict()
-            alert_data["alert_id"] = doc.id
-            
-            # Get fire stations for this location
+        for doc_id, alert_data in rows:
+            alert_data["alert_id"] = doc_id
             if "forest_location_id" in alert_data:
-                try:
-                    alert_data["fire_stations"] = await get_fire_stations(
-                        alert_data["forest_location_id"],
-                        station_id
-                    )
-                except Exception as e:
-                    logger.error(f"Error getting stations for alert {doc.id}: {str(e)}", exc_info=True)
-                    alert_data["fire_stations"] = []
-            
+                alert_data["fire_stations"] = stations_by_location.get(alert_data["forest_location_id"], [])
+
             # Only include alerts with matching stations if station_id was provided
             if not station_id or alert_data.get("fire_stations"):
                 alerts.append(alert_data)
-        
-        # Sort in memory after fetching
-        alerts.sort(key=lambda x: x.get("timestamp"), reverse=True)
-        
+
+        body = json.dumps(jsonable_encoder(alerts), separators=(",", ":")).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        headers = {"ETag": etag}
+        if len(docs) == limit:
+            headers["X-Next-Cursor"] = docs[-1].id
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+
         logger.info(f"Returning {len(alerts)} alerts")
-        return alerts
-        
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Critical error in get_alerts: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -118,8 +162,9 @@ async def update_alert_status(
                 detail=f"Status must be one of {valid_statuses}"
             )
         
-        alert_ref = db.collection("alerts").document(alert_id)
-        alert_doc = alert_ref.get()
+        alert_ref = async_db.collection("alerts").document(alert_id)
+        with span("firestore.alert_get"):
+            alert_doc = await alert_ref.get(timeout=FIRESTORE_TIMEOUT)
         if not alert_doc.exists:
             logger.warning(f"Alert {alert_id} not found")
             raise HTTPException(status_code=404, detail="Alert not found")
@@ -130,7 +175,14 @@ async def update_alert_status(
             "updated_at": datetime.utcnow()
         }
         logger.debug(f"Updating alert {alert_id} with fields: {update_fields}")
-        alert_ref.update(update_fields)
+        with span("firestore.alert_update"):
+            await alert_ref.update(update_fields, timeout=FIRESTORE_TIMEOUT)
+        forest_location_id = alert_doc.to_dict().get("forest_location_id")
+        broker.publish("alert_status", {
+            "alert_id": alert_id,
+            "status": update_data.status,
+            "forest_location_id": forest_location_id
+        }, forest_id=forest_location_id)
         
         logger.info(f"Successfully updated alert {alert_id}")
         return {
@@ -139,6 +191,8 @@ async def update_alert_status(
             "new_status": update_data.status
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating alert {alert_id}: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -151,14 +205,22 @@ async def delete_alert(alert_id: str):
     """Delete an alert from the database"""
     try:
         logger.info(f"Deleting alert {alert_id}")
-        alert_ref = db.collection("alerts").document(alert_id)
-        alert_doc = alert_ref.get()
+        alert_ref = async_db.collection("alerts").document(alert_id)
+        with span("firestore.alert_get"):
+            alert_doc = await alert_ref.get(timeout=FIRESTORE_TIMEOUT)
         
         if not alert_doc.exists:
             logger.warning(f"Alert {alert_id} not found for deletion")
             raise HTTPException(status_code=404, detail="Alert not found")
 
-        alert_ref.delete()
+        with span("firestore.alert_delete"):
+            await alert_ref.delete(timeout=FIRESTORE_TIMEOUT)
+        forest_location_id = alert_doc.to_dict().get("forest_location_id")
+        broker.publish("alert_status", {
+            "alert_id": alert_id,
+            "status": "deleted",
+            "forest_location_id": forest_location_id
+        }, forest_id=forest_location_id)
         logger.info(f"Successfully deleted alert {alert_id}")
         return {
             "status": "success",
@@ -166,6 +228,8 @@ async def delete_alert(alert_id: str):
             "message": "Alert deleted successfully"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting alert {alert_id}: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -174,45 +238,69 @@ async def delete_alert(alert_id: str):
         )
 
 # SMS Configuration
-try:
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-    twilio_phone = os.getenv('TWILIO_PHONE_NUMBER')
-    your_phone = os.getenv('PHONE_NUMBER')
-    
-    if not all([account_sid, auth_token, twilio_phone, your_phone]):
-        logger.warning("Missing one or more Twilio configuration environment variables")
-    
-    client = Client(account_sid, auth_token)
-    logger.info("Twilio client initialized successfully")
-except Exception as e:
-    logger.error(f"Error initializing Twilio client: {str(e)}", exc_info=True)
-    client = None
+account_sid = os.getenv('TWILIO_ACCOUNT_SID')
+auth_token = os.getenv('TWILIO_AUTH_TOKEN')
+twilio_phone = os.getenv('TWILIO_PHONE_NUMBER')
+your_phone = os.getenv('PHONE_NUMBER')
+twilio_configured = all([account_sid, auth_token, twilio_phone, your_phone])
+if SMS_PROVIDER != "fake" and not twilio_configured:
+    logger.warning("Missing one or more Twilio configuration environment variables")
+
+_twilio_client = None
+_twilio_lock = threading.Lock()
+
+def get_twilio_client():
+    """Twilio client, built (and the twilio package imported) on first use."""
+    global _twilio_client
+    with _twilio_lock:
+        if _twilio_client is None:
+            from twilio.rest import Client
+            from twilio.http.http_client import TwilioHttpClient
+            # Pooled HTTP session (keep-alive connections reused across messages) with a per-request timeout
+            _twilio_client = Client(account_sid, auth_token, http_client=TwilioHttpClient(pool_connections=True, timeout=SMS_TIMEOUT))
+            logger.info("Twilio client initialized successfully")
+        return _twilio_client
+
+# Outbound queue: requests only enqueue, the dispatcher coalesces, rate-limits and retries
+if SMS_PROVIDER == "fake":
+    sms_dispatcher = SMSDispatcher(FakeSMSProvider())
+elif twilio_configured:
+    sms_dispatcher = SMSDispatcher(TwilioSMSProvider(get_twilio_client, twilio_phone))
+else:
+    sms_dispatcher = None
 
 class SMSRequest(BaseModel):
     alert_id: str
     station_name: str
     forest_name: str
 
-@router.post("/send-alert-sms")
+@router.post("/send-alert-sms", status_code=202)
 async def send_alert_sms(request: SMSRequest):
+    """Queue an SMS for the alert and return its job id without waiting for delivery."""
     try:
-        if not client:
+        if not sms_dispatcher:
             raise Exception("Twilio client not initialized")
         
-        logger.info(f"Sending SMS for alert {request.alert_id}")
-        message = client.messages.create(
-            body=f"🚨 FIRE ALERT! Assistance requested at {request.station_name} in {request.forest_name} (Alert ID: {request.alert_id})",
-            from_=twilio_phone,
-            to=your_phone
+        job_id = sms_dispatcher.submit(
+            your_phone,
+            f"🚨 FIRE ALERT! Assistance requested at {request.station_name} in {request.forest_name} (Alert ID: {request.alert_id})",
+            alert_id=request.alert_id
         )
         
-        logger.info(f"SMS sent successfully for alert {request.alert_id}, SID: {message.sid}")
+        logger.info(f"SMS queued for alert {request.alert_id}, job: {job_id}")
         return {
-            "status": "success",
-            "message_sid": message.sid,
+            "status": "queued",
+            "job_id": job_id,
             "alert_id": request.alert_id
         }
     except Exception as e:
-        logger.error(f"Error sending SMS for alert {request.alert_id}: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.error(f"Error queueing SMS for alert {request.alert_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/sms-jobs/{job_id}")
+async def get_sms_job(job_id: str):
+    """Delivery status of a queued SMS (queued, sending, retrying, sent, failed)"""
+    job = sms_dispatcher.job(job_id) if sms_dispatcher else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="SMS job not found")
+    return job
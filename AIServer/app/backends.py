@@ -0,0 +1,331 @@
+import glob
+import hashlib
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.getenv("MODEL_DIR", "model")
+SOURCE_WEIGHTS = os.path.join(MODEL_DIR, "best.pt")
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+INFERENCE_INT8 = os.getenv("INFERENCE_INT8", "0") == "1"
+CONFIDENCE_THRESHOLD = float(os.getenv("DETECTION_CONFIDENCE", "0.6"))
+VERIFY_BACKEND = os.getenv("INFERENCE_VERIFY_BACKEND", "0") == "1"
+VERIFY_IMAGES_DIR = os.getenv("INFERENCE_VERIFY_IMAGES")  # Optional folder of sample frames
+VERIFY_CONFIDENCE = float(os.getenv("INFERENCE_VERIFY_CONFIDENCE", "0.05"))  # Low, so sub-threshold scores are compared too
+# Real fire frame shipped with the repo, used when INFERENCE_VERIFY_IMAGES is not set
+VERIFY_SAMPLE_FRAME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "output", "location_1_output.jpg")
+
+
+class ModelBackend:
+    """One way of running best.pt. Every backend is loaded through ultralytics,
+    so pre/post-processing and the result objects are identical across engines."""
+
+    name = ""
+    export_format: Optional[str] = None
+
+    def weights_path(self, int8: bool = False) -> str:
+        raise NotImplementedError
+
+    def load(self, int8: bool = False) -> "YOLO":
+        from ultralytics import YOLO
+        path = self.weights_path(int8)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"No {self.name} weights at {path}. Run `python -m app.export --backend {self.name}` first."
+            )
+        logger.info(f"Loading {self.name} model from {path}")
+        return YOLO(path, task="detect")
+
+    def export(self, int8: bool = False, imgsz: int = 640) -> str:
+        raise NotImplementedError
+
+
+class TorchBackend(ModelBackend):
+    name = "torch"
+
+    def weights_path(self, int8: bool = False) -> str:
+        if int8:
+            raise ValueError("INT8 is not supported for the torch backend.")
+        return SOURCE_WEIGHTS
+
+    def export(self, int8: bool = False, imgsz: int = 640) -> str:
+        # The source weights are the torch backend; nothing to convert
+        return self.weights_path(int8)
+
+
+class TorchScriptBackend(ModelBackend):
+    name = "torchscript"
+    export_format = "torchscript"
+
+    def weights_path(self, int8: bool = False) -> str:
+        if int8:
+            raise ValueError("INT8 is not supported for the torchscript backend.")
+        return os.path.join(MODEL_DIR, "best.torchscript")
+
+    def export(self, int8: bool = False, imgsz: int = 640) -> str:
+        from ultralytics import YOLO
+        return YOLO(SOURCE_WEIGHTS).export(format=self.export_format, imgsz=imgsz)
+
+
+class OnnxRuntimeBackend(ModelBackend):
+    name = "onnxruntime"
+    export_format = "onnx"
+
+    def weights_path(self, int8: bool = False) -> str:
+        return os.path.join(MODEL_DIR, "best.int8.onnx" if int8 else "best.onnx")
+
+    def export(self, int8: bool = False, imgsz: int = 640) -> str:
+        from ultralytics import YOLO
+        # dynamic=True keeps the batch axis free for run_detection_batch
+        path = YOLO(SOURCE_WEIGHTS).export(format=self.export_format, imgsz=imgsz, dynamic=True, simplify=True)
+        if not int8:
+            return path
+        import onnx
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantized = self.weights_path(int8=True)
+        quantize_dynamic(path, quantized, weight_type=QuantType.QUInt8)
+
+        # Carry over the ultralytics metadata (class names, stride, imgsz) dropped by quantization
+        source, target = onnx.load(path), onnx.load(quantized)
+        del target.metadata_props[:]
+        target.metadata_props.extend(source.metadata_props)
+        onnx.save(target, quantized)
+        return quantized
+
+
+class OpenVINOBackend(ModelBackend):
+    name = "openvino"
+    export_format = "openvino"
+
+    def weights_path(self, int8: bool = False) -> str:
+        return os.path.join(MODEL_DIR, "best_int8_openvino_model" if int8 else "best_openvino_model")
+
+    def export(self, int8: bool = False, imgsz: int = 640) -> str:
+        from ultralytics import YOLO
+        options = {"format": self.export_format, "imgsz": imgsz, "dynamic": True}
+        if int8:
+            # OpenVINO INT8 is post-training quantization and needs a calibration dataset yaml
+            data = os.getenv("INT8_CALIBRATION_DATA")
+            if not data:
+                raise ValueError("Set INT8_CALIBRATION_DATA to a dataset yaml to export an INT8 OpenVINO model.")
+            options.update(int8=True, data=data)
+        return YOLO(SOURCE_WEIGHTS).export(**options)
+
+
+class _StubTensor:
+    """Just enough of a torch tensor for callers that do .cpu().numpy()."""
+
+    def __init__(self, array: np.ndarray):
+        self._array = array
+
+    def cpu(self) -> "_StubTensor":
+        return self
+
+    def numpy(self) -> np.ndarray:
+        return self._array
+
+
+class _StubBoxes:
+    def __init__(self, cls: np.ndarray, conf: np.ndarray, xyxy: np.ndarray):
+        self.cls, self.conf, self.xyxy = _StubTensor(cls), _StubTensor(conf), _StubTensor(xyxy)
+
+    def __len__(self) -> int:
+        return len(self.cls.numpy())
+
+
+class _StubResult:
+    def __init__(self, boxes: _StubBoxes):
+        self.boxes = boxes
+
+
+class StubModel:
+    """Model stand-in for benchmarks and local runs without weights or torch.
+
+    Sleeps like a forward pass (a fixed cost per call plus a cost per frame)
+    and reports one "fire" box around saturated orange pixels, so frames from a
+    synthetic corpus have a known answer.
+    """
+
+    names = {0: "fire", 1: "smoke"}
+
+    def __init__(self, call_ms: float = 5.0, frame_ms: float = 2.0):
+        self.call_ms = call_ms
+        self.frame_ms = frame_ms
+
+    def _detect(self, image: np.ndarray) -> _StubResult:
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, (0, 150, 150), (25, 255, 255))
+        if cv2.countNonZero(mask) < 16:
+            return _StubResult(_StubBoxes(np.empty(0), np.empty(0, np.float32), np.empty((0, 4), np.float32)))
+        x, y, w, h = cv2.boundingRect(mask)
+        return _StubResult(_StubBoxes(
+            np.array([0.0]), np.array([0.9], np.float32), np.array([[x, y, x + w, y + h]], np.float32)
+        ))
+
+    def predict(self, source, conf: float = 0.25, classes=None, **kwargs) -> List[_StubResult]:
+        images = source if isinstance(source, (list, tuple)) else [source]
+        time.sleep((self.call_ms + self.frame_ms * len(images)) / 1000)
+        return [self._detect(image) for image in images]
+
+
+class StubBackend(ModelBackend):
+    name = "stub"
+
+    def weights_path(self, int8: bool = False) -> str:
+        return "stub"
+
+    def load(self, int8: bool = False) -> StubModel:
+        logger.info("Loading stub model")
+        return StubModel(
+            call_ms=float(os.getenv("STUB_MODEL_CALL_MS", "5")),
+            frame_ms=float(os.getenv("STUB_MODEL_FRAME_MS", "2")),
+        )
+
+    def export(self, int8: bool = False, imgsz: int = 640) -> str:
+        return self.weights_path(int8)
+
+
+BACKENDS: Dict[str, ModelBackend] = {
+    backend.name: backend
+    for backend in (TorchBackend(), TorchScriptBackend(), OnnxRuntimeBackend(), OpenVINOBackend(), StubBackend())
+}
+
+
+def get_backend(name: str = INFERENCE_BACKEND) -> ModelBackend:
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown inference backend '{name}'. Choose one of {sorted(BACKENDS)}")
+
+
+_fingerprints: Dict[tuple, str] = {}
+
+
+def model_fingerprint(name: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8) -> str:
+    """Stable id of the weights in use: backend name plus a hash of the weight files."""
+    cache_key = (name, int8)
+    if cache_key not in _fingerprints:
+        path = get_backend(name).weights_path(int8)
+        files = sorted(glob.glob(os.path.join(path, "**", "*"), recursive=True)) if os.path.isdir(path) else [path]
+        digest = hashlib.sha256()
+        for file in files:
+            if os.path.isfile(file):
+                with open(file, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(chunk)
+        _fingerprints[cache_key] = f"{name}{'-int8' if int8 else ''}:{digest.hexdigest()[:16]}"
+    return _fingerprints[cache_key]
+
+
+def _verification_frames() -> List[np.ndarray]:
+    """Real frames to compare backends on: INFERENCE_VERIFY_IMAGES, else the fire frame shipped in output/."""
+    if VERIFY_IMAGES_DIR:
+        paths = sorted(glob.glob(os.path.join(VERIFY_IMAGES_DIR, "*.jp*g")))[:8]
+    else:
+        paths = [VERIFY_SAMPLE_FRAME]
+    frames = [image for image in (cv2.imread(path, cv2.IMREAD_COLOR) for path in paths) if image is not None]
+    if not frames:
+        raise FileNotFoundError(f"No verification frames in {VERIFY_IMAGES_DIR or VERIFY_SAMPLE_FRAME}")
+    return frames
+
+
+def _box_iou(a: np.ndarray, b: np.ndarray) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _raw_boxes(model: "YOLO", frame: np.ndarray, conf: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    boxes = model.predict(frame, conf=conf, verbose=False)[0].boxes
+    return boxes.cls.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.xyxy.cpu().numpy()
+
+
+def _unmatched(
+    expected: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    actual: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    floor: float,
+    conf_tolerance: float,
+    min_iou: float,
+) -> List[str]:
+    """Greedily match each expected box scoring at least floor to an actual box of the same class."""
+    expected_cls, expected_conf, expected_xyxy = expected
+    actual_cls, actual_conf, actual_xyxy = actual
+    problems = []
+    remaining = set(range(len(actual_cls)))
+    for j in np.argsort(-expected_conf):
+        if expected_conf[j] < floor:
+            break  # Close enough to the cut-off to be dropped by the other side
+        candidates = [k for k in remaining if actual_cls[k] == expected_cls[j]]
+        best = max(candidates, key=lambda k: _box_iou(actual_xyxy[k], expected_xyxy[j]), default=None)
+        iou = _box_iou(actual_xyxy[best], expected_xyxy[j]) if best is not None else 0.0
+        if iou < min_iou:
+            problems.append(f"class {int(expected_cls[j])} box at {expected_conf[j]:.2f} has no match (best IoU {iou:.2f})")
+            continue
+        remaining.discard(best)
+        if abs(float(actual_conf[best]) - float(expected_conf[j])) > conf_tolerance:
+            problems.append(f"class {int(expected_cls[j])} box scores {actual_conf[best]:.2f} vs {expected_conf[j]:.2f}")
+    return problems
+
+
+def check_equivalence(
+    candidate: "YOLO",
+    reference: "YOLO",
+    frames: Optional[Sequence[np.ndarray]] = None,
+    conf: float = VERIFY_CONFIDENCE,
+    threshold: float = CONFIDENCE_THRESHOLD,
+    conf_tolerance: float = 0.05,
+    min_iou: float = 0.9,
+) -> List[str]:
+    """Compare two loaded models on the same frames and return a list of mismatches (empty if equivalent).
+
+    Both models predict at a low confidence, so raw scores and boxes well below
+    the serving threshold are compared too, in both directions. The number of
+    boxes per class kept at `threshold` must then agree. A reference that finds
+    nothing in any frame is a failure: the check would prove nothing.
+    """
+    frames = list(frames) if frames is not None else _verification_frames()
+    problems = []
+    if dict(candidate.names) != dict(reference.names):
+        problems.append(f"class names differ: {candidate.names} != {reference.names}")
+
+    reference_boxes = 0
+    floor = conf + conf_tolerance
+    for i, frame in enumerate(frames):
+        ours = _raw_boxes(candidate, frame, conf)
+        theirs = _raw_boxes(reference, frame, conf)
+        reference_boxes += len(theirs[0])
+        problems += [f"frame {i}: candidate {p}" for p in _unmatched(theirs, ours, floor, conf_tolerance, min_iou)]
+        problems += [f"frame {i}: reference {p}" for p in _unmatched(ours, theirs, floor, float("inf"), min_iou)]
+
+        kept_ours = sorted(int(c) for c, score in zip(ours[0], ours[1]) if score >= threshold)
+        kept_theirs = sorted(int(c) for c, score in zip(theirs[0], theirs[1]) if score >= threshold)
+        if kept_ours != kept_theirs:
+            problems.append(f"frame {i}: classes kept at {threshold} differ: {kept_ours} vs {kept_theirs} from reference")
+
+    if not reference_boxes:
+        problems.append(f"reference found no boxes at conf {conf} in {len(frames)} frame(s); verify with frames that contain fire")
+    return problems
+
+
+def load_model(name: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8, verify: bool = VERIFY_BACKEND) -> "YOLO":
+    """Load the configured backend, optionally checking it against the torch weights first."""
+    backend = get_backend(name)
+    model = backend.load(int8)
+    if verify and backend.name != TorchBackend.name:
+        problems = check_equivalence(model, TorchBackend().load())
+        if problems:
+            raise RuntimeError(f"{backend.name} backend does not match torch output: " + "; ".join(problems))
+        logger.info(f"{backend.name} backend output matches torch reference")
+    return model
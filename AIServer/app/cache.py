@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from firebase.db_operations import download_image_bytes, get_blob_fingerprint
+from firebase.downloader import downloader
+from .backends import CONFIDENCE_THRESHOLD, model_fingerprint
+from .decoding import MODEL_INPUT_SIZE, decode_for_model, scale_detections
+from .tiling import TILING_SIGNATURE, detect_frame
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_BYTES = int(os.getenv("DETECTION_CACHE_MB", "64")) * 1024 * 1024
+CACHE_DB_PATH = os.getenv("DETECTION_CACHE_DB")  # Optional SQLite file for the on-disk tier
+
+
+class DetectionCache:
+    """Two-tier cache of detection results keyed by image identity.
+
+    Every key is prefixed with a namespace made of the model fingerprint, the
+    confidence threshold and the tiling setup, so changing any of them misses
+    instead of serving stale results. The memory tier is an LRU bounded by the
+    JSON size of its entries; the optional SQLite tier survives restarts.
+
+    The namespace may be given as a callable and the SQLite file is opened on
+    first use (or open()), so importing the module neither hashes the weights
+    nor holds a connection that a forking server would share between workers.
+    """
+
+    def __init__(self, namespace: Union[str, Callable[[], str]], max_bytes: int = CACHE_MAX_BYTES,
+                 db_path: Optional[str] = CACHE_DB_PATH):
+        self._namespace = namespace
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._opened = False
+        self._db: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        with self._lock:
+            self._open()
+
+    def _open(self) -> None:
+        """Resolve the namespace and connect the disk tier. Caller holds the lock."""
+        if self._opened:
+            return
+        if callable(self._namespace):
+            self._namespace = self._namespace()
+        if self.db_path:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS detections (key TEXT PRIMARY KEY, namespace TEXT, result TEXT)"
+            )
+            # Entries from another model/threshold can never hit again
+            self._db.execute("DELETE FROM detections WHERE namespace != ?", (self._namespace,))
+            self._db.commit()
+        self._opened = True
+
+    @property
+    def namespace(self) -> str:
+        self.open()
+        return self._namespace
+
+    def key(self, identity: str) -> str:
+        return f"{self.namespace}|{identity}"
+
+    def get(self, identity: str) -> Optional[Dict[str, Any]]:
+        key = self.key(identity)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return json.loads(entry[0])
+
+            if self._db is not None:
+                row = self._db.execute("SELECT result FROM detections WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._counters["disk_hits"] += 1
+                    self._store_in_memory(key, row[0])
+                    return json.loads(row[0])
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, identity: str, result: Dict[str, Any]) -> None:
+        key = self.key(identity)
+        encoded = json.dumps(result)
+        with self._lock:
+            self._store_in_memory(key, encoded)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO detections (key, namespace, result) VALUES (?, ?, ?)",
+                    (key, self.namespace, encoded),
+                )
+                self._db.commit()
+
+    def _store_in_memory(self, key: str, encoded: str) -> None:
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[1]
+        self._entries[key] = (encoded, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._open()
+            counters = dict(self._counters)
+            entries, size = len(self._entries), self._bytes
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        return {
+            "namespace": self.namespace,
+            **counters,
+            "hit_rate": round((lookups - counters["misses"]) / lookups, 4) if lookups else None,
+            "memory_entries": entries,
+            "memory_bytes": size,
+            "max_bytes": self.max_bytes,
+            "disk_tier": self._db is not None,
+        }
+
+
+detection_cache = DetectionCache(
+    namespace=lambda: f"{model_fingerprint()}|conf={CONFIDENCE_THRESHOLD}|{TILING_SIGNATURE}|input={MODEL_INPUT_SIZE}"
+)
+
+
+def lookup_by_url(image_url: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """(identity, cached result) from blob metadata alone; identity is None if metadata is unavailable."""
+    fingerprint = get_blob_fingerprint(image_url)
+    if not fingerprint:
+        return None, None
+    identity = f"blob:{fingerprint}"
+    return identity, detection_cache.get(identity)
+
+
+def lookup_by_bytes(image_data: bytes) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """(identity, cached result) from the content hash of downloaded bytes."""
+    identity = f"sha256:{hashlib.sha256(image_data).hexdigest()}"
+    return identity, detection_cache.get(identity)
+
+
+def _prepare_image_url(image_url: str) -> Optional[Tuple[str, Any, str]]:
+    """Everything before inference for one image, run on the download pool.
+
+    Returns ("result", cached_result, identity) on a cache hit,
+    ("image", decoded_frame, identity) otherwise, or None if the image is unusable.
+    """
+    identity, cached = lookup_by_url(image_url)
+    if cached is not None:
+        return "result", cached, identity
+
+    image_data = download_image_bytes(image_url)
+    if image_data is None:
+        return None
+    if identity is None:
+        identity, cached = lookup_by_bytes(image_data)
+        if cached is not None:
+            return "result", cached, identity
+
+    decoded = decode_for_model(image_data)
+    if decoded is None:
+        return None
+    return "image", decoded, identity
+
+
+async def detect_image_url(image_url: str) -> Optional[Dict[str, Any]]:
+    """Detection result for a Storage image, reusing cached results for unchanged blobs.
+
+    Looks up the blob generation/md5 first so cache hits skip the download
+    entirely; if metadata is unavailable the content hash is used instead.
+    Returns None if the image cannot be downloaded or decoded.
+    """
+    prepared = await downloader.result(image_url, _prepare_image_url)
+    if prepared is None:
+        return None
+    kind, value, identity = prepared
+    if kind == "result":
+        return value
+
+    try:
+        result = scale_detections(await detect_frame(value.image), value.scale)
+    finally:
+        value.release()
+    detection_cache.put(identity, result)
+    return result
@@ -0,0 +1,145 @@
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .metrics import span
+from .tiling import TILED_INFERENCE, TILED_MIN_SIDE
+
+MODEL_INPUT_SIZE = int(os.getenv("MODEL_INPUT_SIZE", "640"))
+FRAME_POOL_PER_SHAPE = int(os.getenv("FRAME_POOL_PER_SHAPE", "32"))
+
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 scale, skipping most of the IDCT work
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+# Start-of-frame markers carrying the image size (all SOFn except DHT, JPG and DAC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from the JPEG header without decoding, or None if not a JPEG."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF or marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2  # Fill byte or standalone marker without a length
+            continue
+        if marker in _SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+class FramePool:
+    """Reusable uint8 frame buffers keyed by shape, so steady-state decoding doesn't allocate."""
+
+    def __init__(self, max_per_shape: int = FRAME_POOL_PER_SHAPE):
+        self.max_per_shape = max_per_shape
+        self._free: Dict[Tuple[int, ...], List[np.ndarray]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self, shape: Tuple[int, ...]) -> np.ndarray:
+        with self._lock:
+            free = self._free.get(shape)
+            if free:
+                self.reused += 1
+                return free.pop()
+            self.allocated += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, frame: np.ndarray) -> None:
+        with self._lock:
+            free = self._free[frame.shape]
+            if len(free) < self.max_per_shape:
+                free.append(frame)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "allocated": self.allocated,
+                "reused": self.reused,
+                "free_buffers": sum(len(f) for f in self._free.values()),
+            }
+
+
+frame_pool = FramePool()
+
+
+class DecodedFrame:
+    """Model-ready frame plus the factor mapping its pixel coordinates back to the original."""
+
+    __slots__ = ("image", "scale", "pooled")
+
+    def __init__(self, image: np.ndarray, scale: float, pooled: bool):
+        self.image = image
+        self.scale = scale
+        self.pooled = pooled
+
+    def release(self) -> None:
+        if self.pooled:
+            frame_pool.release(self.image)
+            self.pooled = False
+
+
+@span("decode", profile=True)
+def decode_for_model(data: bytes, target_size: int = MODEL_INPUT_SIZE) -> Optional[DecodedFrame]:
+    """Decode only as many pixels as detection will use.
+
+    JPEGs are decoded at the largest 1/2, 1/4 or 1/8 scale that still leaves the
+    long side at least target_size, then resized into a pooled buffer whose long
+    side is exactly target_size, so the model's letterbox only pads. Frames that
+    will go through tiled inference are decoded at full resolution.
+    """
+    buffer = np.frombuffer(data, np.uint8)
+    size = jpeg_size(data)
+    if size is None:
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        return DecodedFrame(image, 1.0, False) if image is not None else None
+
+    original_long_side = max(size)
+    if TILED_INFERENCE and original_long_side >= TILED_MIN_SIDE:
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        return DecodedFrame(image, 1.0, False) if image is not None else None
+
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in _REDUCED_FLAGS:
+        if original_long_side // factor >= target_size:
+            flag = reduced_flag
+            break
+    image = cv2.imdecode(buffer, flag)
+    if image is None:
+        return None
+
+    height, width = image.shape[:2]
+    ratio = target_size / max(height, width)
+    if ratio >= 1.0:
+        return DecodedFrame(image, original_long_side / max(height, width), False)
+
+    resized_shape = (max(1, round(height * ratio)), max(1, round(width * ratio)), 3)
+    resized = frame_pool.acquire(resized_shape)
+    cv2.resize(image, (resized_shape[1], resized_shape[0]), dst=resized, interpolation=cv2.INTER_AREA)
+    return DecodedFrame(resized, original_long_side / max(resized_shape[:2]), True)
+
+
+def scale_detections(result: Dict[str, Any], scale: float) -> Dict[str, Any]:
+    """Map a run_detection result from decoded-frame pixels back to original image pixels."""
+    if scale == 1.0 or not result["detections"]:
+        return result
+    return {
+        **result,
+        "detections": [
+            {**detection, "bbox": [coord * scale for coord in detection["bbox"]]}
+            for detection in result["detections"]
+        ]
+    }
@@ -0,0 +1,146 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENT_HISTORY = int(os.getenv("EVENT_HISTORY", "1000"))  # Events kept for Last-Event-ID resume
+CLIENT_BUFFER = int(os.getenv("EVENT_CLIENT_BUFFER", "100"))  # Undelivered events per subscriber
+
+
+def format_fire_event(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Public shape of a fire event, or None if its coordinates are unusable."""
+    coords = event.get("coords", {})
+    lat = coords.get("latitude")
+    lon = coords.get("longitude")
+    if lat is None or lon is None:
+        return None
+    try:
+        lat = float(lat)
+        lon = float(lon)
+    except (TypeError, ValueError):
+        return None
+
+    return {
+        "coords": {
+            "latitude": lat,
+            "longitude": lon
+        },
+        "image_url": event.get("image_url"),
+        "forest_name": event.get("forest_name"),
+        "class": event.get("class"),
+        "confidence": event.get("confidence", 0),
+        "location_id": event.get("location_id")
+    }
+
+
+class _Event:
+    __slots__ = ("id", "forest_id", "frame")
+
+    def __init__(self, event_id: int, event_type: str, forest_id: Optional[str], data: Dict[str, Any]):
+        self.id = event_id
+        self.forest_id = forest_id
+        # Serialized once and shared by every subscriber
+        self.frame = f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+class Subscription:
+    """One client's bounded buffer of pending events on its own event loop.
+
+    If the client falls more than `buffer` events behind, the subscription is
+    marked overflowed rather than silently dropping events; the stream then
+    tells the client to reconnect with Last-Event-ID and replay from history.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, forest_id: Optional[str], buffer: int):
+        self.loop = loop
+        self.forest_id = forest_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+        self.overflowed = False
+
+    def wants(self, event: _Event) -> bool:
+        return self.forest_id is None or event.forest_id == self.forest_id
+
+    def _deliver(self, event: _Event) -> None:
+        # Runs on the subscriber's loop
+        if self.overflowed:
+            return
+        if self.queue.full():
+            self.overflowed = True
+            return
+        self.queue.put_nowait(event)
+
+    @property
+    def exhausted(self) -> bool:
+        """Overflowed and every event delivered before the overflow has been read."""
+        return self.overflowed and self.queue.empty()
+
+    async def next(self, timeout: float) -> Optional[_Event]:
+        """Next event, or None if none arrived within timeout."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    """Fan-out of fire events and alert status changes to push subscribers.
+
+    publish() is thread-safe and may be called from the simulation thread; every
+    subscriber receives each matching event once, on its own event loop.
+    """
+
+    def __init__(self, history: int = EVENT_HISTORY, client_buffer: int = CLIENT_BUFFER):
+        self.client_buffer = client_buffer
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        # Millisecond-based start so ids keep increasing across restarts
+        self._ids = itertools.count(int(time.time() * 1000))
+        self.published = 0
+
+    def publish(self, event_type: str, data: Dict[str, Any], forest_id: Optional[str] = None) -> int:
+        with self._lock:
+            event = _Event(next(self._ids), event_type, forest_id, data)
+            self._history.append(event)
+            subscribers = [s for s in self._subscribers if s.wants(event)]
+            self.published += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber._deliver, event)
+            except RuntimeError:
+                # Subscriber's loop is closed; it will be removed when its stream ends
+                pass
+        return event.id
+
+    def subscribe(self, last_event_id: Optional[int] = None, forest_id: Optional[str] = None) -> Subscription:
+        """Register the caller's loop; events after last_event_id still in history are replayed first."""
+        subscription = Subscription(asyncio.get_running_loop(), forest_id, self.client_buffer)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history:
+                    if event.id > last_event_id and subscription.wants(event):
+                        subscription._deliver(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "history": len(self._history),
+            }
+
+
+broker = EventBroker()
@@ -0,0 +1,36 @@
+"""Convert model/best.pt for one of the optimized inference backends.
+
+Usage (from the AIServer directory):
+    python -m app.export --backend onnxruntime [--int8] [--verify]
+"""
+import argparse
+import logging
+
+from .backends import BACKENDS, TorchBackend, check_equivalence, get_backend
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", required=True, choices=sorted(BACKENDS))
+    parser.add_argument("--int8", action="store_true", help="Also apply INT8 quantization")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--verify", action="store_true", help="Compare the exported model with best.pt")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    backend = get_backend(args.backend)
+    path = backend.export(int8=args.int8, imgsz=args.imgsz)
+    print(f"✅ Exported {backend.name} model to {path}")
+
+    if args.verify:
+        problems = check_equivalence(backend.load(args.int8), TorchBackend().load())
+        if problems:
+            print("❌ Output differs from best.pt:")
+            for problem in problems:
+                print(f"   - {problem}")
+            raise SystemExit(1)
+        print("✅ Output matches best.pt")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,128 @@
-from ultralytics import YOLO
+import logging
 import numpy as np
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Sequence, Union
+from .backends import load_model, CONFIDENCE_THRESHOLD
+from .metrics import observe, span
 
-# Load the model once
-model = YOLO("model/best.pt")
-def run_detection(image: np.ndarray) -> Dict[str, Any]:
-    """Run detection on an image array using YOLO and return parsed results."""
+logger = logging.getLogger(__name__)
+
+# Load the model once, using the engine selected by INFERENCE_BACKEND
+model = load_model()
+
+DEFAULT_BATCH_SIZE = 8  # Frames per forward pass in run_detection_batch
+
+# Only "fire" and "smoke" are reported; resolve their class ids once instead of per box
+TARGET_CLASSES = ("fire", "smoke")
+CLASS_NAMES: Dict[int, str] = dict(model.names)
+TARGET_CLASS_IDS = np.array(
+    [cls_id for cls_id, name in model.names.items() if name.lower() in TARGET_CLASSES], dtype=np.int64
+)
+
+# Compact per-image output for internal callers that don't need JSON dicts
+DETECTION_DTYPE = np.dtype([
+    ("class_id", np.int16),
+    ("confidence", np.float32),
+    ("bbox", np.float32, (4,)),
+])
+
+
+def _validate_image(image) -> None:
     if image is None or not isinstance(image, np.ndarray):
         raise ValueError(" Invalid image provided for detection.")
 
-    print("🔍 Running YOLO detection...")
-    
-    results = model.predict(image, conf=0.6)
-    
-    detections: List[Dict[str, Any]] = []
-    status = "nothing detected"
 
+def _predict(images, **kwargs):
+    # classes= makes the model's NMS drop everything but fire/smoke up front
+    with span("inference", profile=True):
+        results = model.predict(images, conf=CONFIDENCE_THRESHOLD, classes=TARGET_CLASS_IDS.tolist(), **kwargs)
     for r in results:
-        for box in r.boxes:
-            cls_id = int(box.cls[0])
-            conf = round(float(box.conf[0]), 2)
-            bbox = list(map(float, box.xyxy[0].tolist()))
-            class_name = model.names[cls_id]
-
-            # Only include detections for "fire" or "smoke"
-            if class_name.lower() in ["fire", "smoke"]:
-                detections.append({
-                    "class": class_name,
-                    "confidence": conf,
-                    "bbox": bbox
-                })
-                status = f"{class_name} detected"
-
-    print(f"✅ Detection complete. Status: {status}, Total detections: {len(detections)}")
-
-    # If no detections for fire/smoke, ensure we return a status of "nothing detected"
+        # ultralytics times each image's pre-processing, forward pass and NMS (in ms)
+        speed = getattr(r, "speed", None) or {}
+        for phase, name in (("preprocess", "model_preprocess"), ("inference", "model_forward"), ("postprocess", "model_postprocess")):
+            if speed.get(phase) is not None:
+                observe(name, speed[phase] / 1000.0)
+    return results
+
+
+def _result_to_array(r) -> np.ndarray:
+    """Convert one YOLO result into a DETECTION_DTYPE array with whole-tensor transfers."""
+    boxes = r.boxes
+    if len(boxes) == 0:
+        return np.empty(0, dtype=DETECTION_DTYPE)
+
+    cls_ids = boxes.cls.cpu().numpy().astype(np.int64)
+    keep = np.isin(cls_ids, TARGET_CLASS_IDS)
+    out = np.empty(int(keep.sum()), dtype=DETECTION_DTYPE)
+    out["class_id"] = cls_ids[keep]
+    out["confidence"] = boxes.conf.cpu().numpy()[keep]
+    out["bbox"] = boxes.xyxy.cpu().numpy()[keep]
+    return out
+
+
+def detections_to_dict(detections: np.ndarray) -> Dict[str, Any]:
+    """Convert a DETECTION_DTYPE array into the {"status", "detections"} dict returned to callers."""
     if len(detections) == 0:
-        status = "nothing detected"
+        return {"status": "nothing detected", "detections": []}
 
+    class_names = [CLASS_NAMES[cls_id] for cls_id in detections["class_id"].tolist()]
+    confidences = detections["confidence"].astype(np.float64).tolist()
+    bboxes = detections["bbox"].astype(np.float64).tolist()
+    parsed = [
+        {"class": name, "confidence": round(conf, 2), "bbox": bbox}
+        for name, conf, bbox in zip(class_names, confidences, bboxes)
+    ]
     return {
-        "status": status,
-        "detections": detections
+        # Status reflects the last reported box, as before
+        "status": f"{class_names[-1]} detected",
+        "detections": parsed
     }
+
+
+def run_detection(image: np.ndarray, as_array: bool = False) -> Union[Dict[str, Any], np.ndarray]:
+    """Run detection on an image array using YOLO and return parsed results.
+
+    With as_array=True the raw DETECTION_DTYPE array is returned instead of the dict.
+    """
+    _validate_image(image)
+
+    results = _predict(image)
+    with span("result_parse"):
+        detections = np.concatenate([_result_to_array(r) for r in results]) if results else np.empty(0, DETECTION_DTYPE)
+        if as_array:
+            return detections
+        parsed = detections_to_dict(detections)
+    logger.debug("Detection complete: status=%s detections=%d", parsed["status"], len(detections))
+    return parsed
+
+
+def run_detection_batch(
+    images: Sequence[np.ndarray],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    as_array: bool = False,
+) -> List[Union[Dict[str, Any], np.ndarray]]:
+    """Run detection on several frames, batch_size frames per forward pass.
+
+    Returns one result per input image, in input order: the run_detection dict,
+    or a DETECTION_DTYPE array with as_array=True.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1.")
+    for image in images:
+        _validate_image(image)
+
+    arrays: List[np.ndarray] = []
+    for start in range(0, len(images), batch_size):
+        # ultralytics letterboxes every frame of the list to the same input size
+        # and stacks them into a single tensor, so each chunk is one forward pass.
+        chunk = list(images[start:start + batch_size])
+        results = _predict(chunk, batch=len(chunk))
+        with span("result_parse"):
+            arrays.extend(_result_to_array(r) for r in results)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        detected = sum(1 for a in arrays if len(a))
+        logger.debug("Batched detection complete: images=%d batch_size=%d with_detections=%d", len(arrays), batch_size, detected)
+    if as_array:
+        return arrays
+    with span("result_parse"):
+        return [detections_to_dict(a) for a in arrays]
@@ -0,0 +1,160 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()  # app.main imports this module first, so this marks the start of the cold start
+
+import asyncio
+import gc
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from .metrics import GaugeCallback, registry
+
+logger = logging.getLogger(__name__)
+
+WARMUP_INFERENCE = os.getenv("WARMUP_INFERENCE", "1") == "1"  # Run one dummy frame through every model copy at startup
+WAIT_FOR_READY = os.getenv("WAIT_FOR_READY", "0") == "1"  # Block startup until warm instead of initializing in the background
+WARMUP_SIZE = 640
+
+# Components that must be up before /readyz reports ready; Twilio is optional
+REQUIRED_COMPONENTS = ("firebase", "model")
+
+state: Dict[str, Any] = {
+    "phase": "starting",  # starting -> initializing -> ready | degraded
+    "components": {},
+    "import_seconds": None,
+    "cold_start_seconds": None,
+}
+_lock = threading.Lock()
+
+
+def _set_component(name: str, **fields) -> None:
+    with _lock:
+        state["components"].setdefault(name, {}).update(fields)
+
+
+def _init_firebase() -> None:
+    from firebase.config import get_async_db, get_bucket, get_db
+    get_db()
+    get_bucket()
+    get_async_db()
+
+
+def _init_model() -> None:
+    from .scheduler import scheduler, worker_pool
+    if worker_pool is not None:
+        # Each process loads (and warms up) its own copy before reporting ready; wait for all of them
+        worker_pool.start(warmup_size=WARMUP_SIZE if WARMUP_INFERENCE else 0)
+        worker_pool.wait_ready()
+    elif WARMUP_INFERENCE:
+        scheduler.submit(np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8)).result()
+    else:
+        from . import inference  # noqa: F401  (loads the weights without a forward pass)
+
+
+def _init_caches() -> None:
+    # Opened here rather than at import so a preloading master never holds the SQLite file across fork
+    from firebase.downloader import downloader
+    from .cache import detection_cache
+    detection_cache.open()
+    if downloader.cache is not None:
+        downloader.cache.open()
+
+
+def _init_twilio() -> bool:
+    from .alerts import SMS_PROVIDER, get_twilio_client, twilio_configured
+    if SMS_PROVIDER == "fake" or not twilio_configured:
+        return False
+    get_twilio_client()
+    return True
+
+
+# Each returns False when the component is not configured here
+COMPONENTS: Dict[str, Callable[[], Optional[bool]]] = {
+    "firebase": _init_firebase,
+    "model": _init_model,
+    "caches": _init_caches,
+    "twilio": _init_twilio,
+}
+
+
+async def _initialize_component(name: str, init: Callable[[], Optional[bool]]) -> None:
+    _set_component(name, status="initializing")
+    start = time.perf_counter()
+    try:
+        configured = await asyncio.to_thread(init)
+    except Exception as e:
+        logger.error("Startup: %s failed: %s", name, e, exc_info=True)
+        _set_component(name, status="failed", seconds=round(time.perf_counter() - start, 3), error=str(e))
+        return
+    if configured is False:
+        _set_component(name, status="skipped")
+        return
+    seconds = time.perf_counter() - start
+    logger.info("Startup: %s ready in %.2fs", name, seconds)
+    _set_component(name, status="ready", seconds=round(seconds, 3), error=None)
+
+
+async def initialize() -> None:
+    """Bring up Firebase, the model, the caches and Twilio in parallel and record how long each took."""
+    with _lock:
+        state["phase"] = "initializing"
+    await asyncio.gather(*(_initialize_component(name, init) for name, init in COMPONENTS.items()))
+
+    cold_start = time.perf_counter() - IMPORT_STARTED
+    with _lock:
+        ok = all(state["components"].get(name, {}).get("status") == "ready" for name in REQUIRED_COMPONENTS)
+        state["phase"] = "ready" if ok else "degraded"
+        state["cold_start_seconds"] = round(cold_start, 3)
+    freeze_heap()
+    logger.info("Cold start finished in %.2fs (%s)", cold_start, state["phase"])
+
+
+def freeze_heap() -> None:
+    """Move every object allocated so far out of the collector's reach.
+
+    Modules, clients and weights from startup live as long as the process.
+    Frozen, they are no longer rescanned by each full collection (tens of ms
+    per pass otherwise), and a preloading master's pages stay shared after fork.
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def mark_imported() -> None:
+    with _lock:
+        state["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
+
+def is_ready() -> bool:
+    with _lock:
+        return state["phase"] == "ready"
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        return {**state, "components": {name: dict(c) for name, c in state["components"].items()}}
+
+
+def preload() -> None:
+    """Import the model in the master before gunicorn forks, so workers share its pages copy-on-write.
+
+    Skipped with INFERENCE_WORKERS > 0: the model then lives in spawned processes.
+    """
+    from .workers import INFERENCE_WORKERS
+    if INFERENCE_WORKERS > 0:
+        return
+    start = time.perf_counter()
+    from . import inference  # noqa: F401
+    logger.info("Preloaded the model in %.2fs", time.perf_counter() - start)
+
+
+registry.register(GaugeCallback(
+    "foresteye_startup_seconds", "Import time and time until every startup component finished.",
+    lambda: {(phase,): state[key] for phase, key in (("import", "import_seconds"), ("cold_start", "cold_start_seconds"))
+             if state[key] is not None},
+    ["phase"],
+))
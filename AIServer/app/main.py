@@ -1,13 +1,55 @@
-from fastapi import FastAPI, BackgroundTasks
+from . import lifecycle  # First, so the cold-start clock includes every other import
+from fastapi import FastAPI, BackgroundTasks, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 import asyncio
-from .simulation import start_simulation, stop_simulation, simulation_state
-from .alerts import router as alerts_router
+import logging
+import os
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from .logs import configure_logging
+from .metrics import profiler, registry
+from .simulation import fire_events, is_running, start_simulation, stop_simulation, simulation_stats
+from .alerts import router as alerts_router, sms_dispatcher
+from .events import broker
+from .scheduler import SchedulerBusy, scheduler, worker_pool
+from .cache import detect_image_url, detection_cache
 
-app = FastAPI()
+from firebase.writer import alert_writer
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_URLS = int(os.getenv("MAX_BATCH_URLS", "64"))  # Images per /detect/batch request
+SHUTDOWN_TIMEOUT = 10.0  # Seconds to drain queued Firestore writes, pending SMS and in-flight batches on shutdown
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lifecycle.mark_imported()
+    if lifecycle.WAIT_FOR_READY:
+        await lifecycle.initialize()
+        init_task = None
+    else:
+        # Serve /healthz right away; /readyz turns 200 once the clients and model are warm
+        init_task = asyncio.create_task(lifecycle.initialize())
+    yield
+    if init_task is not None and not init_task.done():
+        init_task.cancel()
+    await asyncio.to_thread(stop_simulation)
+    await asyncio.to_thread(alert_writer.close, SHUTDOWN_TIMEOUT)
+    if sms_dispatcher is not None:
+        await asyncio.to_thread(sms_dispatcher.close, SHUTDOWN_TIMEOUT)
+    await asyncio.to_thread(scheduler.stop, SHUTDOWN_TIMEOUT)
+    if worker_pool is not None:
+        await asyncio.to_thread(worker_pool.close)
+
+app = FastAPI(lifespan=lifespan)
 executor = ThreadPoolExecutor(max_workers=1)  # Single worker for simulation
 
+STREAM_HEARTBEAT_SECONDS = 15  # Comment frames keep idle SSE connections open through proxies
+
 # Allow all CORS for development
 app.add_middleware(
     CORSMiddleware,
@@ -15,55 +57,146 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+@app.exception_handler(SchedulerBusy)
+async def scheduler_busy_handler(request: Request, exc: SchedulerBusy):
+    # Overloaded, not broken: tell clients to back off and retry
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving, warm or not."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz(response: Response):
+    """Readiness: 200 once Firebase and the model are initialized, 503 with per-component status before."""
+    if not lifecycle.is_ready():
+        response.status_code = 503
+    return lifecycle.snapshot()
+
 @app.post("/start-simulation")
 async def start_simulation_endpoint():
-    print("📡 /start-simulation called")
-    if not simulation_state["running"]:
+    if not is_running():
         # Run in separate thread to avoid blocking
         loop = asyncio.get_event_loop()
         await loop.run_in_executor(executor, start_simulation)
-        print("🟢 Simulation started in background")
+        logger.info("Simulation started in background")
         return {"status": "started"}
-    print("⚠️ Simulation already running")
+    logger.info("Simulation already running")
     return {"status": "already running"}
 
 @app.post("/stop-simulation")
 def stop_simulation_endpoint():
-    print("🛑 /stop-simulation called — stopping simulation")
     stop_simulation()
     return {"status": "stopped"}
 
+@app.get("/simulation/stats")
+def get_simulation_stats():
+    return simulation_stats()
+
 @app.get("/fire-events")
-def get_current_detections():
-    print("📍 /fire-events called — returning current detections")
-    fire_events = simulation_state.get("fire_events", [])
-    formatted_events = []
-    for event in fire_events:
-        coords = event.get("coords", {})
-        lat = coords.get("latitude")
-        lon = coords.get("longitude")
-        if lat is None or lon is None:
-            continue
+def get_current_detections(request: Request):
+    # Immutable snapshot, serialized once per change by the store; no lock and no copy here
+    snapshot = fire_events.snapshot
+    headers = {"ETag": snapshot.etag}
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@app.get("/fire-events/stream")
+async def stream_fire_events(
+    request: Request,
+    forest_id: Optional[str] = Query(None, description="Only events for this forest location"),
+    last_event_id: Optional[int] = Query(None, description="Resume after this event id (or send Last-Event-ID)")
+):
+    """Server-Sent Events feed of new fire events and alert status changes."""
+    header_id = request.headers.get("last-event-id")
+    if last_event_id is None and header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+    subscription = broker.subscribe(last_event_id=last_event_id, forest_id=forest_id)
+
+    async def event_frames():
         try:
-            lat = float(lat)
-            lon = float(lon)
-        except ValueError:
-            continue
-
-        formatted_events.append({
-            "coords": {
-                "latitude": lat,
-                "longitude": lon
-            },
-            "image_url": event.get("image_url"),
-            "forest_name": event.get("forest_name"),
-            "class": event.get("class"),
-            "confidence": event.get("confidence", 0),
-            "location_id": event.get("location_id")  
-        })
-    return formatted_events
+            while not await request.is_disconnected():
+                if subscription.exhausted:
+                    # Client fell too far behind: have it reconnect and replay from its Last-Event-ID
+                    yield b"event: reset\ndata: {}\n\n"
+                    return
+                event = await subscription.next(timeout=STREAM_HEARTBEAT_SECONDS)
+                yield event.frame if event is not None else b": keep-alive\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/fire-events/stream/stats")
+def stream_stats():
+    return broker.stats()
+
+class BatchDetectionRequest(BaseModel):
+    image_urls: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_URLS)
+
+async def _detect_batch(image_urls):
+    # Uncached frames join the shared scheduler queue, so they are batched together
+    # with any other in-flight detections instead of competing for the model.
+    results = await asyncio.gather(*(detect_image_url(url) for url in image_urls))
+
+    # Keep one entry per requested URL, in request order
+    response = []
+    for url, result in zip(image_urls, results):
+        if result is None:
+            response.append({"image_url": url, "status": "image unavailable", "detections": []})
+        else:
+            response.append({"image_url": url, **result})
+    return response
+
+@app.post("/detect/batch")
+async def detect_batch_endpoint(request: BatchDetectionRequest):
+    logger.debug("Batch detection requested: images=%d", len(request.image_urls))
+    return await _detect_batch(request.image_urls)
+
+@app.get("/detect/stats")
+def detection_stats():
+    return scheduler.stats()
+
+@app.get("/detect/cache/stats")
+def detection_cache_stats():
+    return detection_cache.stats()
 
 # Include alert routes with prefix
-app.include_router(alerts_router, prefix="/alerts", tags=["alerts"])
\ No newline at end of file
+app.include_router(alerts_router, prefix="/alerts", tags=["alerts"])
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+def get_profile(
+    span: Optional[str] = Query(None, description="Only this span"),
+    limit: int = Query(30, ge=1, le=500),
+    sort: str = Query("cumulative", description="pstats sort key, e.g. cumulative or tottime"),
+):
+    """Aggregated cProfile output of the sampled spans."""
+    return profiler.report(span, limit, sort)
+
+@app.post("/debug/profile")
+def set_profile_rate(rate: float = Query(..., ge=0.0, le=1.0, description="Share of profiled spans to sample; 0 turns it off")):
+    """Start, retune or stop sampled profiling at runtime."""
+    profiler.sample_rate = rate
+    return {"sample_rate": rate}
+
+@app.delete("/debug/profile")
+def reset_profile():
+    profiler.reset()
+    return {"status": "reset"}
+
+
+lifecycle.freeze_heap()  # Everything above lives as long as the process
@@ -0,0 +1,257 @@
+import bisect
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Share of profiled spans run under cProfile
+
+# Seconds; spans range from sub-millisecond decodes to multi-second Firestore stalls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_text(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(_escape(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts with a final +Inf slot, sum, count)
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(_escape(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(counts), total, count) for key, (counts, total, count) in sorted(self._series.items())]
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {count}")
+        return lines
+
+
+class GaugeCallback:
+    """Gauge read from existing stats at scrape time, e.g. a queue depth."""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], Dict[Tuple[str, ...], float]], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.read()
+        except Exception:
+            return lines  # A broken stats source must not take down the scrape
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, tuple(_escape(v) for v in key))} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+SPAN_SECONDS = registry.register(Histogram(
+    "foresteye_span_seconds", "Wall time of instrumented stages and remote calls.", ["span"]
+))
+SPAN_ERRORS = registry.register(Counter(
+    "foresteye_span_errors_total", "Instrumented stages that raised.", ["span"]
+))
+FRAMES = registry.register(Counter(
+    "foresteye_frames_total", "Frames through the detection pipeline by outcome.", ["outcome"]
+))
+ALERTS = registry.register(Counter(
+    "foresteye_alerts_total", "Alerts written by the simulation.", ["kind"]
+))
+SMS = registry.register(Counter(
+    "foresteye_sms_total", "SMS send attempts by result.", ["result"]
+))
+
+
+class SpanProfiler:
+    """Aggregated cProfile stats of a random sample of profiled spans, per span name."""
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._samples: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._active = threading.local()  # Only one cProfile may run per thread
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and not getattr(self._active, "on", False) and random.random() < self.sample_rate
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        profiler = cProfile.Profile()
+        self._active.on = True
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._active.on = False
+            with self._lock:
+                if name in self._stats:
+                    self._stats[name].add(profiler)
+                else:
+                    self._stats[name] = pstats.Stats(profiler)
+                self._samples[name] = self._samples.get(name, 0) + 1
+
+    def report(self, name: Optional[str] = None, limit: int = 30, sort: str = "cumulative") -> str:
+        with self._lock:
+            names = [name] if name else sorted(self._stats)
+            parts = []
+            for span_name in names:
+                stats = self._stats.get(span_name)
+                if stats is None:
+                    continue
+                out = io.StringIO()
+                stats.stream = out
+                stats.sort_stats(sort).print_stats(limit)
+                parts.append(f"=== {span_name}: {self._samples[span_name]} samples ===\n{out.getvalue()}")
+        return "\n".join(parts) or "No profiled spans yet. Set PROFILE_SAMPLE_RATE above 0.\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._samples.clear()
+
+
+profiler = SpanProfiler()
+
+# (span, seconds, failed) of every span in this process, when kept for another one to record
+_span_log: Optional[List[Tuple[str, float, bool]]] = None
+
+
+def keep_spans() -> None:
+    """Also log spans for drain_spans(); inference workers ship them to the API process's /metrics."""
+    global _span_log
+    if _span_log is None:
+        _span_log = []
+
+
+def drain_spans() -> List[Tuple[str, float, bool]]:
+    """Spans logged since the last call, oldest first."""
+    global _span_log
+    if _span_log is None:
+        return []
+    spans, _span_log = _span_log, []
+    return spans
+
+
+def record_spans(spans: Sequence[Tuple[str, float, bool]]) -> None:
+    """Record spans measured in another process as if they had run here."""
+    for name, seconds, failed in spans:
+        if failed:
+            SPAN_ERRORS.inc(span=name)
+        SPAN_SECONDS.observe(seconds, span=name)
+
+
+@contextmanager
+def span(name: str, profile: bool = False) -> Iterator[None]:
+    """Time a block into foresteye_span_seconds{span=name}.
+
+    With profile=True a PROFILE_SAMPLE_RATE share of the calls also runs under
+    cProfile; only use it around synchronous code, since an awaited block would
+    profile whatever else the event loop runs meanwhile.
+    """
+    sampled = profile and profiler.should_sample()
+    start = time.perf_counter()
+    failed = False
+    try:
+        if sampled:
+            with profiler.profile(name):
+                yield
+        else:
+            yield
+    except BaseException:
+        failed = True
+        SPAN_ERRORS.inc(span=name)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        SPAN_SECONDS.observe(seconds, span=name)
+        if _span_log is not None:
+            _span_log.append((name, seconds, failed))
+
+
+def observe(name: str, seconds: float) -> None:
+    """Record a duration measured elsewhere (e.g. the model's own timings) as a span."""
+    SPAN_SECONDS.observe(seconds, span=name)
+    if _span_log is not None:
+        _span_log.append((name, seconds, False))
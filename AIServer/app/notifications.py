@@ -0,0 +1,297 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import SMS, span
+
+logger = logging.getLogger(__name__)
+
+SMS_COALESCE_WINDOW = float(os.getenv("SMS_COALESCE_WINDOW", "5"))  # Seconds to gather alerts per recipient
+SMS_RATE_PER_SECOND = float(os.getenv("SMS_RATE_PER_SECOND", "1"))
+SMS_BURST = int(os.getenv("SMS_BURST", "5"))
+SMS_MAX_RETRIES = int(os.getenv("SMS_MAX_RETRIES", "4"))
+SMS_MAX_WORKERS = int(os.getenv("SMS_MAX_WORKERS", "4"))
+SMS_JOB_HISTORY = 10000  # Job records kept for status lookups
+MAX_SMS_LENGTH = 1600  # Twilio's limit for a single message body
+
+
+class TwilioSMSProvider:
+    def __init__(self, get_client: Callable[[], Any], from_number: str):
+        self.get_client = get_client  # Called per send; the client itself is built lazily
+        self.from_number = from_number
+
+    def send(self, to: str, body: str) -> str:
+        return self.get_client().messages.create(body=body, from_=self.from_number, to=to).sid
+
+
+class FakeSMSProvider:
+    """Local provider that records messages; delay and failure_rate emulate a flaky gateway."""
+
+    def __init__(self, delay: float = 0.0, failure_rate: float = 0.0):
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.sent: List[Dict[str, str]] = []
+        self._lock = threading.Lock()
+
+    def send(self, to: str, body: str) -> str:
+        time.sleep(self.delay)
+        if random.random() < self.failure_rate:
+            raise ConnectionError("Fake SMS provider failure")
+        with self._lock:
+            sid = f"FAKE{len(self.sent):08d}"
+            self.sent.append({"sid": sid, "to": to, "body": body})
+        return sid
+
+
+class TokenBucket:
+    """Allows `rate` sends per second on average with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self) -> None:
+        self._tokens -= 1
+
+
+class _Batch:
+    """Jobs for one recipient that will go out as a single message."""
+
+    def __init__(self, recipient: str, due: float):
+        self.recipient = recipient
+        self.due = due
+        self.jobs: List[Dict[str, Any]] = []
+        self.attempts = 0
+        self.open = True  # Still accepting more jobs
+
+
+class SMSDispatcher:
+    """Outbound SMS queue: coalescing per recipient, token-bucket rate limit, retries.
+
+    submit() only records the job and returns its id. Jobs for the same recipient
+    arriving within coalesce_window seconds are merged into one message, or into
+    several if they don't fit in MAX_SMS_LENGTH. Sends
+    run on a bounded pool; failures are retried with exponential backoff up to
+    max_retries, and every job records its delivery status. close() sends every
+    pending batch right away (still rate-limited) and waits for them.
+    """
+
+    def __init__(
+        self,
+        provider,
+        coalesce_window: float = SMS_COALESCE_WINDOW,
+        rate_per_second: float = SMS_RATE_PER_SECOND,
+        burst: int = SMS_BURST,
+        max_retries: int = SMS_MAX_RETRIES,
+        max_workers: int = SMS_MAX_WORKERS,
+    ):
+        self.provider = provider
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(rate_per_second, burst)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sms")
+        self._slots = threading.Semaphore(max_workers)
+
+        self._lock = threading.Condition()
+        self._open_batches: Dict[str, _Batch] = {}
+        self._schedule: List = []  # heap of (due, seq, batch)
+        self._seq = itertools.count()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        self._in_flight = 0  # Batches handed to the pool and not finished yet
+        self._closed = False  # No new jobs; pending batches are due now
+        self._stopped = False  # Dispatcher thread exits
+        self._counters = {"submitted": 0, "messages_sent": 0, "jobs_sent": 0, "retries": 0, "jobs_failed": 0}
+
+    def submit(self, recipient: str, text: str, alert_id: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "alert_id": alert_id,
+            "recipient": recipient,
+            "text": text,
+            "status": "queued",
+            "attempts": 0,
+            "message_sid": None,
+            "error": None,
+            "created_at": time.time(),
+            "sent_at": None,
+        }
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("SMSDispatcher is closed.")
+            self._ensure_started()
+            self._jobs[job_id] = job
+            while len(self._jobs) > SMS_JOB_HISTORY:
+                self._jobs.popitem(last=False)
+            self._counters["submitted"] += 1
+
+            batch = self._open_batches.get(recipient)
+            if batch is None:
+                batch = _Batch(recipient, time.monotonic() + self.coalesce_window)
+                self._open_batches[recipient] = batch
+                heapq.heappush(self._schedule, (batch.due, next(self._seq), batch))
+                self._lock.notify()
+            batch.jobs.append(job)
+        return job_id
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sms-dispatcher", daemon=True)
+            self._thread.start()
+
+    @staticmethod
+    def _compose(jobs: List[Dict[str, Any]]) -> str:
+        if len(jobs) == 1:
+            return jobs[0]["text"]
+        return f"🚨 {len(jobs)} FIRE ALERTS:\n" + "\n".join(f"- {job['text']}" for job in jobs)
+
+    def _split(self, batch: _Batch) -> None:
+        """Keep as many jobs as fit in one message and schedule the rest as a batch of its own. Caller holds the lock."""
+        count = len(batch.jobs)
+        while count > 1 and len(self._compose(batch.jobs[:count])) > MAX_SMS_LENGTH:
+            count -= 1
+        if count == len(batch.jobs):
+            return
+        rest = _Batch(batch.recipient, time.monotonic())
+        rest.open = False
+        rest.jobs = batch.jobs[count:]
+        del batch.jobs[count:]
+        heapq.heappush(self._schedule, (rest.due, next(self._seq), rest))
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                # Once closed, every scheduled batch (coalescing or backing off) is due now
+                while not self._stopped and (
+                    not self._schedule or (not self._closed and self._schedule[0][0] > time.monotonic())
+                ):
+                    timeout = self._schedule[0][0] - time.monotonic() if self._schedule and not self._closed else None
+                    self._lock.wait(timeout)
+                if self._stopped:
+                    return
+                _, _, batch = heapq.heappop(self._schedule)
+                if batch.open:
+                    # From here on, new jobs for this recipient start a new batch
+                    batch.open = False
+                    self._open_batches.pop(batch.recipient, None)
+                    self._split(batch)
+                for job in batch.jobs:
+                    job["status"] = "sending"
+
+            wait = self._bucket.wait_time()
+            while wait > 0:
+                time.sleep(wait)
+                wait = self._bucket.wait_time()
+            self._bucket.take()
+            self._slots.acquire()  # Don't queue more sends than there are workers
+            with self._lock:
+                self._in_flight += 1
+            try:
+                self._pool.submit(self._send, batch)
+            except Exception as e:
+                # e.g. the pool is shut down at interpreter exit: fail the batch, keep the permit and the thread
+                self._finish()
+                self._abandon([batch], e)
+
+    def _finish(self) -> None:
+        self._slots.release()
+        with self._lock:
+            self._in_flight -= 1
+            self._lock.notify_all()
+
+    def _abandon(self, batches: List[_Batch], error: Exception) -> None:
+        with self._lock:
+            jobs = [job for batch in batches for job in batch.jobs]
+            for job in jobs:
+                job.update(status="failed", error=str(error))
+            self._counters["jobs_failed"] += len(jobs)
+        if jobs:
+            logger.error(f"{len(jobs)} SMS job(s) not sent: {error}")
+
+    def _send(self, batch: _Batch) -> None:
+        try:
+            batch.attempts += 1
+            try:
+                with span("sms_send"):
+                    sid = self.provider.send(batch.recipient, self._compose(batch.jobs))
+            except Exception as e:
+                SMS.inc(result="failed")
+                self._on_failure(batch, e)
+                return
+            SMS.inc(result="sent")
+            with self._lock:
+                now = time.time()
+                for job in batch.jobs:
+                    job.update(status="sent", attempts=batch.attempts, message_sid=sid, sent_at=now,
+                               coalesced=len(batch.jobs))
+                self._counters["messages_sent"] += 1
+                self._counters["jobs_sent"] += len(batch.jobs)
+            logger.info(f"SMS sent to {batch.recipient} for {len(batch.jobs)} alert(s), SID: {sid}")
+        finally:
+            self._finish()
+
+    def _on_failure(self, batch: _Batch, error: Exception) -> None:
+        with self._lock:
+            for job in batch.jobs:
+                job.update(attempts=batch.attempts, error=str(error))
+            if batch.attempts > self.max_retries or self._stopped:
+                for job in batch.jobs:
+                    job["status"] = "failed"
+                self._counters["jobs_failed"] += len(batch.jobs)
+                logger.error(f"SMS to {batch.recipient} failed after {batch.attempts} attempts: {error}")
+                return
+            delay = min(60.0, 2 ** batch.attempts) * (0.5 + random.random())
+            for job in batch.jobs:
+                job["status"] = "retrying"
+            self._counters["retries"] += 1
+            heapq.heappush(self._schedule, (time.monotonic() + delay, next(self._seq), batch))
+            self._lock.notify()
+        logger.warning(f"SMS to {batch.recipient} failed ({error}); retry {batch.attempts}/{self.max_retries} in {delay:.1f}s")
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop taking jobs, send every pending batch now and wait up to timeout for them to finish."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+            while self._thread is not None and (self._schedule or self._in_flight):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+            self._stopped = True
+            unsent = [batch for _, _, batch in self._schedule]
+            self._schedule.clear()
+            self._open_batches.clear()
+            self._lock.notify_all()
+        self._abandon(unsent, RuntimeError("SMS dispatcher closed before sending"))
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "scheduled_batches": len(self._schedule), "in_flight_batches": self._in_flight}
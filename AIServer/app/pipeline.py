@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from .metrics import observe
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Stage:
+    """One step of a Pipeline: `concurrency` workers applying an async fn to items.
+
+    fn returns the item to pass downstream, or None to drop it.
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], Awaitable[Any]], concurrency: int = 1, queue_size: int = 32):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        self.name = name
+        self.fn = fn
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.input: Optional[asyncio.Queue] = None
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+    def stats(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "queue_depth": self.input.qsize() if self.input is not None else 0,
+            "queue_size": self.queue_size,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "throughput_per_s": round(self.processed / elapsed, 3) if elapsed > 0 else 0.0,
+            "avg_latency_ms": round(self.busy_seconds / self.processed * 1000, 2) if self.processed else None,
+        }
+
+
+class Pipeline:
+    """Source -> stages chain connected by bounded asyncio queues.
+
+    A full queue blocks the stage feeding it, so a slow stage throttles
+    everything upstream instead of buffering without limit. stop() may be called
+    from any thread: the source stops producing and the items already in flight
+    drain through every stage before run() returns. on_exit, if given, is called
+    with every item once it leaves the pipeline: dropped, failed or finished.
+    """
+
+    def __init__(self, source: Callable[[], AsyncIterator[Any]], stages: List[Stage],
+                 on_exit: Optional[Callable[[Any], None]] = None):
+        self.source = source
+        self.stages = stages
+        self.on_exit = on_exit
+        self.emitted = 0
+        self._stopping = threading.Event()
+        self._started_at: Optional[float] = None
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    async def _run_source(self, output: asyncio.Queue) -> None:
+        try:
+            async for item in self.source():
+                if self.stopping:
+                    self._exit(item)
+                    break
+                await output.put(item)
+                self.emitted += 1
+        finally:
+            await output.put(_DONE)
+
+    def _exit(self, item: Any) -> None:
+        if self.on_exit is not None:
+            try:
+                self.on_exit(item)
+            except Exception as e:
+                logger.error(f"Pipeline exit hook failed: {e}", exc_info=True)
+
+    async def _run_worker(self, stage: Stage, output: Optional[asyncio.Queue], remaining: List[int]) -> None:
+        while True:
+            item = await stage.input.get()
+            if item is _DONE:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    await stage.input.put(_DONE)  # Let sibling workers see it too
+                elif output is not None:
+                    await output.put(_DONE)
+                return
+
+            started = time.monotonic()
+            try:
+                result = await stage.fn(item)
+            except Exception as e:
+                stage.errors += 1
+                logger.error(f"Pipeline stage {stage.name} failed: {e}", exc_info=True)
+                self._exit(item)
+                continue
+            finally:
+                busy = time.monotonic() - started
+                stage.busy_seconds += busy
+                observe(f"pipeline.{stage.name}", busy)
+
+            if result is None:
+                stage.dropped += 1
+                self._exit(item)
+                continue
+            stage.processed += 1
+            if output is not None:
+                await output.put(result)
+            else:
+                self._exit(result)
+
+    async def run(self) -> None:
+        self._started_at = time.monotonic()
+        for stage in self.stages:
+            stage.input = asyncio.Queue(maxsize=stage.queue_size)
+
+        tasks = [asyncio.create_task(self._run_source(self.stages[0].input))]
+        for i, stage in enumerate(self.stages):
+            output = self.stages[i + 1].input if i + 1 < len(self.stages) else None
+            remaining = [stage.concurrency]
+            tasks.extend(
+                asyncio.create_task(self._run_worker(stage, output, remaining)) for _ in range(stage.concurrency)
+            )
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "running_seconds": round(elapsed, 1),
+            "stopping": self.stopping,
+            "source_emitted": self.emitted,
+            "stages": {stage.name: stage.stats(elapsed) for stage in self.stages},
+        }
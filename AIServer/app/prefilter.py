@@ -0,0 +1,147 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .metrics import span
+
+PREFILTER = os.getenv("PREFILTER", "0") == "1"  # Off until eval_prefilter recall on labelled drone frames is recorded
+PREFILTER_SIZE = int(os.getenv("PREFILTER_SIZE", "256"))  # Long side of the colour-check thumbnail
+PREFILTER_MIN_FRACTION = float(os.getenv("PREFILTER_MIN_FRACTION", "0.002"))  # Fire/smoke-like pixels needed to run YOLO
+PREFILTER_DIFF_THRESHOLD = float(os.getenv("PREFILTER_DIFF_THRESHOLD", "0.0005"))  # Share of changed pixels that counts as a new view
+PREFILTER_PIXEL_DELTA = int(os.getenv("PREFILTER_PIXEL_DELTA", "24"))  # Grey-level change that marks a pixel as changed
+PREFILTER_MAX_DRONES = int(os.getenv("PREFILTER_MAX_DRONES", "4096"))
+
+SAMPLER_MIN_RATE = float(os.getenv("SAMPLER_MIN_RATE", "0.2"))  # Quiet locations are still scanned this often
+SAMPLER_MAX_RATE = float(os.getenv("SAMPLER_MAX_RATE", "1.0"))
+SAMPLER_DECAY = float(os.getenv("SAMPLER_DECAY", "0.8"))  # Rate multiplier per negative frame
+
+SIGNATURE_SIZE = (128, 128)  # Grey thumbnail compared against the drone's previous frame
+
+NO_DETECTION = {"status": "nothing detected", "detections": []}
+
+
+def candidate_mask(image: np.ndarray) -> np.ndarray:
+    """Boolean mask of fire-coloured or smoke-grey pixels; cheap enough to run on a thumbnail."""
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    hue, sat, val = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    fire = ((hue <= 35) | (hue >= 160)) & (sat >= 100) & (val >= 150)
+    smoke = (sat <= 50) & (val >= 120) & (val <= 235)
+    return fire | smoke
+
+
+def candidate_fraction(image: np.ndarray, size: int = PREFILTER_SIZE) -> float:
+    """Share of fire/smoke-like pixels, measured on a thumbnail."""
+    height, width = image.shape[:2]
+    scale = min(1.0, size / max(height, width))
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    return float(np.count_nonzero(candidate_mask(image))) / (image.shape[0] * image.shape[1])
+
+
+def frame_signature(image: np.ndarray) -> np.ndarray:
+    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(grey, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA)
+
+
+class FramePrefilter:
+    """Cheap first stage deciding whether a frame needs the full detector.
+
+    1. Frame difference: if almost no pixel of a drone's frame changed since
+       its previous one, the previous detection result is reused. Counting
+       changed pixels rather than averaging the difference keeps a small new
+       fire in an otherwise identical view from being missed.
+    2. Colour heuristic: frames with almost no fire-coloured or smoke-grey
+       pixels are reported as "nothing detected".
+    Everything else goes to YOLO. The heuristic is tuned for recall: haze,
+    clouds and bare ground pass it too, which only costs a forward pass.
+    """
+
+    def __init__(self, min_fraction: float = PREFILTER_MIN_FRACTION, diff_threshold: float = PREFILTER_DIFF_THRESHOLD,
+                 pixel_delta: int = PREFILTER_PIXEL_DELTA, max_drones: int = PREFILTER_MAX_DRONES):
+        self.min_fraction = min_fraction
+        self.diff_threshold = diff_threshold
+        self.pixel_delta = pixel_delta
+        self.max_drones = max_drones
+        self._previous: "OrderedDict[Hashable, Tuple[np.ndarray, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"frames": 0, "unchanged": 0, "no_candidates": 0, "passed": 0}
+
+    @span("prefilter", profile=True)
+    def screen(self, key: Optional[Hashable], image: np.ndarray) -> Tuple[Optional[Dict[str, Any]], np.ndarray]:
+        """(result to use instead of running the detector, or None to run it; frame signature for remember())."""
+        signature = frame_signature(image)
+        with self._lock:
+            self._counters["frames"] += 1
+            previous = self._previous.get(key) if key is not None else None
+        if previous is not None:
+            previous_signature, previous_result = previous
+            changed = np.count_nonzero(cv2.absdiff(signature, previous_signature) > self.pixel_delta)
+            if changed < self.diff_threshold * signature.size:
+                with self._lock:
+                    self._counters["unchanged"] += 1
+                return previous_result, signature
+
+        if candidate_fraction(image) < self.min_fraction:
+            with self._lock:
+                self._counters["no_candidates"] += 1
+            return NO_DETECTION, signature
+
+        with self._lock:
+            self._counters["passed"] += 1
+        return None, signature
+
+    def remember(self, key: Optional[Hashable], signature: np.ndarray, result: Dict[str, Any]) -> None:
+        """Record a drone's latest frame and its result for the frame-difference check."""
+        if key is None:
+            return
+        with self._lock:
+            self._previous[key] = (signature, result)
+            self._previous.move_to_end(key)
+            while len(self._previous) > self.max_drones:
+                self._previous.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+        skipped = stats["unchanged"] + stats["no_candidates"]
+        stats["skip_rate"] = round(skipped / stats["frames"], 4) if stats["frames"] else 0.0
+        return stats
+
+
+class AdaptiveSampler:
+    """Per-location sampling rate: back to the maximum after a detection, decaying while quiet.
+
+    The scan scheduler divides a drone's rescan interval by this rate, so a
+    quiet location at min_rate is revisited 1 / min_rate times less often.
+    """
+
+    def __init__(self, min_rate: float = SAMPLER_MIN_RATE, max_rate: float = SAMPLER_MAX_RATE, decay: float = SAMPLER_DECAY):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.decay = decay
+        self._rates: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def rate(self, location_id: str) -> float:
+        with self._lock:
+            return self._rates.get(location_id, self.max_rate)
+
+    def record(self, location_id: str, positive: bool) -> None:
+        with self._lock:
+            rate = self._rates.get(location_id, self.max_rate)
+            self._rates[location_id] = self.max_rate if positive else max(self.min_rate, rate * self.decay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-location rates and how far each stretches the rescan interval (1 = scanned at full rate)."""
+        with self._lock:
+            rates = dict(self._rates)
+        stretch = {location_id: round(self.max_rate / rate, 2) for location_id, rate in rates.items()}
+        return {
+            "rates": {location_id: round(rate, 3) for location_id, rate in rates.items()},
+            "interval_stretch": stretch,
+            "mean_interval_stretch": round(sum(stretch.values()) / len(stretch), 2) if stretch else 1.0,
+        }
@@ -0,0 +1,244 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCAN_CONCURRENCY = int(os.getenv("SCAN_CONCURRENCY", "0"))  # Frames in flight across I/O and inference; 0 = derived from the stages
+SCAN_MAX_IN_FLIGHT_PER_LOCATION = int(os.getenv("SCAN_MAX_IN_FLIGHT_PER_LOCATION", "0"))  # 0 = a quarter of the budget
+SCAN_MIN_INTERVAL_SECONDS = float(os.getenv("SCAN_MIN_INTERVAL_SECONDS", "2"))  # Per drone, at the full sampling rate
+SCAN_LOCATIONS_REFRESH_SECONDS = float(os.getenv("SCAN_LOCATIONS_REFRESH_SECONDS", "60"))
+SCAN_DETECTION_BOOST = float(os.getenv("SCAN_DETECTION_BOOST", "1.0"))  # Extra weight per recent positive frame
+SCAN_DETECTION_HALF_LIFE = float(os.getenv("SCAN_DETECTION_HALF_LIFE", "600"))  # Seconds for that extra weight to halve
+SCAN_IDLE_SECONDS = 0.5  # Longest sleep when nothing is due yet
+
+
+class LocationScan:
+    """Scheduling state of one forest location."""
+
+    __slots__ = ("location_id", "risk", "tag", "version", "images", "by_drone", "drone_ids", "next_drone",
+                 "drone_scanned_at", "checked_at", "in_flight", "hits", "hits_at")
+
+    def __init__(self, location_id: str, risk: float, tag: float):
+        self.location_id = location_id
+        self.risk = risk
+        self.tag = tag  # Virtual start time of its next scan; the lowest tag goes first
+        self.version = 0  # Bumped on every re-queue, so stale heap entries can be skipped
+        self.images: Optional[List[Dict[str, Any]]] = None  # Catalogue list the drone grouping was built from
+        self.by_drone: Dict[str, List[Dict[str, Any]]] = {}
+        self.drone_ids: List[str] = []
+        self.next_drone = 0
+        self.drone_scanned_at: Dict[str, float] = {}
+        self.checked_at = float("-inf")  # Last look at a location that had no valid images
+        self.in_flight = 0
+        self.hits = 0.0
+        self.hits_at = 0.0
+
+
+class ScanScheduler:
+    """Pipeline source that spreads a global frame budget across every location and drone.
+
+    Locations are served in start-time fair queuing order: each pick advances a
+    location's tag by 1 / weight, so every location gets a share of the scans
+    proportional to its weight, however many drones or images it has, and one
+    that has waited longest relative to its share goes first. The weight is the
+    forest's risk_score times a boost for recent positive frames. Each pick
+    emits one frame from the location's next drone (round-robin), and a drone
+    is rescanned at most every min_interval / sampling rate seconds, so quiet
+    locations are visited less often in absolute terms too.
+
+    A frame holds one unit of the global budget from the moment it is emitted
+    until it leaves the pipeline (done()), so fetches, decodes and inference
+    share one bound. While other locations are due, one location holds at
+    most per_location of it.
+    """
+
+    def __init__(
+        self,
+        list_locations: Callable[[], List[Tuple[str, float]]],
+        location_images: Callable[[str], List[Dict[str, Any]]],
+        concurrency: int,
+        per_location: int = SCAN_MAX_IN_FLIGHT_PER_LOCATION,
+        min_interval: float = SCAN_MIN_INTERVAL_SECONDS,
+        sampling_rate: Optional[Callable[[str], float]] = None,
+        locations_refresh: float = SCAN_LOCATIONS_REFRESH_SECONDS,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        self.list_locations = list_locations
+        self.location_images = location_images
+        self.concurrency = concurrency
+        self.per_location = per_location or max(1, concurrency // 4)
+        self.min_interval = min_interval
+        self.sampling_rate = sampling_rate or (lambda location_id: 1.0)
+        self.locations_refresh = locations_refresh
+
+        self._locations: Dict[str, LocationScan] = {}
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._budget: Optional[asyncio.Semaphore] = None
+        self._listed_at = float("-inf")
+
+        # Full-estate coverage: time until every location has been looked at and every drone scanned once
+        self._pending: Set[Tuple[str, str]] = set()
+        self._unvisited: Set[str] = set()
+        self._sweep_started = time.monotonic()
+        self._counters = {"emitted": 0, "completed": 0, "positives": 0, "sweeps": 0}
+        self.last_coverage_seconds: Optional[float] = None
+
+    def _weight(self, location: LocationScan, now: float) -> float:
+        hits = location.hits * 0.5 ** ((now - location.hits_at) / SCAN_DETECTION_HALF_LIFE)
+        return max(location.risk, 1e-3) * (1.0 + SCAN_DETECTION_BOOST * hits)
+
+    def _push(self, location: LocationScan) -> None:
+        location.version += 1
+        heapq.heappush(self._heap, (location.tag, next(self._seq), location.location_id, location.version))
+
+    async def _refresh_locations(self) -> None:
+        listed = await asyncio.to_thread(self.list_locations)
+        seen = set()
+        for location_id, risk in listed:
+            seen.add(location_id)
+            location = self._locations.get(location_id)
+            if location is None:
+                # New locations join at the current virtual time instead of catching up on past shares
+                location = self._locations[location_id] = LocationScan(location_id, risk, self._virtual_time)
+                self._unvisited.add(location_id)
+                self._push(location)
+            else:
+                location.risk = risk
+        for location_id in set(self._locations) - seen:
+            del self._locations[location_id]  # Its heap entries are skipped as stale
+        self._pending = {key for key in self._pending if key[0] in self._locations}
+        self._unvisited &= seen
+        self._listed_at = time.monotonic()
+
+    async def _group_images(self, location: LocationScan) -> None:
+        images = await asyncio.to_thread(self.location_images, location.location_id)
+        self._unvisited.discard(location.location_id)
+        if images is location.images:
+            return  # The catalogue publishes a new list on every change; regroup only then
+        by_drone: Dict[str, List[Dict[str, Any]]] = {}
+        for image in images or ():
+            by_drone.setdefault(image["drone_id"], []).append(image)
+        location.images = images
+        location.by_drone = by_drone
+        location.drone_ids = sorted(by_drone)
+        for drone_id in location.drone_ids:
+            if drone_id not in location.drone_scanned_at:
+                self._pending.add((location.location_id, drone_id))
+
+    def _eligible_at(self, location: LocationScan) -> float:
+        if not location.drone_ids:
+            return location.checked_at + self.min_interval
+        drone_id = location.drone_ids[location.next_drone % len(location.drone_ids)]
+        interval = self.min_interval / max(self.sampling_rate(location.location_id), 1e-3)
+        return location.drone_scanned_at.get(drone_id, float("-inf")) + interval
+
+    def _pop_due(self, now: float, deferred: List[LocationScan]) -> Tuple[Optional[LocationScan], float]:
+        """Lowest-tag due location under its in-flight cap, else the lowest-tag due one at its cap."""
+        capped = None
+        wait = SCAN_IDLE_SECONDS
+        while self._heap:
+            _, _, location_id, version = heapq.heappop(self._heap)
+            location = self._locations.get(location_id)
+            if location is None or version != location.version:
+                continue
+            deferred.append(location)
+            eligible_at = self._eligible_at(location)
+            if eligible_at > now:
+                wait = min(wait, eligible_at - now)
+            elif location.in_flight < self.per_location:
+                return location, 0.0
+            elif capped is None:
+                capped = location  # Used only when no one else is due, so the cap never idles the budget
+        return capped, wait
+
+    async def _next_frame(self) -> Tuple[Optional[Dict[str, Any]], float]:
+        """(frame, 0) for the most deserving due location, or (None, seconds until one may be due)."""
+        now = time.monotonic()
+        deferred: List[LocationScan] = []
+        try:
+            while True:
+                location, wait = self._pop_due(now, deferred)
+                if location is None:
+                    return None, wait
+                self._virtual_time = location.tag
+                location.tag += 1.0 / self._weight(location, now)
+
+                await self._group_images(location)
+                if not location.drone_ids:
+                    location.checked_at = now  # Nothing to scan; look again after min_interval
+                    continue
+                drone_id = location.drone_ids[location.next_drone % len(location.drone_ids)]
+                location.next_drone += 1
+                location.drone_scanned_at[drone_id] = now
+                location.in_flight += 1
+                self._pending.discard((location.location_id, drone_id))
+                return {"location_id": location.location_id, "image_data": random.choice(location.by_drone[drone_id])}, 0.0
+        finally:
+            for location in deferred:
+                self._push(location)
+
+    def _check_sweep(self) -> None:
+        if self._pending or self._unvisited or not self._locations:
+            return
+        now = time.monotonic()
+        self.last_coverage_seconds = now - self._sweep_started
+        self._counters["sweeps"] += 1
+        self._sweep_started = now
+        self._pending = {(location.location_id, drone_id)
+                         for location in self._locations.values() for drone_id in location.drone_ids}
+
+    async def frames(self, is_running: Callable[[], bool]) -> AsyncIterator[Dict[str, Any]]:
+        """Emit frames while is_running(); each must be handed back through done()."""
+        self._budget = asyncio.Semaphore(self.concurrency)
+        while is_running():
+            if time.monotonic() - self._listed_at >= self.locations_refresh:
+                await self._refresh_locations()
+            await self._budget.acquire()
+            frame, wait = await self._next_frame()
+            if frame is None:
+                self._budget.release()
+                await asyncio.sleep(wait)
+                continue
+            self._counters["emitted"] += 1
+            self._check_sweep()
+            yield frame
+
+    def done(self, frame: Dict[str, Any]) -> None:
+        """Return a frame's budget unit once it leaves the pipeline, and note whether it was positive."""
+        self._counters["completed"] += 1
+        if self._budget is not None:
+            self._budget.release()
+        location = self._locations.get(frame["location_id"])
+        if location is None:
+            return
+        location.in_flight -= 1
+        result = frame.get("result")
+        if result is not None and result["status"] != "nothing detected":
+            now = time.monotonic()
+            location.hits = location.hits * 0.5 ** ((now - location.hits_at) / SCAN_DETECTION_HALF_LIFE) + 1.0
+            location.hits_at = now
+            self._counters["positives"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        locations = list(self._locations.values())
+        return {
+            **self._counters,
+            "budget": self.concurrency,
+            "in_flight": sum(location.in_flight for location in locations),
+            "per_location": self.per_location,
+            "locations": len(locations),
+            "drones": sum(len(location.drone_ids) for location in locations),
+            "coverage_seconds": round(self.last_coverage_seconds, 2) if self.last_coverage_seconds is not None else None,
+            "sweep_pending": len(self._pending),
+            "weights": {location.location_id: round(self._weight(location, now), 3) for location in locations},
+        }
@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import GaugeCallback, observe, registry, span
+from .workers import INFERENCE_WORKERS, InferenceWorkerPool
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = int(os.getenv("SCHEDULER_MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.getenv("SCHEDULER_MAX_WAIT_MS", "20"))
+MAX_QUEUE_SIZE = int(os.getenv("SCHEDULER_MAX_QUEUE_SIZE", "256"))
+SUBMIT_TIMEOUT = float(os.getenv("SCHEDULER_SUBMIT_TIMEOUT", "5"))  # Seconds detect() waits for queue space before giving up
+QUEUE_FULL_RETRY = 0.005  # Seconds between detect()'s attempts to enqueue into a full queue
+LATENCY_WINDOW = 2048  # Number of recent requests used for latency percentiles
+
+_STOP = object()
+
+
+class SchedulerBusy(RuntimeError):
+    """The request queue stayed full for longer than the caller was willing to wait, or the scheduler stopped."""
+
+
+class _Request:
+    __slots__ = ("image", "future", "enqueued_at")
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+def _percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _run_in_process(images: Sequence[np.ndarray]) -> List[Dict[str, Any]]:
+    # Imported lazily so process-pool mode never loads the weights in the API process
+    from .inference import run_detection_batch
+    return run_detection_batch(images, batch_size=len(images))
+
+
+class MicroBatchScheduler:
+    """Queue detection requests and run them through the model in coalesced batches.
+
+    Each dispatcher thread takes the oldest request, then keeps collecting until it
+    has max_batch_size frames or max_wait_ms has passed since that request was
+    queued, and resolves every caller's future with its own result. With the
+    in-process model there is one dispatcher; with a worker pool there is one per
+    worker process.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+        max_queue_size: int = MAX_QUEUE_SIZE,
+        runner: Optional[Callable[[Sequence[np.ndarray]], List[Dict[str, Any]]]] = None,
+        concurrency: int = 1,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.concurrency = concurrency
+        self._runner = runner or _run_in_process
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._completed = 0
+        self._failed = 0
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.concurrency):
+                thread = threading.Thread(target=self._run, name=f"inference-scheduler-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(
+                f"Inference scheduler started ({self.concurrency} dispatchers, "
+                f"max batch {self.max_batch_size}, max wait {self.max_wait * 1000:.0f} ms)"
+            )
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the dispatchers after their current batch; requests still queued fail with SchedulerBusy."""
+        with self._start_lock:
+            if not self._threads:
+                return
+            pending = self._drain()
+            for _ in self._threads:
+                # Never block here: a full queue is drained to make room for the stop marker
+                while True:
+                    try:
+                        self._queue.put_nowait(_STOP)
+                        break
+                    except queue.Full:
+                        pending.extend(self._drain())
+            for thread in self._threads:
+                thread.join(timeout=timeout)
+            self._threads = []
+            pending.extend(self._drain())  # Submitted behind the stop markers
+        for request in pending:
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(SchedulerBusy("Inference scheduler stopped"))
+
+    def _drain(self) -> List[_Request]:
+        requests = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return requests
+            if item is not _STOP:
+                requests.append(item)
+
+    def submit(self, image: np.ndarray, block: bool = True) -> Future:
+        """Queue one frame and return a concurrent future for its result dict.
+
+        Blocks while the queue is full; with block=False raises queue.Full instead.
+        Never call it with block=True from an event loop.
+        """
+        if image is None or not isinstance(image, np.ndarray):
+            raise ValueError(" Invalid image provided for detection.")
+        self.start()
+        request = _Request(image)
+        self._queue.put(request, block=block)
+        return request.future
+
+    async def detect(self, image: np.ndarray, timeout: float = SUBMIT_TIMEOUT) -> Dict[str, Any]:
+        """Awaitable run_detection; safe to call from any event loop.
+
+        A full queue is waited out without blocking the loop; after timeout
+        seconds SchedulerBusy is raised, which the API turns into a 503.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                future = self.submit(image, block=False)
+                break
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    raise SchedulerBusy(f"Inference queue full ({self._queue.maxsize} requests)") from None
+                await asyncio.sleep(QUEUE_FULL_RETRY)
+        return await asyncio.wrap_future(future)
+
+    async def detect_many(self, images: Sequence[np.ndarray]) -> List[Dict[str, Any]]:
+        return list(await asyncio.gather(*(self.detect(image) for image in images)))
+
+    def _collect_batch(self, first: _Request) -> Tuple[List[_Request], bool]:
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stopping = self._collect_batch(first)
+
+            # Callers may have cancelled while waiting in the queue
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            observe("scheduler.queue_wait", time.monotonic() - batch[0].enqueued_at)
+            try:
+                with span("scheduler.batch"):
+                    results = self._runner([r.image for r in batch])
+            except Exception as e:
+                logger.error(f"Batched inference failed for {len(batch)} requests: {e}", exc_info=True)
+                for request in batch:
+                    request.future.set_exception(e)
+                with self._stats_lock:
+                    self._failed += len(batch)
+                continue
+
+            finished_at = time.monotonic()
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._completed += len(batch)
+                self._latencies.extend(finished_at - r.enqueued_at for r in batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, batch-size histogram and p50/p99 latency in milliseconds."""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            histogram = dict(sorted(self._batch_sizes.items()))
+            completed, failed = self._completed, self._failed
+        p50 = _percentile(latencies, 50)
+        p99 = _percentile(latencies, 99)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "dispatchers": self.concurrency,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "completed": completed,
+            "failed": failed,
+            "batch_size_histogram": histogram,
+            "latency_ms": {
+                "p50": round(p50 * 1000.0, 2) if p50 is not None else None,
+                "p99": round(p99 * 1000.0, 2) if p99 is not None else None,
+            },
+        }
+
+
+# Shared by every caller in the process; dispatchers start on first submit
+if INFERENCE_WORKERS > 0:
+    worker_pool: Optional[InferenceWorkerPool] = InferenceWorkerPool(INFERENCE_WORKERS, max_batch_size=MAX_BATCH_SIZE)
+    scheduler = MicroBatchScheduler(runner=worker_pool.run_batch, concurrency=INFERENCE_WORKERS)
+else:
+    worker_pool = None
+    scheduler = MicroBatchScheduler()
+
+registry.register(GaugeCallback(
+    "foresteye_scheduler_queue_depth", "Detection requests waiting for a batch.", lambda: {(): scheduler.stats()["queue_depth"]}
+))
@@ -1,162 +1,389 @@
-import time
+import logging
+import os
 import threading
 import asyncio
-import random
 from datetime import datetime
-from firebase.db_operations import get_valid_images_from_location, load_image_from_url
-from .inference import run_detection
+from typing import Optional
+from firebase.catalogue import catalogue
+from firebase.db_operations import get_valid_images_from_location, download_image_bytes
+from firebase.downloader import downloader
+from firebase.writer import alert_writer
+from .events import broker
+from .metrics import ALERTS, FRAMES, GaugeCallback, registry, span
+from .cache import detection_cache, lookup_by_url, lookup_by_bytes
+from .decoding import decode_for_model, scale_detections
+from .pipeline import Pipeline, Stage
+from .prefilter import PREFILTER, AdaptiveSampler, FramePrefilter
+from .scan import SCAN_CONCURRENCY, SCAN_MIN_INTERVAL_SECONDS, ScanScheduler
+from .scheduler import MAX_BATCH_SIZE
+from .store import CancellationToken, FireEvent, FireEventStore
+from .tiling import detect_frame
+from .tracker import ATTACHED, ESCALATED, NEW, FireTracker
 from firebase.config import db
-from threading import Lock
 
-# Add thread lock for safe state updates
-simulation_lock = Lock()
+logger = logging.getLogger(__name__)
 
-simulation_state = {
-    "running": False,
-    "fire_events": [],
-    "thread": None  # Track the simulation thread
-}
+STOP_JOIN_SECONDS = 1.0  # How long stop_simulation waits for the run to drain
+SCAN_MIN_INTERVAL = SCAN_MIN_INTERVAL_SECONDS  # Shortest rescan interval of one drone
 
-MAX_DETECTIONS = 4  # Maximum 4 detections total
-DETECTION_DELAY = 2  # Delay between detections
+FETCH_CONCURRENCY = int(os.getenv("PIPELINE_FETCH_CONCURRENCY", "8"))
+DECODE_CONCURRENCY = int(os.getenv("PIPELINE_DECODE_CONCURRENCY", "2"))
+# Enough in-flight frames to let the scheduler fill a whole batch
+INFER_CONCURRENCY = int(os.getenv("PIPELINE_INFER_CONCURRENCY", str(MAX_BATCH_SIZE)))
+PERSIST_CONCURRENCY = int(os.getenv("PIPELINE_PERSIST_CONCURRENCY", "2"))
+QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+# Frames in flight from fetch to persist: enough to keep every fetch and inference slot busy
+SCAN_BUDGET = SCAN_CONCURRENCY or FETCH_CONCURRENCY + DECODE_CONCURRENCY + INFER_CONCURRENCY
 
-async def simulate_fire_detection():
-    with simulation_lock:
-        simulation_state["running"] = True
-        simulation_state["fire_events"] = []  # Reset previous fire events
+# Kept across runs: the previous frame of each drone and each location's sampling rate
+prefilter = FramePrefilter()
+sampler = AdaptiveSampler()
 
+# Latest fire events for the map; endpoints read its snapshot without locking
+fire_events = FireEventStore()
+
+
+class SimulationRun:
+    """One start-to-stop of the detector. A new start creates a new run instead of resetting this one."""
+
+    __slots__ = ("token", "finished", "thread", "pipeline", "tracker", "scan")
+
+    def __init__(self):
+        self.token = CancellationToken()
+        self.finished = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.pipeline: Optional[Pipeline] = None
+        self.tracker: Optional[FireTracker] = None
+        self.scan: Optional[ScanScheduler] = None
+
+    @property
+    def running(self) -> bool:
+        return not self.token.cancelled and not self.finished.is_set()
+
+
+_current: Optional[SimulationRun] = None  # Current or last run; swapped whole, read without locking
+_control_lock = threading.Lock()  # Serializes start and stop only, never held while waiting on a run
+
+def current_run() -> Optional[SimulationRun]:
+    return _current
+
+def is_running() -> bool:
+    run = _current
+    return run is not None and run.running
+
+def _list_locations():
+    """(location id, risk score) of every forest; locations without a risk_score weigh 1."""
+    with span("firestore.list_locations"):
+        docs = db.collection("forestLocations").select(["risk_score"]).stream()
+        locations = []
+        for doc in docs:
+            try:
+                risk = float((doc.to_dict() or {}).get("risk_score", 1.0))
+            except (TypeError, ValueError):
+                risk = 1.0
+            locations.append((doc.id, risk))
+        return locations
+
+async def _fetch(frame):
+    """Resolve a cached result from blob metadata, otherwise download the bytes."""
+    image_url = frame["image_data"]["image_url"]
+    identity, cached = await asyncio.to_thread(lookup_by_url, image_url)
+    if cached is None:
+        image_data = await downloader.result(image_url, download_image_bytes)
+        if image_data is None:
+            return None
+        if identity is None:
+            identity, cached = lookup_by_bytes(image_data)
+        frame["image_bytes"] = image_data
+    frame["identity"] = identity
+    frame["result"] = cached
+    frame["source"] = "cache" if cached is not None else None
+    return frame
+
+async def _decode(frame):
+    image_data = frame.pop("image_bytes", None)
+    if frame["result"] is None:
+        decoded = await asyncio.to_thread(decode_for_model, image_data)
+        if decoded is None:
+            return None
+        frame["decoded"] = decoded
+    return frame
+
+async def _prefilter(frame):
+    """Cheap first stage: skip the detector for unchanged or fire/smoke-free frames."""
+    if frame["result"] is None and PREFILTER:
+        decoded = frame["decoded"]
+        drone_key = (frame["location_id"], frame["image_data"]["drone_id"])
+        result, frame["signature"] = await asyncio.to_thread(prefilter.screen, drone_key, decoded.image)
+        if result is not None:
+            decoded.release()
+            del frame["decoded"]
+            frame["result"] = result
+            frame["source"] = "prefilter"
+    return frame
+
+async def _infer(frame):
+    if frame["result"] is None:
+        decoded = frame.pop("decoded")
+        try:
+            result = await detect_frame(decoded.image)
+        finally:
+            decoded.release()
+        frame["result"] = scale_detections(result, decoded.scale)
+        frame["source"] = "model"
+        detection_cache.put(frame["identity"], frame["result"])
+    if "signature" in frame:
+        prefilter.remember((frame["location_id"], frame["image_data"]["drone_id"]), frame.pop("signature"), frame["result"])
+    positive = frame["result"]["status"] != "nothing detected"
+    sampler.record(frame["location_id"], positive)
+    FRAMES.inc(outcome=f"{frame['source']}_{'positive' if positive else 'negative'}")
+    return frame
+
+def _build_pipeline(run: SimulationRun):
+    alerted_urls = set()  # Images already turned into alerts during this run
+    forest_names = {}
+    tracker = run.tracker = FireTracker()
+    scan = run.scan = ScanScheduler(
+        _list_locations, get_valid_images_from_location, SCAN_BUDGET, min_interval=SCAN_MIN_INTERVAL,
+        # Quiet locations (by the adaptive sampler) are rescanned less often
+        sampling_rate=sampler.rate if PREFILTER else None,
+    )
+
+    async def track(frame):
+        if frame["result"]["status"] == "nothing detected":
+            return None
+        image_data = frame["image_data"]
+        image_url = image_data["image_url"]
+        # Images flagged by an earlier run, or alerted already in this one
+        if image_data["original_data"].get("alert_status") or image_url in alerted_urls:
+            return None
+        fire, verdict = tracker.observe(
+            frame["location_id"], image_data["latitude"], image_data["longitude"], frame["result"]["detections"]
+        )
+        if verdict == ATTACHED:
+            return None
+        alerted_urls.add(image_url)
+        frame["fire"] = fire
+        frame["verdict"] = verdict
+        return frame
+
+    def forest_name_for(location_id):
+        if location_id not in forest_names:
+            with span("firestore.forest_get"):
+                forest_doc = db.collection("forestLocations").document(location_id).get()
+            forest_names[location_id] = forest_doc.get("forest_name") if forest_doc.exists else "Unknown"
+        return forest_names[location_id]
+
+    def log_write_failure(future):
+        if future.exception() is not None:
+            logger.error("Failed to persist alert: %s", future.exception())
+
+    def mark_image(location_id, image_data, alert_status):
+        # Later scans and runs see the flag without waiting for a catalogue refresh
+        catalogue.mark(location_id, image_data["drone_id"], image_data["image_doc_id"], {"alert_status": alert_status})
+
+    def alert_not_created(fire, location_id, image_data):
+        """Undo the bookkeeping of a NEW fire whose alert will never exist.
+
+        Otherwise every nearby detection would attach to it and stay silent for
+        the tracker window. The image is made eligible again too.
+        """
+        tracker.forget(fire)
+        alerted_urls.discard(image_data["image_url"])
+        mark_image(location_id, image_data, None)
+
+    def on_alert_write(fire, location_id, image_data):
+        def done(future):
+            if future.exception() is not None:
+                logger.error("Failed to persist alert %s: %s", fire.alert_id, future.exception())
+                alert_not_created(fire, location_id, image_data)
+        return done
+
+    async def persist(frame):
+        location_id = frame["location_id"]
+        image_data = frame["image_data"]
+        fire = frame["fire"]
+
+        image_ref = db.collection("forestLocations") \
+            .document(location_id) \
+            .collection("drones") \
+            .document(image_data["drone_id"]) \
+            .collection("images") \
+            .document(image_data["image_doc_id"])
+        if frame["verdict"] == NEW:
+            # Create alert and flag its image in one atomic write, committed in the background
+            try:
+                mark_image(location_id, image_data, "active")
+                forest_name = await asyncio.to_thread(forest_name_for, location_id)
+                fire.alert_id, write = alert_writer.create_alert({
+                    "forest_name": forest_name,
+                    "forest_location_id": location_id,
+                    "image_location": image_data["image_url"],
+                    "detection_status": "active",
+                    "detection_class": fire.detection_class,
+                    "confidence": fire.confidence,
+                    "timestamp": datetime.utcnow()
+                }, image_ref)
+                write.add_done_callback(on_alert_write(fire, location_id, image_data))
+            finally:
+                # Always resolved, so escalations of this fire never wait on an alert that will not come
+                fire.alert_created.set_result(fire.alert_id)
+                if fire.alert_id is None:
+                    alert_not_created(fire, location_id, image_data)
+        else:
+            # The writer commits in queue order, so wait until the alert itself is queued
+            await asyncio.wrap_future(fire.alert_created)
+            if fire.alert_id is None:
+                return None
+            mark_image(location_id, image_data, "active")
+            forest_name = await asyncio.to_thread(forest_name_for, location_id)
+            write = alert_writer.enqueue([
+                ("update", db.collection("alerts").document(fire.alert_id), {
+                    "detection_class": fire.detection_class,
+                    "confidence": fire.confidence,
+                    "latest_image_location": image_data["image_url"],
+                    "escalated_at": datetime.utcnow()
+                }),
+                ("update", image_ref, {"alert_status": "active"}),
+            ])
+            write.add_done_callback(log_write_failure)
+
+        # Extract first detection info
+        detections = frame["result"]["detections"]
+        first_detection = detections[0] if detections else {}
+
+        fire_event = FireEvent.create({
+            "coords": {
+                "latitude": image_data["latitude"],
+                "longitude": image_data["longitude"]
+            },
+            "image_url": image_data["image_url"],
+            "forest_name": forest_name,
+            "class": first_detection.get("class", "unknown"),
+            "confidence": first_detection.get("confidence", 0.0),
+            "location_id": location_id
+        }, alert_id=fire.alert_id, escalated=frame["verdict"] == ESCALATED)
+
+        if fire_event is not None:
+            # Store it for the map, then push it to stream subscribers
+            fire_events.append(fire_event)
+            broker.publish("fire_event", {
+                **fire_event.to_dict(), "alert_id": fire_event.alert_id, "escalated": fire_event.escalated
+            }, forest_id=location_id)
+
+        ALERTS.inc(kind=frame["verdict"])
+        if frame["verdict"] == NEW:
+            logger.info("Alert %s created at %s (%s, %s)", fire.alert_id, forest_name, image_data["latitude"], image_data["longitude"])
+        else:
+            logger.info("Alert %s escalated to %s (%.2f) at %s", fire.alert_id, fire.detection_class, fire.confidence, forest_name)
+        return frame
+
+    return Pipeline(lambda: scan.frames(lambda: not run.token.cancelled), [
+        Stage("fetch", _fetch, concurrency=FETCH_CONCURRENCY, queue_size=QUEUE_SIZE),
+        Stage("decode", _decode, concurrency=DECODE_CONCURRENCY, queue_size=QUEUE_SIZE),
+        Stage("prefilter", _prefilter, concurrency=DECODE_CONCURRENCY, queue_size=QUEUE_SIZE),
+        Stage("infer", _infer, concurrency=INFER_CONCURRENCY, queue_size=QUEUE_SIZE),
+        Stage("track", track, concurrency=1, queue_size=QUEUE_SIZE),
+        Stage("persist", persist, concurrency=PERSIST_CONCURRENCY, queue_size=QUEUE_SIZE),
+    ], on_exit=scan.done)
+
+async def simulate_fire_detection(run: Optional["SimulationRun"] = None):
+    """Run the detection pipeline until the run is cancelled, then drain it."""
+    global _current
+    if run is None:
+        run = SimulationRun()
+        with _control_lock:
+            _current = run
+    fire_events.clear()  # Reset previous fire events
+    run.pipeline = _build_pipeline(run)
     try:
-        # Get all forest locations
-        location_docs = db.collection("forestLocations").stream()
-        forest_locations = [doc.id for doc in location_docs]
-        random.shuffle(forest_locations)  # Randomize the order
-
-        total_detected = 0
-        used_locations = set()  # Track which locations we've already used
-
-        while total_detected < MAX_DETECTIONS:
-            with simulation_lock:
-                if not simulation_state["running"]:
-                    break
-
-            # Find next available location we haven't used yet
-            location_id = None
-            for loc_id in forest_locations:
-                if loc_id not in used_locations:
-                    location_id = loc_id
-                    break
-            
-            if location_id is None:
-                print("⚠️ No more unique forest locations available")
-                break
-
-            valid_images = get_valid_images_from_location(location_id)
-            if not valid_images:
-                used_locations.add(location_id)
-                continue
-
-            # Take one random image from this location
-            image_data = random.choice(valid_images)
-            used_locations.add(location_id)
-
-            image = load_image_from_url(image_data["image_url"])
-            if image is None:
-                continue
-
-            result = run_detection(image)
-            if result["status"] != "nothing detected":
-                # Extract first detection info
-                first_detection = result["detections"][0] if result["detections"] else {}
-                detected_class = first_detection.get("class", "unknown")
-                confidence = first_detection.get("confidence", 0.0)
-
-                # Avoid duplicate alerts
-                existing = db.collection("alerts").where("image_location", "==", image_data["image_url"]).get()
-                if not existing:
-                    # Get forest name
-                    forest_doc = db.collection("forestLocations").document(location_id).get()
-                    forest_name = forest_doc.get("forest_name") if forest_doc.exists else "Unknown"
-
-                    # Create alert
-                    alert_ref = db.collection("alerts").document()
-                    alert_ref.set({
-                        "forest_name": forest_name,
-                        "forest_location_id": location_id,
-                        "image_location": image_data["image_url"],
-                        "detection_status": "active",
-                        "timestamp": datetime.utcnow(),
-                        "alert_id": alert_ref.id
-                    })
-
-                    # Update image alert status
-                    db.collection("forestLocations") \
-                        .document(location_id) \
-                        .collection("drones") \
-                        .document(image_data["drone_id"]) \
-                        .collection("images") \
-                        .document(image_data["image_doc_id"]) \
-                        .update({"alert_status": "active"})
-
-                    # Store fire event for frontend
-                    with simulation_lock:
-                        simulation_state["fire_events"].append({
-                            "coords": {
-                                "latitude": image_data["latitude"],
-                                "longitude": image_data["longitude"]
-                            },
-                            "image_url": image_data["image_url"],
-                            "forest_name": forest_name,
-                            "class": detected_class,
-                            "confidence": confidence,
-                            "location_id": location_id 
-                        })
-                        # Keep only the most recent 4
-                        simulation_state["fire_events"] = simulation_state["fire_events"][-MAX_DETECTIONS:]
-
-                    total_detected += 1
-                    print(f"🔥 Alert created at {forest_name} ({image_data['latitude']}, {image_data['longitude']})")
-
-                await asyncio.sleep(DETECTION_DELAY)
-    except Exception as e:
-        print(f"❌ Simulation error: {e}")
+        await run.pipeline.run()
+        # Commit the alerts still buffered by the write-behind writer
+        await asyncio.to_thread(alert_writer.flush, 10.0)
+        logger.info("Detection pipeline drained")
+    except Exception:
+        logger.exception("Simulation error")
     finally:
-        with simulation_lock:
-            simulation_state["running"] = False
-            simulation_state["thread"] = None
+        run.finished.set()
+
+def _stage_queue_depths():
+    run = _current
+    pipeline = run.pipeline if run is not None else None
+    if pipeline is None:
+        return {}
+    return {(name,): stage["queue_depth"] for name, stage in pipeline.stats()["stages"].items()}
+
+registry.register(GaugeCallback(
+    "foresteye_pipeline_queue_depth", "Frames waiting in front of each pipeline stage.", _stage_queue_depths, ["stage"]
+))
+
+def _scan_gauges():
+    run = _current
+    scan = run.scan if run is not None else None
+    if scan is None:
+        return {}
+    stats = scan.stats()
+    gauges = {("in_flight",): stats["in_flight"]}
+    if stats["coverage_seconds"] is not None:
+        gauges[("coverage_seconds",)] = stats["coverage_seconds"]
+    return gauges
+
+registry.register(GaugeCallback(
+    "foresteye_scan", "Frames in flight and the last full-estate coverage time of the scan scheduler.", _scan_gauges, ["value"]
+))
+
+def simulation_stats():
+    run = _current
+    stats = run.pipeline.stats() if run is not None and run.pipeline else {}
+    stats["running"] = is_running()
+    if run is not None and run.tracker:
+        stats["tracker"] = run.tracker.stats()
+    if run is not None and run.scan:
+        stats["scan"] = run.scan.stats()
+    stats["fire_events"] = fire_events.stats()
+    if PREFILTER:
+        stats["prefilter"] = prefilter.stats()
+        stats["sampler"] = sampler.stats()
+    stats["writer"] = alert_writer.stats()
+    return stats
 
 def start_simulation():
-    with simulation_lock:
-        if simulation_state["running"]:
-            print("⚠️ Simulation already running — skipping")
+    global _current
+    with _control_lock:
+        if is_running():
+            logger.warning("Simulation already running, not starting another")
             return
 
-        print("🚀 Starting fire simulation thread...")
-        simulation_state["running"] = True
+        logger.info("Starting fire simulation thread")
+        run = SimulationRun()
 
         def run_simulation():
+            # Create new event loop for the thread
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
             try:
-                # Create new event loop for the thread
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(simulate_fire_detection())
-            except Exception as e:
-                print(f"❌ Thread error: {e}")
+                loop.run_until_complete(simulate_fire_detection(run))
+            except Exception:
+                logger.exception("Simulation thread error")
             finally:
-                with simulation_lock:
-                    simulation_state["running"] = False
-                    simulation_state["thread"] = None
+                run.finished.set()
+                loop.close()
 
-        # Start the thread and store reference
-        thread = threading.Thread(target=run_simulation, daemon=True)
-        simulation_state["thread"] = thread
-        thread.start()
+        run.thread = threading.Thread(target=run_simulation, name="simulation", daemon=True)
+        _current = run
+        run.thread.start()
 
 def stop_simulation():
-    with simulation_lock:
-        if simulation_state["running"]:
-            print("🛑 Stopping simulation")
-            simulation_state["running"] = False
-            if simulation_state["thread"] and simulation_state["thread"].is_alive():
-                simulation_state["thread"].join(timeout=1.0)
-        else:
-            print("ℹ️ Simulation not running - nothing to stop")
\ No newline at end of file
+    with _control_lock:
+        run = _current
+        if run is None or not run.running:
+            logger.info("Simulation not running, nothing to stop")
+            return
+        logger.info("Stopping simulation")
+        run.token.cancel()
+        if run.pipeline is not None:
+            # Stop the source; frames already in flight still drain through every stage
+            run.pipeline.stop()
+    # Wait outside the lock: the run never needs it to finish, and a second stop is not blocked
+    if run.thread is not None and run.thread is not threading.current_thread():
+        run.thread.join(timeout=STOP_JOIN_SECONDS)
@@ -0,0 +1,130 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from .events import format_fire_event
+
+FIRE_EVENT_RETENTION = int(os.getenv("FIRE_EVENT_RETENTION", "4"))  # Most recent fire events served to the map
+
+
+class FireEvent:
+    """One fire event as shown on the map; immutable once appended to a store."""
+
+    __slots__ = ("latitude", "longitude", "image_url", "forest_name", "detection_class", "confidence",
+                 "location_id", "alert_id", "escalated", "created_at", "encoded")
+
+    def __init__(self, latitude: float, longitude: float, image_url: Optional[str], forest_name: Optional[str],
+                 detection_class: Optional[str], confidence, location_id: Optional[str],
+                 alert_id: Optional[str] = None, escalated: bool = False):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.image_url = image_url
+        self.forest_name = forest_name
+        self.detection_class = detection_class
+        self.confidence = confidence
+        self.location_id = location_id
+        self.alert_id = alert_id
+        self.escalated = escalated
+        self.created_at = time.time()
+        # Serialized once; every snapshot body is a join of these
+        self.encoded = json.dumps(self.to_dict()).encode()
+
+    @classmethod
+    def create(cls, raw: Dict[str, Any], alert_id: Optional[str] = None, escalated: bool = False) -> Optional["FireEvent"]:
+        """Build from a {"coords", "image_url", ...} dict, or None if its coordinates are unusable."""
+        public = format_fire_event(raw)
+        if public is None:
+            return None
+        return cls(public["coords"]["latitude"], public["coords"]["longitude"], public["image_url"],
+                   public["forest_name"], public["class"], public["confidence"], public["location_id"],
+                   alert_id, escalated)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public /fire-events shape."""
+        return {
+            "coords": {
+                "latitude": self.latitude,
+                "longitude": self.longitude
+            },
+            "image_url": self.image_url,
+            "forest_name": self.forest_name,
+            "class": self.detection_class,
+            "confidence": self.confidence,
+            "location_id": self.location_id
+        }
+
+
+class EventSnapshot:
+    """Immutable view of a store at one version; safe to share between threads."""
+
+    __slots__ = ("version", "events", "body")
+
+    def __init__(self, version: int, events: Tuple[FireEvent, ...]):
+        self.version = version
+        self.events = events
+        self.body = b"[" + b", ".join(event.encoded for event in events) + b"]"
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+
+class FireEventStore:
+    """Append-only ring buffer of the latest fire events.
+
+    Writers append under a lock that only they take, and publish a new
+    EventSnapshot by swapping one reference. Readers just read `snapshot`: no
+    lock, no copy, and the pre-serialized body is reused until the next append.
+    Versions keep increasing across clear() and restarts, so they double as ETags.
+    """
+
+    def __init__(self, retention: int = FIRE_EVENT_RETENTION):
+        if retention < 1:
+            raise ValueError("retention must be at least 1.")
+        self.retention = retention
+        self._events: deque = deque(maxlen=retention)
+        # Millisecond-based start so versions keep increasing across restarts
+        self._versions = itertools.count(int(time.time() * 1000))
+        self._write_lock = threading.Lock()
+        self.appended = 0
+        self.snapshot = EventSnapshot(next(self._versions), ())
+
+    def append(self, event: FireEvent) -> EventSnapshot:
+        with self._write_lock:
+            self._events.append(event)
+            self.appended += 1
+            self.snapshot = EventSnapshot(next(self._versions), tuple(self._events))
+            return self.snapshot
+
+    def clear(self) -> None:
+        with self._write_lock:
+            self._events.clear()
+            self.snapshot = EventSnapshot(next(self._versions), ())
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        return {"version": snapshot.version, "events": len(snapshot.events), "retention": self.retention,
+                "appended": self.appended}
+
+
+class CancellationToken:
+    """Set once to ask a run to stop; readers never take a lock."""
+
+    __slots__ = ("_event",)
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._event.wait(timeout)
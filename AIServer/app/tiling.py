@@ -0,0 +1,135 @@
+import os
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from .prefilter import candidate_mask
+from .scheduler import scheduler
+
+TILED_INFERENCE = os.getenv("TILED_INFERENCE", "0") == "1"
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))  # Native model input size, so tiles are not rescaled
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "128"))  # Pixels shared by neighbouring tiles
+TILED_MIN_SIDE = int(os.getenv("TILED_MIN_SIDE", "1920"))  # Frames with a shorter long side run untiled
+TILE_MERGE_THRESHOLD = float(os.getenv("TILE_MERGE_THRESHOLD", "0.6"))
+TILE_PRESCREEN = os.getenv("TILE_PRESCREEN", "1") == "1"
+PRESCREEN_SIZE = int(os.getenv("TILE_PRESCREEN_SIZE", "512"))  # Long side of the pre-screen thumbnail
+PRESCREEN_MIN_FRACTION = float(os.getenv("TILE_PRESCREEN_MIN_FRACTION", "0.002"))
+
+# Part of the detection cache namespace: results depend on the tiling setup
+TILING_SIGNATURE = (
+    f"tiled={TILE_SIZE}/{TILE_OVERLAP}/{TILED_MIN_SIDE}/{TILE_MERGE_THRESHOLD}/"
+    f"{PRESCREEN_SIZE if TILE_PRESCREEN else 0}/{PRESCREEN_MIN_FRACTION}"
+    if TILED_INFERENCE else "tiled=off"
+)
+
+
+def tile_grid(height: int, width: int, tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP) -> List[Tuple[int, int, int, int]]:
+    """(x0, y0, x1, y1) windows covering the frame; the last row/column is aligned to the edge."""
+    if overlap >= tile_size:
+        raise ValueError("Tile overlap must be smaller than the tile size.")
+    step = tile_size - overlap
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def prescreen_tiles(image: np.ndarray, tiles: List[Tuple[int, int, int, int]]) -> List[bool]:
+    """Which tiles contain enough fire/smoke-like pixels to be worth a forward pass."""
+    height, width = image.shape[:2]
+    scale = min(1.0, PRESCREEN_SIZE / max(height, width))
+    thumbnail = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    mask = candidate_mask(thumbnail)
+    # Integral image gives each tile's candidate count in O(1)
+    integral = cv2.integral(mask.astype(np.uint8))
+
+    keep = []
+    for x0, y0, x1, y1 in tiles:
+        tx0, ty0 = int(x0 * scale), int(y0 * scale)
+        tx1, ty1 = max(tx0 + 1, int(x1 * scale)), max(ty0 + 1, int(y1 * scale))
+        count = integral[ty1, tx1] - integral[ty0, tx1] - integral[ty1, tx0] + integral[ty0, tx0]
+        keep.append(count >= PRESCREEN_MIN_FRACTION * (tx1 - tx0) * (ty1 - ty0))
+    return keep
+
+
+def merge_boxes(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, threshold: float = TILE_MERGE_THRESHOLD) -> np.ndarray:
+    """Class-wise NMS on intersection-over-smaller-area; returns kept indices, best score first.
+
+    IoS rather than IoU so that a box clipped by a tile border is merged into the
+    full box found in the neighbouring tile.
+    """
+    order = np.argsort(-scores, kind="stable")
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        x0 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        y0 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        x1 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        y1 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+        ios = inter / np.maximum(np.minimum(areas[best], areas[rest]), 1e-6)
+        order = rest[(ios < threshold) | (classes[rest] != classes[best])]
+    return np.array(keep, dtype=np.int64)
+
+
+async def run_detection_tiled(
+    image: np.ndarray,
+    tile_size: int = TILE_SIZE,
+    overlap: int = TILE_OVERLAP,
+    prescreen: bool = TILE_PRESCREEN,
+) -> Dict[str, Any]:
+    """Detect on overlapping full-resolution tiles and merge back into frame coordinates.
+
+    Returns the same dict shape as run_detection.
+    """
+    height, width = image.shape[:2]
+    tiles = tile_grid(height, width, tile_size, overlap)
+    if prescreen:
+        tiles = [tile for tile, keep in zip(tiles, prescreen_tiles(image, tiles)) if keep]
+    if not tiles:
+        return {"status": "nothing detected", "detections": []}
+
+    # Crops are views; all tiles share one size so the scheduler batches them together
+    crops = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles]
+    results = await scheduler.detect_many(crops)
+
+    names, scores, boxes = [], [], []
+    for (x0, y0, _, _), result in zip(tiles, results):
+        for detection in result["detections"]:
+            names.append(detection["class"])
+            scores.append(detection["confidence"])
+            bx0, by0, bx1, by1 = detection["bbox"]
+            boxes.append((bx0 + x0, by0 + y0, bx1 + x0, by1 + y0))
+    if not names:
+        return {"status": "nothing detected", "detections": []}
+
+    boxes_np = np.asarray(boxes, dtype=np.float64)
+    _, class_ids = np.unique(names, return_inverse=True)
+    kept = merge_boxes(boxes_np, np.asarray(scores, dtype=np.float64), class_ids)
+    detections = [
+        {"class": names[i], "confidence": scores[i], "bbox": boxes_np[i].tolist()}
+        for i in kept.tolist()
+    ]
+    return {
+        "status": f"{detections[-1]['class']} detected",
+        "detections": detections
+    }
+
+
+async def detect_frame(image: np.ndarray) -> Dict[str, Any]:
+    """Detection through the shared scheduler, tiled for large frames when TILED_INFERENCE is on."""
+    if TILED_INFERENCE and max(image.shape[:2]) >= TILED_MIN_SIDE:
+        return await run_detection_tiled(image)
+    return await scheduler.detect(image)
@@ -0,0 +1,165 @@
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+TRACKER_RADIUS_METERS = float(os.getenv("TRACKER_RADIUS_METERS", "500"))  # Detections closer than this are the same fire
+TRACKER_WINDOW_SECONDS = float(os.getenv("TRACKER_WINDOW_SECONDS", "900"))  # A fire unseen for this long is closed
+TRACKER_ESCALATION_CONFIDENCE = float(os.getenv("TRACKER_ESCALATION_CONFIDENCE", "0.15"))
+
+# Higher means more severe; a smoke event that starts showing flames escalates
+CLASS_SEVERITY = {"smoke": 1, "fire": 2}
+
+METERS_PER_DEGREE = 111_320.0
+
+NEW = "new"
+ESCALATED = "escalated"
+ATTACHED = "attached"
+
+
+class TrackedFire:
+    """One fire event: every detection near its first sighting until it goes quiet."""
+
+    __slots__ = ("fire_id", "location_id", "latitude", "longitude", "cell", "first_seen", "last_seen",
+                 "detections", "severity", "confidence", "detection_class", "alert_id", "alert_created")
+
+    def __init__(self, fire_id: int, location_id: str, latitude: float, longitude: float, cell, now: float):
+        self.fire_id = fire_id
+        self.location_id = location_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.cell = cell
+        self.first_seen = now
+        self.last_seen = now
+        self.detections = 0
+        self.severity = 0
+        self.confidence = 0.0
+        self.detection_class = "unknown"
+        self.alert_id: Optional[str] = None
+        # Resolved once the alert write is queued, so escalation updates are queued after it
+        self.alert_created: Future = Future()
+
+
+def _strongest(detections: List[Dict[str, Any]]) -> Tuple[int, float, str]:
+    """(severity, confidence, class) of the most severe, then most confident detection."""
+    best = (0, 0.0, "unknown")
+    for detection in detections:
+        cls = detection.get("class", "unknown")
+        candidate = (CLASS_SEVERITY.get(cls, 0), float(detection.get("confidence", 0.0)), cls)
+        if candidate[:2] > best[:2]:
+            best = candidate
+    return best
+
+
+class FireTracker:
+    """In-memory spatio-temporal clustering of positive detections.
+
+    Fires are indexed on a grid of radius-sized cells in local metres, so a
+    lookup only compares against fires in the 3x3 block around the detection.
+    A detection joins the nearest open fire of the same forest within the
+    radius; otherwise it opens a new one. Joining a fire is "escalated" when it
+    raises the fire's class severity, or its confidence at the same severity by
+    at least escalation_confidence, and "attached" otherwise.
+    """
+
+    def __init__(self, radius_m: float = TRACKER_RADIUS_METERS, window_s: float = TRACKER_WINDOW_SECONDS,
+                 escalation_confidence: float = TRACKER_ESCALATION_CONFIDENCE):
+        self.radius_m = radius_m
+        self.window_s = window_s
+        self.escalation_confidence = escalation_confidence
+        self._cells: Dict[Tuple[int, int], Set[TrackedFire]] = defaultdict(set)
+        self._fires: Dict[int, TrackedFire] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._counters = {NEW: 0, ESCALATED: 0, ATTACHED: 0, "expired": 0, "forgotten": 0}
+
+    def _project(self, latitude: float, longitude: float) -> Tuple[float, float]:
+        """Equirectangular metres; accurate enough at the scale of one fire."""
+        y = latitude * METERS_PER_DEGREE
+        x = longitude * METERS_PER_DEGREE * math.cos(math.radians(latitude))
+        return x, y
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x // self.radius_m), int(y // self.radius_m)
+
+    def _remove(self, fire: TrackedFire) -> None:
+        """Drop a fire from both indexes. Caller holds the lock."""
+        del self._fires[fire.fire_id]
+        if fire.cell is not None:
+            self._cells[fire.cell].discard(fire)
+            if not self._cells[fire.cell]:
+                del self._cells[fire.cell]
+
+    def _expire(self, now: float) -> None:
+        """Close fires not seen within the window. Caller holds the lock."""
+        for fire in [f for f in self._fires.values() if now - f.last_seen > self.window_s]:
+            self._remove(fire)
+            self._counters["expired"] += 1
+
+    def forget(self, fire: TrackedFire) -> None:
+        """Drop a fire whose alert never landed, so the next detection near it is NEW again."""
+        with self._lock:
+            if self._fires.get(fire.fire_id) is not fire:
+                return  # Already expired or forgotten
+            self._remove(fire)
+            self._counters["forgotten"] += 1
+
+    def _nearest(self, location_id: str, x: float, y: float) -> Optional[TrackedFire]:
+        cx, cy = self._cell(x, y)
+        nearest, nearest_distance = None, self.radius_m
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for fire in self._cells.get((cx + dx, cy + dy), ()):
+                    if fire.location_id != location_id:
+                        continue
+                    fx, fy = self._project(fire.latitude, fire.longitude)
+                    distance = math.hypot(fx - x, fy - y)
+                    if distance <= nearest_distance:
+                        nearest, nearest_distance = fire, distance
+        return nearest
+
+    def observe(self, location_id: str, latitude, longitude, detections: List[Dict[str, Any]],
+                now: Optional[float] = None) -> Tuple[TrackedFire, str]:
+        """Attach a positive detection to a fire; returns the fire and NEW, ESCALATED or ATTACHED."""
+        now = time.monotonic() if now is None else now
+        severity, confidence, cls = _strongest(detections)
+        try:
+            latitude, longitude = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            latitude = longitude = None
+
+        with self._lock:
+            self._expire(now)
+            fire = None
+            if latitude is not None:
+                x, y = self._project(latitude, longitude)
+                fire = self._nearest(location_id, x, y)
+
+            if fire is None:
+                # Detections without usable coordinates are never clustered
+                cell = self._cell(x, y) if latitude is not None else None
+                fire = TrackedFire(self._next_id, location_id, latitude, longitude, cell, now)
+                self._next_id += 1
+                self._fires[fire.fire_id] = fire
+                if cell is not None:
+                    self._cells[cell].add(fire)
+                verdict = NEW
+            elif severity > fire.severity or (
+                    severity == fire.severity and confidence >= fire.confidence + self.escalation_confidence):
+                verdict = ESCALATED
+            else:
+                verdict = ATTACHED
+
+            fire.last_seen = now
+            fire.detections += 1
+            if verdict != ATTACHED:
+                fire.severity, fire.confidence, fire.detection_class = severity, confidence, cls
+            self._counters[verdict] += 1
+            return fire, verdict
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "active_fires": len(self._fires)}
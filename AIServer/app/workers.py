@@ -0,0 +1,356 @@
+import itertools
+import logging
+import multiprocessing as mp
+import multiprocessing.connection
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .metrics import record_spans
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))  # 0 = run the model in-process
+FRAME_SLOT_BYTES = int(os.getenv("INFERENCE_FRAME_SLOT_MB", "32")) * 1024 * 1024  # Fits a 4K BGR frame
+FRAME_SLOTS = int(os.getenv("INFERENCE_FRAME_SLOTS", "0"))  # 0 = 2 batches' worth per worker
+THREADS_PER_WORKER = int(os.getenv("INFERENCE_THREADS_PER_WORKER", "0"))  # 0 = split the cores evenly
+WORKER_MAX_START_FAILURES = 3  # Consecutive deaths before loading the model, after which a worker is given up on
+WORKER_POLL_SECONDS = 0.5  # How often worker liveness is checked
+WORKER_BATCH_TIMEOUT = float(os.getenv("INFERENCE_BATCH_TIMEOUT", "60"))  # A worker silent this long on one batch is killed
+WORKER_READY_TIMEOUT = float(os.getenv("INFERENCE_WORKER_READY_TIMEOUT", "300"))  # Longest wait_ready() at startup
+
+
+def _worker_main(index: int, shm_name: str, slot_bytes: int, num_threads: int, warmup_size: int, tasks, results) -> None:
+    """Inference process: load the model once, warm it up, then serve batches from the shared ring."""
+    # Pin intra-op threads before torch is imported so N workers don't oversubscribe the cores
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass  # Only the torch-based backends need it; the stub and exported engines run without
+    from app.inference import run_detection_batch
+    from app.metrics import drain_spans, keep_spans
+    keep_spans()  # Spans go back with each result; this process's own /metrics registry is never scraped
+    if warmup_size:
+        # One dummy forward pass here, so "ready" means this process will serve its first real batch at full speed
+        run_detection_batch([np.zeros((warmup_size, warmup_size, 3), dtype=np.uint8)], batch_size=1)
+    results.send(("ready", index, drain_spans()))
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, frames = task
+            try:
+                images = [
+                    np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=slot * slot_bytes)
+                    if slot is not None else array
+                    for slot, shape, dtype, array in frames
+                ]
+                output = run_detection_batch(images, batch_size=len(images))
+                del images
+                results.send(("done", task_id, (output, None, drain_spans())))
+            except Exception as e:
+                results.send(("done", task_id, (None, f"{type(e).__name__}: {e}", drain_spans())))
+    finally:
+        shm.close()
+
+
+class SharedFrameRing:
+    """Fixed-size frame slots in one shared memory block, handed out by index."""
+
+    def __init__(self, slots: int, slot_bytes: int):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+
+    def fits(self, image: np.ndarray) -> bool:
+        return image.nbytes <= self.slot_bytes
+
+    def write(self, image: np.ndarray) -> int:
+        """Copy a frame into a free slot (blocking until one is released) and return its index."""
+        slot = self._free.get()
+        view = np.ndarray(image.shape, dtype=image.dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        np.copyto(view, image)
+        del view
+        return slot
+
+    def release(self, slot: int) -> None:
+        self._free.put(slot)
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+class _Worker:
+    """One inference process, its private task queue and result pipe, and the task it is running."""
+
+    __slots__ = ("index", "process", "tasks", "results", "task_id", "ready", "start_failures")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[mp.Process] = None
+        self.tasks = None
+        self.results = None
+        self.task_id: Optional[int] = None
+        self.ready = False
+        self.start_failures = 0
+
+
+class InferenceWorkerPool:
+    """N inference processes fed from a SharedFrameRing instead of pickled ndarrays.
+
+    run_batch() is blocking and thread-safe; call it from as many threads as there
+    are workers (the scheduler does this) to keep every process busy. Each batch
+    goes to one idle worker's own queue, so when a process dies its batch fails
+    right away and the process is restarted; one that takes longer than
+    batch_timeout on a batch is killed and restarted the same way. A worker
+    that dies before loading the model WORKER_MAX_START_FAILURES times in a row
+    is given up on; once all of them are, run_batch raises instead of waiting.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = INFERENCE_WORKERS,
+        slots: int = FRAME_SLOTS,
+        slot_bytes: int = FRAME_SLOT_BYTES,
+        max_batch_size: int = 8,
+        threads_per_worker: int = THREADS_PER_WORKER,
+        batch_timeout: float = WORKER_BATCH_TIMEOUT,
+    ):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1.")
+        self.num_workers = num_workers
+        self.slots = slots or 2 * num_workers * max_batch_size
+        self.slot_bytes = slot_bytes
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        self.batch_timeout = batch_timeout
+
+        self._ring: Optional[SharedFrameRing] = None
+        self._workers: List[_Worker] = []
+        self._idle: "queue.Queue[int]" = queue.Queue()
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._start_lock = threading.Lock()
+        # Held to hand a batch to a worker and to replace a dead one, so no batch lands on a discarded queue
+        self._workers_lock = threading.Lock()
+        self._closing = False
+        self.warmup_size = 0  # Set by start(); restarted workers warm up the same way
+        self.broken: Optional[str] = None  # Set once no worker can start
+        self.restarts = 0
+
+    def _spawn(self, worker: _Worker) -> None:
+        # A fresh queue and pipe, so a batch sent to a dead process is never picked up by its replacement.
+        # Results come back on a pipe of its own rather than a shared queue: killing a worker
+        # while it writes can then only break that pipe, not a lock every worker needs.
+        worker.tasks = self._ctx.Queue()
+        worker.results, results = self._ctx.Pipe(duplex=False)
+        worker.ready = False
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.index, self._ring.shm.name, self.slot_bytes, self.threads_per_worker, self.warmup_size,
+                  worker.tasks, results),
+            name=f"inference-worker-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+        results.close()  # The child holds the write end; EOF on ours then means it exited
+
+    def start(self, warmup_size: int = 0) -> None:
+        """Spawn the workers; with warmup_size, each runs one blank frame of that size before reporting ready."""
+        with self._start_lock:
+            if self._workers:
+                return
+            self.warmup_size = warmup_size
+            # spawn, not fork: the parent may already hold threads and an event loop
+            self._ctx = mp.get_context("spawn")
+            self._ring = SharedFrameRing(self.slots, self.slot_bytes)
+            for i in range(self.num_workers):
+                worker = _Worker(i)
+                self._spawn(worker)
+                self._workers.append(worker)
+                self._idle.put(i)
+            self._collector = threading.Thread(target=self._collect_results, name="inference-results", daemon=True)
+            self._collector.start()
+            logger.info(
+                f"Started {self.num_workers} inference workers "
+                f"({self.threads_per_worker} threads each, {self.slots} x {self.slot_bytes // (1024 * 1024)} MB frame slots)"
+            )
+
+    def wait_ready(self, timeout: Optional[float] = WORKER_READY_TIMEOUT) -> None:
+        """Block until every worker still in the pool has loaded its model (and warmed it up)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.broken:
+                raise RuntimeError(f"Inference worker pool unavailable: {self.broken}")
+            live = [worker for worker in self._workers if worker.process is not None]
+            if live and all(worker.ready for worker in live):
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                ready = sum(worker.ready for worker in live)
+                raise TimeoutError(f"{ready} of {self.num_workers} inference workers ready after {timeout:.0f}s")
+            time.sleep(0.05)
+
+    def _fail(self, task_id: Optional[int], error: Exception) -> bool:
+        """Fail a pending batch; False if it had already been resolved."""
+        with self._pending_lock:
+            future = self._pending.pop(task_id, None) if task_id is not None else None
+        if future is None:
+            return False
+        future.set_exception(error)
+        return True
+
+    def _reap(self, worker: _Worker) -> None:
+        """If the worker died, fail its batch, then restart it or give up on it. Caller holds _workers_lock."""
+        if worker.process is None or worker.process.is_alive() or self._closing:
+            return
+        exitcode = worker.process.exitcode
+        self._fail(worker.task_id, RuntimeError(f"Inference worker {worker.index} exited with code {exitcode}"))
+        if worker.ready:
+            worker.start_failures = 0
+        else:
+            worker.start_failures += 1
+        if worker.start_failures >= WORKER_MAX_START_FAILURES:
+            logger.error(f"Inference worker {worker.index} failed to start {worker.start_failures} times; giving up on it")
+            worker.process = None
+            return
+        logger.warning(f"Inference worker {worker.index} exited with code {exitcode}; restarting it")
+        self.restarts += 1
+        self._spawn(worker)
+
+    def _check_workers(self) -> None:
+        """Fail the batch of every dead worker, then restart it or give up on it."""
+        for worker in self._workers:
+            if worker.process is None or worker.process.is_alive() or self._closing:
+                continue
+            with self._workers_lock:
+                self._reap(worker)
+
+        if self._workers and all(worker.process is None for worker in self._workers) and self.broken is None:
+            self.broken = "every inference worker failed to start"
+            with self._pending_lock:
+                pending, self._pending = list(self._pending.values()), {}
+            for future in pending:
+                future.set_exception(RuntimeError(self.broken))
+
+    def _collect_results(self) -> None:
+        while not self._closing:
+            pipes = {worker.results: worker for worker in self._workers if worker.results is not None}
+            for pipe in multiprocessing.connection.wait(list(pipes), timeout=WORKER_POLL_SECONDS):
+                worker = pipes[pipe]
+                try:
+                    kind, key, payload = pipe.recv()
+                except (EOFError, OSError):
+                    # The process exited; _check_workers fails its batch and replaces it
+                    pipe.close()
+                    if worker.results is pipe:
+                        worker.results = None
+                    continue
+                if kind == "ready":
+                    record_spans(payload)
+                    worker.ready = True
+                else:
+                    output, error, spans = payload
+                    record_spans(spans)
+                    with self._pending_lock:
+                        future = self._pending.pop(key, None)
+                    if future is not None:
+                        if error:
+                            future.set_exception(RuntimeError(f"Inference worker failed: {error}"))
+                        else:
+                            future.set_result(output)
+            self._check_workers()
+
+    def _acquire_worker(self) -> _Worker:
+        while True:
+            if self.broken:
+                raise RuntimeError(f"Inference worker pool unavailable: {self.broken}")
+            try:
+                worker = self._workers[self._idle.get(timeout=WORKER_POLL_SECONDS)]
+            except queue.Empty:
+                continue
+            if worker.process is None:
+                continue  # Given up on; drop it from the rotation
+            return worker
+
+    def run_batch(self, images: Sequence[np.ndarray]) -> List[Dict[str, Any]]:
+        """Run one batch on whichever worker is free and return its per-image results."""
+        self.start()
+        worker = self._acquire_worker()
+        used_slots: List[int] = []
+        frames = []
+        try:
+            for image in images:
+                image = np.ascontiguousarray(image)
+                if self._ring.fits(image):
+                    slot = self._ring.write(image)
+                    used_slots.append(slot)
+                    frames.append((slot, image.shape, image.dtype.str, None))
+                else:
+                    # Oversized frames fall back to pickling through the queue
+                    frames.append((None, image.shape, image.dtype.str, image))
+
+            task_id = next(self._task_ids)
+            future: Future = Future()
+            with self._workers_lock:
+                self._reap(worker)  # Died while idle: the batch goes to its replacement instead
+                if worker.process is None:
+                    raise RuntimeError(f"Inference worker {worker.index} was given up on")
+                with self._pending_lock:
+                    self._pending[task_id] = future
+                    worker.task_id = task_id
+                worker.tasks.put((task_id, frames))
+            # Resolves with the result, or with an error once the collector sees the worker die
+            try:
+                return future.result(timeout=self.batch_timeout)
+            except FutureTimeout:
+                if not self._fail(task_id, TimeoutError(
+                        f"Inference worker {worker.index} gave no result within {self.batch_timeout:.0f}s")):
+                    return future.result()  # Resolved just as the wait ran out
+                # Hung: kill it so its frame slots are safe to reuse; the collector restarts it
+                logger.error(f"Inference worker {worker.index} timed out on a batch; killing it")
+                with self._workers_lock:
+                    if worker.process is not None:
+                        worker.process.kill()
+                        worker.process.join(timeout=5)
+                        self._reap(worker)
+                return future.result()
+        finally:
+            # Safe to reuse the slots: the worker has finished with them or is dead
+            for slot in used_slots:
+                self._ring.release(slot)
+            worker.task_id = None
+            self._idle.put(worker.index)
+
+    def close(self) -> None:
+        with self._start_lock:
+            if not self._workers:
+                return
+            self._closing = True
+            live = [worker for worker in self._workers if worker.process is not None]
+            for worker in live:
+                worker.tasks.put(None)
+            for worker in live:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+            self._collector.join(timeout=WORKER_POLL_SECONDS * 2)
+            for worker in self._workers:
+                if worker.results is not None:
+                    worker.results.close()
+            self._ring.close()
+            self._workers = []
@@ -0,0 +1,126 @@
+"""Per-frame decode latency and peak memory: full decode vs the reduced-scale path.
+
+Decodes every JPEG in a folder once per mode, each mode in its own child
+process so peak RSS is measured independently. "full" is the old
+cv2.imdecode(IMREAD_COLOR) path; "reduced" is app.decoding.decode_for_model,
+which decodes at 1/2-1/8 scale into pooled model-sized buffers.
+
+Usage (from the AIServer directory):
+    python -m benchmarks.bench_decode --folder path/to/drone/jpegs [--repeat 3]
+    python -m benchmarks.bench_decode --synthetic 20 [--width 4000 --height 3000]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _peak_rss_mb():
+    try:
+        # VmHWM belongs to this process image; ru_maxrss survives exec and would
+        # report the parent's peak in a freshly spawned child
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _run_mode(mode, paths, repeat, queue):
+    import cv2
+    import numpy as np
+    from app.decoding import decode_for_model, frame_pool
+
+    payloads = [Path(p).read_bytes() for p in paths]
+    baseline_rss = _peak_rss_mb()
+    latencies = []
+    for _ in range(repeat):
+        for data in payloads:
+            start = time.perf_counter()
+            if mode == "full":
+                image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            else:
+                decoded = decode_for_model(data)
+                image = decoded.image
+            latencies.append(time.perf_counter() - start)
+            if mode != "full":
+                decoded.release()
+            del image
+
+    ordered = sorted(latencies)
+    queue.put({
+        "mode": mode,
+        "frames": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 2),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 2),
+        "peak_rss_mb": _peak_rss_mb(),
+        "rss_growth_mb": round(_peak_rss_mb() - baseline_rss, 1),
+        "pool": frame_pool.stats() if mode != "full" else None,
+    })
+
+
+def _synthetic_corpus(count, width, height):
+    import cv2
+    import numpy as np
+
+    folder = Path(tempfile.mkdtemp(prefix="forest-eye-decode-"))
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        # Smooth gradients plus noise compress like aerial imagery, unlike pure noise
+        base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        image = np.clip(base + rng.normal(0, 20, (height, width, 3)), 0, 255).astype(np.uint8)
+        cv2.imwrite(str(folder / f"frame-{i:03d}.jpg"), image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return folder
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--folder", help="Folder of sample drone JPEGs")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate this many JPEGs instead of --folder")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        folder = _synthetic_corpus(args.synthetic, args.width, args.height)
+    elif args.folder:
+        folder = Path(args.folder)
+    else:
+        parser.error("Pass --folder or --synthetic.")
+    paths = sorted(str(p) for p in folder.iterdir() if p.suffix.lower() in (".jpg", ".jpeg"))
+    if not paths:
+        parser.error(f"No JPEGs in {folder}.")
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for mode in ("full", "reduced"):
+        queue = context.Queue()
+        process = context.Process(target=_run_mode, args=(mode, paths, args.repeat, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+
+    full, reduced = results
+    print(json.dumps({
+        "images": len(paths),
+        "folder": os.fspath(folder),
+        "results": results,
+        "speedup": round(full["mean_ms"] / reduced["mean_ms"], 2),
+        "peak_rss_saved_mb": round(full["peak_rss_mb"] - reduced["peak_rss_mb"], 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
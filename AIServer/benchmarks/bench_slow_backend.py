@@ -0,0 +1,107 @@
+"""Latency of /alerts and /fire-events while Firestore or Twilio is slow.
+
+Runs the FastAPI app in-process against the in-memory Firestore stand-in and a
+fake SMS provider, first with instant backends and then with artificial
+latency, and prints p50/p95/max per endpoint for both runs. With non-blocking
+handlers, /fire-events latency should not move when the backends slow down.
+
+Usage (from the AIServer directory):
+    python -m benchmarks.bench_slow_backend [--requests 200] [--concurrency 20] [--slow 0.5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Local stand-ins must be selected before the app modules are imported
+os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+os.environ.setdefault("STORAGE_LOCAL_DIR", tempfile.mkdtemp(prefix="forest-eye-bench-"))
+
+import httpx  # noqa: E402
+
+from app import alerts  # noqa: E402
+from app.notifications import FakeSMSProvider, SMSDispatcher  # noqa: E402
+from app.main import app  # noqa: E402
+from firebase.config import async_db, db  # noqa: E402
+
+
+def seed(forests=20, alerts_per_forest=50, stations_per_forest=5):
+    now = datetime.utcnow()
+    for f in range(forests):
+        forest_ref = db.collection("forestLocations").document(f"forest-{f}")
+        forest_ref.set({"forest_name": f"Forest {f}"})
+        for s in range(stations_per_forest):
+            forest_ref.collection("firestations").document(f"station-{s}").set(
+                {"station_name": f"Station {s}", "phone": "+10000000000"}
+            )
+        for a in range(alerts_per_forest):
+            db.collection("alerts").document(f"alert-{f}-{a}").set({
+                "forest_name": f"Forest {f}",
+                "forest_location_id": f"forest-{f}",
+                "image_location": f"https://example/o/{f}-{a}.jpg",
+                "detection_status": "active",
+                "timestamp": now - timedelta(seconds=f * alerts_per_forest + a),
+            })
+
+
+def _summary(latencies):
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+async def _run(client, requests, concurrency):
+    latencies = {"/alerts/": [], "/fire-events": [], "/alerts/send-alert-sms": []}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(i):
+        async with semaphore:
+            started = time.perf_counter()
+            if i % 3 == 0:
+                path = "/alerts/send-alert-sms"
+                response = await client.post(path, json={"alert_id": f"a{i}", "station_name": "S", "forest_name": "F"})
+            elif i % 3 == 1:
+                path = "/alerts/"
+                response = await client.get(path, params={"forest_id": f"forest-{i % 20}"})
+            else:
+                path = "/fire-events"
+                response = await client.get(path)
+            response.raise_for_status()
+            latencies[path].append(time.perf_counter() - started)
+
+    await asyncio.gather(*(call(i) for i in range(requests)))
+    return {path: _summary(values) for path, values in latencies.items() if values}
+
+
+async def main(requests, concurrency, slow):
+    seed()
+    provider = FakeSMSProvider()
+    alerts.sms_dispatcher = SMSDispatcher(provider, coalesce_window=0.1, rate_per_second=1000, burst=1000)
+    alerts.your_phone = "+10000000000"
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        results = {"fast_backends": await _run(client, requests, concurrency)}
+        async_db.latency = slow
+        provider.delay = slow
+        alerts._stations_cache.clear()
+        results["slow_backends"] = await _run(client, requests, concurrency)
+    results["config"] = {"requests": requests, "concurrency": concurrency, "slow_seconds": slow}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--slow", type=float, default=0.5, help="Seconds of latency added to Firestore and Twilio")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.slow))
@@ -0,0 +1,102 @@
+"""Skip rate and recall impact of the detection pre-filter on a labelled sample set.
+
+Expects a folder with one sub-folder per label; "negative" (or "none") holds
+frames without fire or smoke, every other sub-folder (e.g. "fire", "smoke")
+holds positives:
+
+    samples/
+        fire/*.jpg
+        smoke/*.jpg
+        negative/*.jpg
+
+Frames are decoded the way the simulation decodes them and screened by
+FramePrefilter. Recall is the share of labelled positives that still reach the
+detector. With --detector the YOLO model also runs on every frame, and the
+report adds how many of its positive frames the pre-filter would have dropped.
+With --sequential each sub-folder is treated as one drone's frames in file
+order, so the frame-difference check is exercised too.
+
+Usage (from the AIServer directory):
+    python -m benchmarks.eval_prefilter --samples path/to/samples [--detector] [--sequential]
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from app.decoding import decode_for_model
+from app.prefilter import PREFILTER_DIFF_THRESHOLD, PREFILTER_MIN_FRACTION, FramePrefilter
+
+NEGATIVE_LABELS = {"negative", "none"}
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", required=True, help="Folder with one sub-folder per label")
+    parser.add_argument("--min-fraction", type=float, default=PREFILTER_MIN_FRACTION)
+    parser.add_argument("--diff-threshold", type=float, default=PREFILTER_DIFF_THRESHOLD)
+    parser.add_argument("--detector", action="store_true", help="Also run YOLO on every frame")
+    parser.add_argument("--sequential", action="store_true", help="Treat each sub-folder as one drone's frame sequence")
+    args = parser.parse_args()
+
+    run_detection = None
+    if args.detector:
+        from app.inference import run_detection
+
+    prefilter = FramePrefilter(min_fraction=args.min_fraction, diff_threshold=args.diff_threshold)
+    counts = {"positives": 0, "positives_passed": 0, "negatives": 0, "negatives_skipped": 0,
+              "detector_positives": 0, "detector_positives_dropped": 0}
+    missed = []
+    screen_time = 0.0
+
+    for label_dir in sorted(p for p in Path(args.samples).iterdir() if p.is_dir()):
+        positive = label_dir.name.lower() not in NEGATIVE_LABELS
+        key = label_dir.name if args.sequential else None
+        for path in sorted(p for p in label_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES):
+            decoded = decode_for_model(path.read_bytes())
+            if decoded is None:
+                continue
+            start = time.perf_counter()
+            shortcut, signature = prefilter.screen(key, decoded.image)
+            screen_time += time.perf_counter() - start
+            passed = shortcut is None
+
+            if run_detection is not None:
+                result = run_detection(decoded.image)
+                if result["status"] != "nothing detected":
+                    counts["detector_positives"] += 1
+                    counts["detector_positives_dropped"] += not passed
+                prefilter.remember(key, signature, shortcut or result)
+            elif shortcut is None:
+                # Without the model, assume the detector agrees with the label
+                prefilter.remember(key, signature, {"status": "labelled", "detections": []} if positive
+                                   else {"status": "nothing detected", "detections": []})
+
+            if positive:
+                counts["positives"] += 1
+                counts["positives_passed"] += passed
+                if not passed:
+                    missed.append(str(path))
+            else:
+                counts["negatives"] += 1
+                counts["negatives_skipped"] += not passed
+            decoded.release()
+
+    stats = prefilter.stats()
+    report = {
+        **counts,
+        "skip_rate": stats["skip_rate"],
+        "label_recall": round(counts["positives_passed"] / counts["positives"], 4) if counts["positives"] else None,
+        "negatives_skip_rate": round(counts["negatives_skipped"] / counts["negatives"], 4) if counts["negatives"] else None,
+        "mean_screen_ms": round(screen_time / stats["frames"] * 1000, 3) if stats["frames"] else None,
+        "prefilter": stats,
+        "missed_positives": missed,
+    }
+    if run_detection is not None and counts["detector_positives"]:
+        report["detector_recall"] = round(1 - counts["detector_positives_dropped"] / counts["detector_positives"], 4)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
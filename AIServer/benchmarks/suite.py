@@ -0,0 +1,366 @@
+"""End-to-end benchmark suite on local stand-ins, with regression thresholds.
+
+Everything runs in-process against the in-memory Firestore, a directory-backed
+Storage bucket filled with a synthetic JPEG corpus, and the "stub" inference
+backend (a sleep-based model stand-in that finds the orange "fires" painted
+into the corpus). Measured:
+
+    decode       load_image_from_url per frame
+    detection    run_detection_batch at several batch sizes, run_detection from several threads
+    catalogue    get_valid_images_from_location, cold and warm
+    endpoints    /alerts and /fire-events under concurrent load
+    simulation   a timed simulate_fire_detection run
+
+Results are written as JSON. The run fails (exit code 1) if a metric breaks
+its limit in benchmarks/thresholds.json or, with --baseline, regresses by
+more than --tolerance against an earlier results file. The limits are set
+for the default corpus and the stub backend; pass --backend to benchmark real
+weights instead (with --thresholds of your own).
+
+Usage (from the AIServer directory):
+    python -m benchmarks.suite [--output results.json] [--baseline old.json] [--only decode,detection]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(__file__), "thresholds.json")
+SECTIONS = ("decode", "detection", "catalogue", "endpoints", "simulation")
+
+
+def _configure_environment(backend):
+    """Select the local stand-ins; must run before any app or firebase module is imported."""
+    os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+    os.environ.setdefault("STORAGE_LOCAL_DIR", tempfile.mkdtemp(prefix="forest-eye-suite-"))
+    os.environ.setdefault("SMS_PROVIDER", "fake")
+    os.environ["INFERENCE_BACKEND"] = backend
+    # Measure the hot path itself, not the caches in front of it
+    os.environ.setdefault("BLOB_CACHE_DIR", "")
+    os.environ.setdefault("DETECTION_CACHE_MB", "0")
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Keep stray writes to sys.stdout by the code under test out of the JSON report; log records are not affected."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def _summary(latencies):
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def _fire_jpeg(rng, width, height, fire):
+    import cv2
+    import numpy as np
+
+    # Forest-green canopy with texture, optionally with one orange fire blob
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = (40, 110, 50)
+    image += rng.integers(0, 30, image.shape, dtype=np.uint8)
+    if fire:
+        center = (int(rng.integers(width // 8, width * 7 // 8)), int(rng.integers(height // 8, height * 7 // 8)))
+        cv2.circle(image, center, max(8, width // 40), (0, 120, 255), -1)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+
+def build_corpus(args):
+    """Synthetic forests, drones, image documents and alerts; returns every image URL."""
+    import numpy as np
+    from firebase.config import bucket, db
+
+    rng = np.random.default_rng(args.seed)
+    urls = []
+    now = datetime.utcnow()
+    for f in range(args.locations):
+        location_id = f"forest-{f}"
+        forest_ref = db.collection("forestLocations").document(location_id)
+        forest_ref.set({"forest_name": f"Forest {f}"})
+        for s in range(3):
+            forest_ref.collection("firestations").document(f"station-{s}").set(
+                {"station_name": f"Station {s}", "phone": "+10000000000"}
+            )
+        for d in range(args.drones):
+            drone_ref = forest_ref.collection("drones").document(f"drone-{d}")
+            drone_ref.set({"name": f"Drone {d}"})
+            for i in range(args.images):
+                path = f"drones/{location_id}/drone-{d}/{i:04d}.jpg"
+                bucket.blob(path).upload_from_string(
+                    _fire_jpeg(rng, args.width, args.height, rng.random() < args.fire_ratio)
+                )
+                url = f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/{urllib.parse.quote(path, safe='')}?alt=media"
+                drone_ref.collection("images").document(f"image-{i:04d}").set({
+                    "image_url": url,
+                    "latitude": 40.0 + f * 0.5 + float(rng.random()) * 0.05,
+                    "longitude": -3.0 + d * 0.01 + float(rng.random()) * 0.05,
+                    "filename": f"{i:04d}.jpg",
+                    "updated_at": now,
+                })
+                urls.append(url)
+        for a in range(args.alerts):
+            db.collection("alerts").document(f"alert-{f}-{a}").set({
+                "forest_name": f"Forest {f}",
+                "forest_location_id": location_id,
+                "image_location": urls[-1],
+                "detection_status": "active",
+                "timestamp": now - timedelta(seconds=f * args.alerts + a),
+            })
+    return urls
+
+
+def bench_decode(args, urls):
+    from firebase.db_operations import load_image_from_url
+
+    sample = urls[:args.frames]
+    latencies = []
+    for url in sample:
+        start = time.perf_counter()
+        image = load_image_from_url(url)
+        latencies.append(time.perf_counter() - start)
+        if image is None:
+            raise RuntimeError(f"Could not decode {url}")
+    return {f"decode.{k}": v for k, v in _summary(latencies).items()}
+
+
+def bench_detection(args, urls):
+    from app.decoding import decode_for_model
+    from firebase.db_operations import download_image_bytes
+    from app.inference import run_detection, run_detection_batch
+
+    frames = [decode_for_model(download_image_bytes(url)).image for url in urls[:args.frames]]
+    metrics = {}
+    with _quiet():
+        run_detection(frames[0])  # Warm-up
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            run_detection_batch(frames, batch_size)
+            elapsed = time.perf_counter() - start
+            metrics[f"detection.batch_{batch_size}.fps"] = round(len(frames) / elapsed, 2)
+        for threads in args.threads:
+            latencies = []
+
+            def timed(frame):
+                start = time.perf_counter()
+                run_detection(frame)
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                list(pool.map(timed, frames))
+            elapsed = time.perf_counter() - start
+            metrics[f"detection.threads_{threads}.fps"] = round(len(frames) / elapsed, 2)
+            metrics[f"detection.threads_{threads}.p95_ms"] = _summary(latencies)["p95_ms"]
+    return metrics
+
+
+def bench_catalogue(args, urls):
+    from firebase.catalogue import ImageCatalogue
+    from firebase.config import db
+    from firebase.db_operations import get_valid_images_from_location
+
+    locations = [f"forest-{f}" for f in range(args.locations)]
+    cold, warm = [], []
+    for location_id in locations:
+        catalogue = ImageCatalogue(db)  # Fresh index, so every location is a full scan
+        start = time.perf_counter()
+        images = catalogue.images(location_id)
+        cold.append(time.perf_counter() - start)
+        if len(images) != args.drones * args.images:
+            raise RuntimeError(f"{location_id}: expected {args.drones * args.images} images, got {len(images)}")
+    for _ in range(5):
+        for location_id in locations:
+            start = time.perf_counter()
+            get_valid_images_from_location(location_id)
+            warm.append(time.perf_counter() - start)
+    return {
+        "catalogue.cold_p50_ms": _summary(cold)["p50_ms"],
+        "catalogue.warm_p50_ms": _summary(warm)["p50_ms"],
+    }
+
+
+async def _load(client, path, requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{path} returned {response.status_code}")
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+
+def bench_endpoints(args, urls):
+    import httpx
+    from app.main import app
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.get("/alerts/")  # Warm the station cache and routes
+            alerts = await _load(client, "/alerts/", args.requests, args.concurrency)
+            fire_events = await _load(client, "/fire-events", args.requests, args.concurrency)
+        return alerts, fire_events
+
+    alerts, fire_events = asyncio.run(run())
+    metrics = {f"alerts.{k}": v for k, v in _summary(alerts).items()}
+    metrics.update({f"fire_events.{k}": v for k, v in _summary(fire_events).items()})
+    return metrics
+
+
+def bench_simulation(args, urls):
+    from app import simulation
+
+    simulation.SCAN_MIN_INTERVAL = 0  # Rescan drones back to back
+
+    async def run():
+        task = asyncio.ensure_future(simulation.simulate_fire_detection())
+        await asyncio.sleep(args.duration)
+        simulation.stop_simulation()  # Cancels the run; there is no thread to join here
+        await task
+
+    start = time.perf_counter()
+    with _quiet():
+        asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    stats = simulation.simulation_stats()
+    stages = stats.get("stages", {})
+    infer = stages.get("infer", {})
+    return {
+        "simulation.frames_per_s": round(stats.get("source_emitted", 0) / elapsed, 2),
+        "simulation.infer_avg_ms": infer.get("avg_latency_ms") or 0.0,
+        "simulation.errors": sum(stage.get("errors", 0) for stage in stages.values()),
+        "simulation.coverage_s": stats.get("scan", {}).get("coverage_seconds") or 0.0,
+    }
+
+
+def _lower_is_better(metric):
+    return not (metric.endswith("fps") or metric.endswith("per_s"))
+
+
+def check(metrics, thresholds, baseline=None, tolerance=0.2):
+    """Human-readable failures: broken absolute limits, then regressions against the baseline."""
+    failures = []
+    for metric, limit in thresholds.items():
+        if metric not in metrics:
+            continue
+        value = metrics[metric]
+        if "max" in limit and value > limit["max"]:
+            failures.append(f"{metric} = {value} exceeds max {limit['max']}")
+        if "min" in limit and value < limit["min"]:
+            failures.append(f"{metric} = {value} below min {limit['min']}")
+    for metric, previous in (baseline or {}).items():
+        value = metrics.get(metric)
+        if value is None or not previous:
+            continue
+        change = (value - previous) / abs(previous)
+        if (change > tolerance) if _lower_is_better(metric) else (change < -tolerance):
+            failures.append(f"{metric} = {value} vs baseline {previous} ({change:+.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default="cache/benchmarks/latest.json")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression vs the baseline")
+    parser.add_argument("--only", help=f"Comma-separated subset of {','.join(SECTIONS)}")
+    parser.add_argument("--backend", default="stub", help="Inference backend; 'stub' needs no weights")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--locations", type=int, default=4)
+    parser.add_argument("--drones", type=int, default=3)
+    parser.add_argument("--images", type=int, default=20, help="Images per drone")
+    parser.add_argument("--alerts", type=int, default=100, help="Alerts per location")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fire-ratio", type=float, default=0.1)
+    parser.add_argument("--frames", type=int, default=48, help="Frames for the decode and detection sections")
+    parser.add_argument("--batch-sizes", type=lambda v: [int(x) for x in v.split(",")], default=[1, 4, 8])
+    parser.add_argument("--threads", type=lambda v: [int(x) for x in v.split(",")], default=[1, 4])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds of simulation")
+    args = parser.parse_args()
+
+    sections = args.only.split(",") if args.only else list(SECTIONS)
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"Unknown sections: {', '.join(sorted(unknown))}")
+
+    _configure_environment(args.backend)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    random.seed(args.seed)
+    with _quiet():
+        urls = build_corpus(args)
+
+    benches = {
+        "decode": bench_decode,
+        "detection": bench_detection,
+        "catalogue": bench_catalogue,
+        "endpoints": bench_endpoints,
+        "simulation": bench_simulation,
+    }
+    metrics, timings = {}, {}
+    for section in sections:
+        start = time.perf_counter()
+        metrics.update(benches[section](args, urls))
+        timings[section] = round(time.perf_counter() - start, 2)
+        print(f"{section}: done in {timings[section]}s", file=sys.stderr)
+
+    with open(args.thresholds) as f:
+        thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["metrics"]
+    failures = check(metrics, thresholds, baseline, args.tolerance)
+
+    results = {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "backend": args.backend,
+        },
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "thresholds", "baseline")},
+        "section_seconds": timings,
+        "metrics": metrics,
+        "failures": failures,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(json.dumps(metrics, indent=2))
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
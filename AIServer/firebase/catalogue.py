@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Tuple
+
+from app.metrics import span
+from .config import db
+
+REQUIRED_FIELDS = ('image_url', 'latitude', 'longitude')
+# Projection for catalogue reads; everything else in an image document is never used here
+PROJECTED_FIELDS = list(REQUIRED_FIELDS) + ['filename', 'updated_at', 'alert_status']
+PAGE_SIZE = int(os.getenv("CATALOGUE_PAGE_SIZE", "500"))
+REFRESH_SECONDS = float(os.getenv("CATALOGUE_REFRESH_SECONDS", "60"))
+VALIDATION_LOG_SIZE = int(os.getenv("CATALOGUE_VALIDATION_LOG_SIZE", "1000"))
+
+
+class ImageCatalogue:
+    """In-memory index of valid images per location, across all of its drones.
+
+    A location is fully scanned (paginated, projected) the first time it is
+    requested. After that it is kept current by incremental queries on
+    `updated_at` newer than the last seen value, run at most every
+    REFRESH_SECONDS. Documents failing validation go to a bounded ring buffer.
+    """
+
+    def __init__(self, db, page_size: int = PAGE_SIZE, refresh_seconds: float = REFRESH_SECONDS):
+        self.db = db
+        self.page_size = page_size
+        self.refresh_seconds = refresh_seconds
+        self.validation_failures = deque(maxlen=VALIDATION_LOG_SIZE)
+
+        self._lock = threading.RLock()
+        self._images: Dict[str, Dict[Tuple[str, str], Dict[str, Any]]] = {}  # location -> (drone, doc) -> image
+        self._lists: Dict[str, List[Dict[str, Any]]] = {}  # Immutable snapshot handed to readers
+        self._cursors: Dict[Tuple[str, str], Any] = {}  # (location, drone) -> newest updated_at seen
+        self._drones: Dict[str, set] = {}  # location -> drones already scanned
+        self._refreshed_at: Dict[str, float] = {}
+        # mark()s made while a location's documents are being read, reapplied over what the read returns
+        self._reads: Dict[str, int] = {}  # location -> loads/refreshes in flight
+        self._marks: Dict[str, Dict[Tuple[str, str], Dict[str, Any]]] = {}
+
+    def _drones_ref(self, location_id):
+        return self.db.collection("forestLocations").document(str(location_id)).collection("drones")
+
+    def _drone_ids(self, location_id) -> List[str]:
+        # Empty projection: we only need the document ids
+        return [doc.id for doc in self._drones_ref(location_id).select([]).stream()]
+
+    def _paginate(self, query, order_field="__name__"):
+        query = query.order_by(order_field).limit(self.page_size)
+        last = None
+        while True:
+            page = list((query.start_after(last) if last is not None else query).stream())
+            yield from page
+            if len(page) < self.page_size:
+                return
+            last = page[-1]
+
+    def _apply(self, location_id, drone_id, doc_id, data) -> None:
+        """Insert, replace or drop one image document. Caller holds the lock."""
+        images = self._images.setdefault(location_id, {})
+        key = (drone_id, doc_id)
+        updated_at = data.get('updated_at')
+        if updated_at is not None:
+            cursor = self._cursors.get((location_id, drone_id))
+            if cursor is None or updated_at > cursor:
+                self._cursors[(location_id, drone_id)] = updated_at
+
+        missing_fields = [k for k in REQUIRED_FIELDS if k not in data]
+        if missing_fields:
+            images.pop(key, None)
+            self.validation_failures.append({
+                'location_id': location_id,
+                'drone_id': drone_id,
+                'filename': data.get('filename', 'unknown'),
+                'missing_fields': missing_fields
+            })
+            return
+
+        images[key] = {
+            'image_url': data['image_url'],
+            'latitude': data['latitude'],
+            'longitude': data['longitude'],
+            'original_data': data,
+            'drone_id': drone_id,
+            'image_doc_id': doc_id
+        }
+
+    def _merge(self, location_id, key, fields) -> None:
+        """Replace an image with one carrying the merged fields. Caller holds the lock."""
+        images = self._images.get(location_id, {})
+        image = images.get(key)
+        if image is not None:
+            # Replace rather than mutate: readers may still hold the previous list
+            images[key] = {**image, "original_data": {**image["original_data"], **fields}}
+
+    def _begin_read(self, location_id) -> None:
+        with self._lock:
+            self._reads[location_id] = self._reads.get(location_id, 0) + 1
+            self._marks.setdefault(location_id, {})
+
+    def _end_read(self, location_id) -> None:
+        with self._lock:
+            self._reads[location_id] -= 1
+            if not self._reads[location_id]:
+                del self._reads[location_id]
+                del self._marks[location_id]
+
+    def _reapply_marks(self, location_id) -> None:
+        """Caller holds the lock."""
+        for key, fields in self._marks.get(location_id, {}).items():
+            self._merge(location_id, key, fields)
+
+    def _publish(self, location_id) -> None:
+        self._lists[location_id] = list(self._images.get(location_id, {}).values())
+
+    def _fetch(self, query, order_field="__name__") -> List[Tuple[str, Dict[str, Any]]]:
+        return [(doc.id, doc.to_dict()) for doc in self._paginate(query, order_field)]
+
+    @span("firestore.catalogue_load")
+    def _load(self, location_id) -> None:
+        # Read every page first; the lock is only held to swap the results in
+        self._begin_read(location_id)
+        try:
+            drones_ref = self._drones_ref(location_id)
+            fetched = [
+                (drone_id, self._fetch(drones_ref.document(drone_id).collection("images").select(PROJECTED_FIELDS)))
+                for drone_id in self._drone_ids(location_id)
+            ]
+            with self._lock:
+                self._images[location_id] = {}
+                self._drones[location_id] = set()
+                for drone_id, docs in fetched:
+                    for doc_id, data in docs:
+                        self._apply(location_id, drone_id, doc_id, data)
+                    self._drones[location_id].add(drone_id)
+                self._reapply_marks(location_id)
+                self._publish(location_id)
+                self._refreshed_at[location_id] = time.monotonic()
+        finally:
+            self._end_read(location_id)
+
+    @span("firestore.catalogue_refresh")
+    def refresh(self, location_id) -> None:
+        """Pull only documents whose updated_at moved past the last seen value, plus new drones."""
+        self._begin_read(location_id)
+        try:
+            drones_ref = self._drones_ref(location_id)
+            drone_ids = self._drone_ids(location_id)
+            with self._lock:
+                known_drones = set(self._drones.get(location_id, ()))
+                cursors = {drone_id: self._cursors.get((location_id, drone_id)) for drone_id in drone_ids}
+
+            fetched = []
+            for drone_id in drone_ids:
+                images_ref = drones_ref.document(drone_id).collection("images").select(PROJECTED_FIELDS)
+                cursor = cursors[drone_id]
+                if drone_id not in known_drones:
+                    query, order_field = images_ref, "__name__"  # New drone: one full scan
+                elif cursor is not None:
+                    query, order_field = images_ref.where("updated_at", ">", cursor), "updated_at"
+                else:
+                    # None of this drone's images carry updated_at, so there is nothing to diff against
+                    continue
+                fetched.append((drone_id, self._fetch(query, order_field)))
+
+            with self._lock:
+                drones = self._drones.setdefault(location_id, set())
+                for drone_id, docs in fetched:
+                    for doc_id, data in docs:
+                        self._apply(location_id, drone_id, doc_id, data)
+                    drones.add(drone_id)
+                self._reapply_marks(location_id)
+                self._publish(location_id)
+                self._refreshed_at[location_id] = time.monotonic()
+        finally:
+            self._end_read(location_id)
+
+    def images(self, location_id) -> List[Dict[str, Any]]:
+        """Valid images of a location across all drones; do not mutate the returned list."""
+        location_id = str(location_id)
+        refreshed_at = self._refreshed_at.get(location_id)
+        if refreshed_at is None:
+            self._load(location_id)
+        elif time.monotonic() - refreshed_at > self.refresh_seconds:
+            self.refresh(location_id)
+        return self._lists.get(location_id, [])
+
+    def mark(self, location_id, drone_id, doc_id, fields: Dict[str, Any]) -> None:
+        """Merge fields this process just wrote (e.g. alert_status) into a cached image.
+
+        Such writes carry no updated_at, so refresh() would never pull them back.
+        A load or refresh reading the location at the same time keeps the mark too.
+        """
+        location_id = str(location_id)
+        key = (drone_id, doc_id)
+        with self._lock:
+            marks = self._marks.get(location_id)
+            if marks is not None:
+                marks[key] = {**marks.get(key, {}), **fields}
+            if key in self._images.get(location_id, {}):
+                self._merge(location_id, key, fields)
+                self._publish(location_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "locations": len(self._lists),
+                "images": sum(len(images) for images in self._lists.values()),
+                "validation_failures": len(self.validation_failures),
+            }
+
+
+catalogue = ImageCatalogue(db)
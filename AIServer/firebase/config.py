@@ -1,12 +1,95 @@
-from firebase_admin import initialize_app, credentials
-from firebase_admin import firestore, storage
 import os
+import threading
+from typing import Any, Callable, Dict
 
-# Initialize Firebase
-cred = credentials.Certificate("firebase/serviceAccountKey.json")
-firebase_app = initialize_app(cred, {
-    'storageBucket': 'forestfire-47ced.firebasestorage.app'
-})
+from .local import AsyncInMemoryFirestore, InMemoryFirestore, LocalBucket
 
-db = firestore.client()
-bucket = storage.bucket()
\ No newline at end of file
+# Local stand-ins for tests, benchmarks and offline runs
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR")  # Serve Storage objects from this directory
+USE_MEMORY_FIRESTORE = os.getenv("FIRESTORE_BACKEND", "firebase") == "memory"
+SERVICE_ACCOUNT_FILE = os.getenv("FIREBASE_SERVICE_ACCOUNT", "firebase/serviceAccountKey.json")
+STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET", "forestfire-47ced.firebasestorage.app")
+
+# Nothing below runs at import: the SDK, credentials and gRPC channels are set up
+# on first use, which keeps imports fast and lets a preloading server fork safely.
+_clients: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+
+def _client(name: str, factory: Callable[[], Any]) -> Any:
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def get_firebase_app():
+    """The initialized Firebase app, or None when both services are replaced locally."""
+    def initialize():
+        if USE_MEMORY_FIRESTORE and STORAGE_LOCAL_DIR:
+            return False
+        from firebase_admin import credentials, initialize_app
+        cred = credentials.Certificate(SERVICE_ACCOUNT_FILE)
+        return initialize_app(cred, {
+            'storageBucket': STORAGE_BUCKET
+        })
+    return _client("app", initialize) or None
+
+
+def get_db():
+    def create():
+        if USE_MEMORY_FIRESTORE:
+            return InMemoryFirestore()
+        from firebase_admin import firestore
+        get_firebase_app()
+        return firestore.client()
+    return _client("db", create)
+
+
+def get_bucket():
+    def create():
+        if STORAGE_LOCAL_DIR:
+            return LocalBucket(STORAGE_LOCAL_DIR)
+        from firebase_admin import storage
+        get_firebase_app()
+        return storage.bucket()
+    return _client("bucket", create)
+
+
+def get_async_db():
+    """Async client for the FastAPI handlers, so Firestore calls never block the event loop."""
+    def create():
+        if USE_MEMORY_FIRESTORE:
+            return AsyncInMemoryFirestore(get_db())
+        from firebase_admin import firestore_async
+        get_firebase_app()
+        return firestore_async.client()
+    return _client("async_db", create)
+
+
+class _LazyClient:
+    """Module-level handle that builds the real client on first attribute access."""
+
+    def __init__(self, getter: Callable[[], Any]):
+        object.__setattr__(self, "_getter", getter)
+
+    def __getattr__(self, name):
+        return getattr(self._getter(), name)
+
+    def __setattr__(self, name, value):
+        # e.g. benchmarks injecting latency into the client
+        setattr(self._getter(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._getter(), name)
+
+    def __repr__(self):
+        return f"<lazy {self._getter.__name__}()>"
+
+
+db = _LazyClient(get_db)
+bucket = _LazyClient(get_bucket)
+async_db = _LazyClient(get_async_db)
@@ -1,65 +1,63 @@
-import random
+import logging
 import cv2
 import numpy as np
-import urllib.parse
-from .config import db, bucket
+from app.metrics import span
+from .catalogue import catalogue
+from .downloader import downloader
 
-missing_fields_log = []
+logger = logging.getLogger(__name__)
 
-def get_valid_images_from_location(location_id):
-    """Retrieve all valid images with necessary fields from a forest location."""
-    try:
-        drones_ref = db.collection("forestLocations").document(str(location_id)).collection("drones")
-        drones = [doc.id for doc in drones_ref.stream()]
-        if not drones:
-            print(f"No drones found for location {location_id}")
-            return []
-
-        selected_drone = drones[0]
-        images_ref = drones_ref.document(selected_drone).collection("images")
-
-        valid_images = []
-        for doc in images_ref.stream():
-            data = doc.to_dict()
-            missing_fields = [k for k in ('image_url', 'latitude', 'longitude') if k not in data]
-            if missing_fields:
-                missing_fields_log.append({
-                    'filename': data.get('filename', 'unknown'),
-                    'missing_fields': missing_fields
-                })
-                print(f"⚠️ Skipping image due to missing fields: {', '.join(missing_fields)} in image {data.get('filename', 'unknown')}")
-            else:
-                valid_images.append({
-                    'image_url': data['image_url'],
-                    'latitude': data['latitude'],
-                    'longitude': data['longitude'],
-                    'original_data': data,
-                    'drone_id': selected_drone,
-                    'image_doc_id': doc.id  # 🔥 Add this
-                })
+# Bounded ring buffer of images skipped for missing fields
+missing_fields_log = catalogue.validation_failures
 
+def get_valid_images_from_location(location_id):
+    """Retrieve all valid images with necessary fields from a forest location, across all drones.
 
+    Served from the in-memory catalogue; Firestore is only read on first use and
+    for incremental refreshes.
+    """
+    try:
+        valid_images = catalogue.images(location_id)
+        if not valid_images:
+            logger.debug("No valid images found for location %s", location_id)
         return valid_images
 
     except Exception as e:
-        print(f"❌ Error retrieving images from location {location_id}: {str(e)}")
+        logger.error("Error retrieving images from location %s: %s", location_id, e)
         return []
 
-def load_image_from_url(image_url):
-    """Download and decode image from Firebase Storage using its URL."""
+def get_blob_fingerprint(image_url):
+    """Return "<generation>:<md5>" for the blob behind image_url, or None if unavailable.
+
+    Only fetches object metadata, so callers can check caches before downloading.
+    """
     try:
-        encoded_path = image_url.split('/o/')[1].split('?')[0]
-        decoded_path = urllib.parse.unquote(encoded_path)
-        blob = bucket.blob(decoded_path)
+        with span("storage.metadata"):
+            return downloader.fingerprint(image_url)
+    except Exception as e:
+        logger.warning("Error fetching blob metadata for %s: %s", image_url, e)
+        return None
 
-        image_data = blob.download_as_bytes()
-        image_np = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
-        if image is None:
-            raise ValueError("Failed to decode image.")
+def download_image_bytes(image_url):
+    """Download the raw (still encoded) image bytes, served from the local blob cache when valid."""
+    try:
+        with span("download"):
+            return downloader.fetch(image_url)
+    except Exception as e:
+        logger.error("Error downloading image from %s: %s", image_url, e)
+        return None
 
-        return image
+def decode_image(image_data):
+    """Decode encoded image bytes into a BGR array, or None if they are not an image."""
+    with span("decode", profile=True):
+        image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        logger.warning("Error decoding image: not a supported image format")
+    return image
 
-    except Exception as e:
-        print(f"❌ Error downloading or decoding image from URL: {str(e)}")
+def load_image_from_url(image_url):
+    """Download and decode image from Firebase Storage using its URL."""
+    image_data = download_image_bytes(image_url)
+    if image_data is None:
         return None
+    return decode_image(image_data)
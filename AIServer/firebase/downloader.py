@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from .config import bucket
+
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", "cache/blobs")  # Empty string disables the disk cache
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MB", "1024")) * 1024 * 1024
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+METADATA_TTL = float(os.getenv("BLOB_METADATA_TTL", "30"))  # Seconds a generation lookup is trusted
+METADATA_MAX_ENTRIES = int(os.getenv("BLOB_METADATA_MAX_ENTRIES", "100000"))
+
+
+def blob_path_from_url(image_url):
+    """Storage object path from a Firebase download URL (.../o/<encoded path>?alt=media...)."""
+    encoded_path = image_url.split('/o/')[1].split('?')[0]
+    return urllib.parse.unquote(encoded_path)
+
+
+class BlobCache:
+    """On-disk cache of raw blob bytes, validated by generation and evicted LRU past max_bytes.
+
+    The directory is created and indexed on first use (or open()), not at import.
+    """
+
+    def __init__(self, directory, max_bytes=BLOB_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()  # blob path -> (generation, size)
+        self._bytes = 0
+        self._opened = False
+
+    def open(self) -> None:
+        with self._lock:
+            if self._opened:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_index()
+            self._opened = True
+
+    def _files(self, path):
+        name = hashlib.sha1(path.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.bin"), os.path.join(self.directory, f"{name}.json")
+
+    def _load_index(self):
+        # Rebuild LRU order from last access time so eviction survives restarts
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    meta = json.load(f)
+                data_file, _ = self._files(meta["path"])
+                entries.append((os.stat(data_file).st_atime, meta["path"], meta["generation"], meta["size"]))
+            except (OSError, ValueError, KeyError):
+                continue
+        for _, path, generation, size in sorted(entries):
+            self._index[path] = (generation, size)
+            self._bytes += size
+
+    def get(self, path, generation) -> Optional[bytes]:
+        self.open()
+        with self._lock:
+            entry = self._index.get(path)
+            if entry is None or entry[0] != generation:
+                return None
+            self._index.move_to_end(path)
+        data_file, _ = self._files(path)
+        try:
+            with open(data_file, "rb") as f:
+                return f.read()
+        except OSError:
+            self._remove(path)
+            return None
+
+    def put(self, path, generation, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        self.open()
+        data_file, meta_file = self._files(path)
+        # Write-then-rename so readers never see a partial file
+        tmp = f"{data_file}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, data_file)
+        with open(meta_file, "w") as f:
+            json.dump({"path": path, "generation": generation, "size": len(data)}, f)
+
+        with self._lock:
+            previous = self._index.pop(path, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._index[path] = (generation, len(data))
+            self._bytes += len(data)
+            evicted = []
+            while self._bytes > self.max_bytes and self._index:
+                old_path, (_, size) = self._index.popitem(last=False)
+                self._bytes -= size
+                evicted.append(old_path)
+        for old_path in evicted:
+            self._delete_files(old_path)
+
+    def _remove(self, path):
+        with self._lock:
+            entry = self._index.pop(path, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+        self._delete_files(path)
+
+    def _delete_files(self, path):
+        for file in self._files(path):
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+
+    def stats(self):
+        self.open()
+        with self._lock:
+            return {"entries": len(self._index), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+class BlobDownloader:
+    """Bounded pool of blob fetches with a local byte cache.
+
+    The pipeline's fetch stage already keeps its own concurrency's worth of
+    downloads in flight, so result() simply runs fn(key) on the pool.
+    """
+
+    def __init__(self, bucket, cache: Optional[BlobCache] = None, max_workers=DOWNLOAD_WORKERS):
+        self.bucket = bucket
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blob-download")
+        # blob path -> (generation, md5, fetched_at), oldest lookup first
+        self._metadata: "OrderedDict[str, Tuple[int, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"cache_hits": 0, "downloads": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def metadata(self, path) -> Optional[Tuple[int, str]]:
+        """(generation, md5) of a blob, reusing a lookup younger than METADATA_TTL."""
+        with self._lock:
+            cached = self._metadata.get(path)
+        if cached and time.monotonic() - cached[2] < METADATA_TTL:
+            return cached[0], cached[1]
+        blob = self.bucket.get_blob(path)
+        if blob is None or blob.generation is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._metadata[path] = (blob.generation, blob.md5_hash, now)
+            self._metadata.move_to_end(path)
+            # Entries are kept in lookup order, so expired ones and the overflow are all at the front
+            while self._metadata and (len(self._metadata) > METADATA_MAX_ENTRIES
+                                      or now - next(iter(self._metadata.values()))[2] >= METADATA_TTL):
+                self._metadata.popitem(last=False)
+        return blob.generation, blob.md5_hash
+
+    def fingerprint(self, image_url) -> Optional[str]:
+        meta = self.metadata(blob_path_from_url(image_url))
+        return f"{meta[0]}:{meta[1]}" if meta else None
+
+    def fetch(self, image_url) -> bytes:
+        """Raw bytes of the current generation, from the local cache when it is still valid."""
+        path = blob_path_from_url(image_url)
+        meta = self.metadata(path)
+        if meta is None:
+            return self.bucket.blob(path).download_as_bytes()
+
+        generation = meta[0]
+        if self.cache is not None:
+            data = self.cache.get(path, generation)
+            if data is not None:
+                self._count("cache_hits")
+                return data
+
+        # Pin the generation we validated against so a concurrent overwrite can't mix versions
+        data = self.bucket.blob(path, generation=generation).download_as_bytes()
+        self._count("downloads")
+        if self.cache is not None:
+            self.cache.put(path, generation, data)
+        return data
+
+    def submit(self, key, fn: Optional[Callable] = None) -> Future:
+        """Future for fn(key) (default: fetch) on the download pool."""
+        return self._pool.submit(fn or self.fetch, key)
+
+    async def result(self, key, fn: Optional[Callable] = None):
+        return await asyncio.wrap_future(self.submit(key, fn))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["metadata_entries"] = len(self._metadata)
+        if self.cache is not None:
+            stats["disk_cache"] = self.cache.stats()
+        return stats
+
+
+downloader = BlobDownloader(bucket, BlobCache(BLOB_CACHE_DIR) if BLOB_CACHE_DIR else None)
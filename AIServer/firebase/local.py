@@ -0,0 +1,408 @@
+"""Local stand-ins for Firebase services, used for tests, benchmarks and offline runs."""
+import asyncio
+import base64
+import copy
+import hashlib
+import os
+import threading
+import uuid
+
+from google.api_core.exceptions import NotFound
+
+
+class LocalBlob:
+    """Subset of google.cloud.storage.Blob backed by a file under LocalBucket.root."""
+
+    def __init__(self, bucket, name, generation=None):
+        self.bucket = bucket
+        self.name = name
+        self._requested_generation = generation
+        self.generation = None
+        self.md5_hash = None
+        self.size = None
+
+    @property
+    def _path(self):
+        return os.path.join(self.bucket.root, *self.name.split("/"))
+
+    def exists(self):
+        return os.path.isfile(self._path)
+
+    def reload(self):
+        stat = os.stat(self._path)
+        with open(self._path, "rb") as f:
+            digest = hashlib.md5(f.read()).digest()
+        self.generation = stat.st_mtime_ns
+        self.md5_hash = base64.b64encode(digest).decode("ascii")
+        self.size = stat.st_size
+
+    def download_as_bytes(self):
+        if not self.exists():
+            raise FileNotFoundError(f"No such object: {self.name}")
+        if self._requested_generation is not None and os.stat(self._path).st_mtime_ns != self._requested_generation:
+            raise FileNotFoundError(f"Generation {self._requested_generation} of {self.name} is gone")
+        with open(self._path, "rb") as f:
+            return f.read()
+
+    def upload_from_string(self, data):
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(self._path, "wb") as f:
+            f.write(data if isinstance(data, bytes) else data.encode())
+
+
+class LocalBucket:
+    """Directory-backed stand-in for a Storage bucket; object names map to relative paths."""
+
+    def __init__(self, root, name="local"):
+        self.root = root
+        self.name = name
+
+    def blob(self, blob_name, generation=None):
+        return LocalBlob(self, blob_name, generation)
+
+    def get_blob(self, blob_name):
+        blob = LocalBlob(self, blob_name)
+        if not blob.exists():
+            return None
+        blob.reload()
+        return blob
+
+
+class InMemoryDocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = copy.deepcopy(data) if data is not None else None
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = self._data
+        for part in field_path.split("."):
+            if not isinstance(value, dict) or part not in value:
+                raise KeyError(field_path)
+            value = value[part]
+        return value
+
+
+class InMemoryDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return InMemoryCollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name):
+        return InMemoryCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, timeout=None):
+        with self._client._lock:
+            data = self._client._docs.get(self.path)
+        return InMemoryDocumentSnapshot(self, data)
+
+    def set(self, document_data, merge=False, timeout=None):
+        with self._client._lock:
+            self._client._apply([("set", self.path, document_data, merge)])
+
+    def update(self, field_updates, timeout=None):
+        with self._client._lock:
+            self._client._apply([("update", self.path, field_updates, False)])
+
+    def delete(self, timeout=None):
+        with self._client._lock:
+            self._client._apply([("delete", self.path, None, False)])
+
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+class InMemoryQuery:
+    def __init__(self, client, collection_path, filters=(), orders=(), limit=None, start_after=None, projection=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._projection = projection
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters, "orders": self._orders, "limit": self._limit,
+            "start_after": self._start_after, "projection": self._projection,
+        }
+        state.update(changes)
+        return InMemoryQuery(self._client, self._collection_path, **state)
+
+    def where(self, field_path, op_string, value):
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start_after=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def _sort_key(self, path, data, field):
+        return path.rsplit("/", 1)[-1] if field == "__name__" else data.get(field)
+
+    def _is_after(self, row, cursor_path, cursor_data, orders):
+        path, data = row
+        for field, direction in orders:
+            if field == "__name__" and cursor_path is None:
+                return False  # Field-value cursors: rows equal on every given field are not "after"
+            ours = self._sort_key(path, data, field)
+            theirs = self._sort_key(cursor_path or "", cursor_data or {}, field)
+            if ours == theirs:
+                continue
+            return ours < theirs if direction == "DESCENDING" else ours > theirs
+        return False
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            if field not in data or not _OPERATORS[op](data[field], value):
+                return False
+        return True
+
+    def _results(self):
+        prefix = self._collection_path + "/"
+        with self._client._lock:
+            rows = [
+                (path, copy.deepcopy(data)) for path, data in self._client._docs.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):] and self._matches(data)
+            ]
+
+        orders = list(self._orders)
+        # Firestore excludes documents missing an order_by field
+        rows = [(p, d) for p, d in rows if all(f == "__name__" or f in d for f, _ in orders)]
+        # ...and breaks ties by document name in the direction of the last ordering
+        if not any(f == "__name__" for f, _ in orders):
+            orders.append(("__name__", orders[-1][1] if orders else "ASCENDING"))
+        for field, direction in reversed(orders):
+            rows.sort(key=lambda row: self._sort_key(row[0], row[1], field), reverse=direction == "DESCENDING")
+
+        if self._start_after is not None:
+            cursor = self._start_after
+            cursor_path = cursor.reference.path if hasattr(cursor, "reference") else None
+            cursor_data = cursor.to_dict() if hasattr(cursor, "to_dict") else cursor
+            rows = [row for row in rows if self._is_after(row, cursor_path, cursor_data, orders)]
+
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        snapshots = []
+        for path, data in rows:
+            if self._projection is not None:
+                data = {k: v for k, v in data.items() if k in self._projection}
+            snapshots.append(InMemoryDocumentSnapshot(InMemoryDocumentReference(self._client, path), data))
+        return snapshots
+
+    def stream(self, timeout=None):
+        return iter(self._results())
+
+    def get(self, timeout=None):
+        return self._results()
+
+
+class InMemoryCollectionReference(InMemoryQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        document_id = document_id or uuid.uuid4().hex[:20]
+        return InMemoryDocumentReference(self._client, f"{self.path}/{document_id}")
+
+    def add(self, document_data):
+        ref = self.document()
+        ref.set(document_data)
+        return None, ref
+
+
+class InMemoryWriteBatch:
+    """Atomic like a Firestore WriteBatch: either every write applies or none does."""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(("set", reference.path, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._writes.append(("update", reference.path, field_updates, False))
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference.path, None, False))
+
+    def commit(self, timeout=None):
+        with self._client._lock:
+            self._client._apply(self._writes)
+        self._client.commits += 1
+        return []
+
+
+class InMemoryFirestore:
+    """Thread-safe in-memory stand-in for the parts of the Firestore client this server uses."""
+
+    def __init__(self):
+        self._docs = {}  # "collection/doc/sub/doc" -> data
+        self._lock = threading.RLock()
+        self.commits = 0
+
+    def collection(self, name):
+        return InMemoryCollectionReference(self, name)
+
+    def document(self, path):
+        return InMemoryDocumentReference(self, path)
+
+    def batch(self):
+        return InMemoryWriteBatch(self)
+
+    def _apply(self, writes):
+        """Validate then apply a list of writes; caller holds the lock."""
+        staged = {}
+        for op, path, data, merge in writes:
+            current = staged[path] if path in staged else self._docs.get(path)
+            if op == "update":
+                if current is None:
+                    raise NotFound(f"No document to update: {path}")
+                current = {**current, **copy.deepcopy(data)}
+            elif op == "set":
+                current = {**(current or {}), **copy.deepcopy(data)} if merge else copy.deepcopy(data)
+            else:
+                current = None
+            staged[path] = current
+        for path, data in staged.items():
+            if data is None:
+                self._docs.pop(path, None)
+            else:
+                self._docs[path] = data
+
+
+class _AsyncInMemoryQuery:
+    """Awaitable view over an InMemoryQuery, mirroring google.cloud.firestore.AsyncQuery."""
+
+    def __init__(self, client, query):
+        self._client = client
+        self._query = query
+
+    def where(self, field_path, op_string, value):
+        return _AsyncInMemoryQuery(self._client, self._query.where(field_path, op_string, value))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return _AsyncInMemoryQuery(self._client, self._query.order_by(field_path, direction))
+
+    def limit(self, count):
+        return _AsyncInMemoryQuery(self._client, self._query.limit(count))
+
+    def start_after(self, document_fields_or_snapshot):
+        return _AsyncInMemoryQuery(self._client, self._query.start_after(document_fields_or_snapshot))
+
+    def select(self, field_paths):
+        return _AsyncInMemoryQuery(self._client, self._query.select(field_paths))
+
+    async def get(self, timeout=None):
+        await self._client._delay()
+        return self._query.get()
+
+    async def stream(self, timeout=None):
+        await self._client._delay()
+        for snapshot in self._query.stream():
+            yield snapshot
+
+
+class _AsyncInMemoryCollectionReference(_AsyncInMemoryQuery):
+    def __init__(self, client, collection):
+        super().__init__(client, collection)
+        self.path = collection.path
+        self.id = collection.id
+
+    def document(self, document_id=None):
+        return _AsyncInMemoryDocumentReference(self._client, self._query.document(document_id))
+
+
+class _AsyncInMemoryDocumentReference:
+    def __init__(self, client, reference):
+        self._client = client
+        self._reference = reference
+        self.path = reference.path
+        self.id = reference.id
+
+    def collection(self, name):
+        return _AsyncInMemoryCollectionReference(self._client, self._reference.collection(name))
+
+    async def get(self, field_paths=None, timeout=None):
+        await self._client._delay()
+        return self._reference.get()
+
+    async def set(self, document_data, merge=False, timeout=None):
+        await self._client._delay()
+        self._reference.set(document_data, merge=merge)
+
+    async def update(self, field_updates, timeout=None):
+        await self._client._delay()
+        self._reference.update(field_updates)
+
+    async def delete(self, timeout=None):
+        await self._client._delay()
+        self._reference.delete()
+
+
+class _AsyncInMemoryWriteBatch(InMemoryWriteBatch):
+    async def commit(self, timeout=None):
+        await self._async_client._delay()
+        return InMemoryWriteBatch.commit(self)
+
+
+class AsyncInMemoryFirestore:
+    """AsyncClient-shaped view of an InMemoryFirestore; both see the same documents.
+
+    latency (seconds) is awaited before every call, to emulate a slow backend.
+    """
+
+    def __init__(self, sync_client: InMemoryFirestore, latency: float = 0.0):
+        self._sync = sync_client
+        self.latency = latency
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def collection(self, name):
+        return _AsyncInMemoryCollectionReference(self, self._sync.collection(name))
+
+    def document(self, path):
+        return _AsyncInMemoryDocumentReference(self, self._sync.document(path))
+
+    def batch(self):
+        batch = _AsyncInMemoryWriteBatch(self._sync)
+        batch._async_client = self
+        return batch
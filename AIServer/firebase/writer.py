@@ -0,0 +1,209 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.api_core import exceptions as gcp_exceptions
+
+from app.metrics import span
+from .config import db
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_WRITES = int(os.getenv("WRITER_MAX_BATCH_WRITES", "400"))  # Firestore caps a batch at 500
+FLUSH_INTERVAL = float(os.getenv("WRITER_FLUSH_INTERVAL", "0.5"))
+MAX_RETRIES = int(os.getenv("WRITER_MAX_RETRIES", "5"))
+
+# Transient errors worth retrying; anything else means the writes themselves are bad
+RETRYABLE_ERRORS = (
+    gcp_exceptions.Aborted,
+    gcp_exceptions.DeadlineExceeded,
+    gcp_exceptions.InternalServerError,
+    gcp_exceptions.ServiceUnavailable,
+    gcp_exceptions.TooManyRequests,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class _WriteGroup:
+    """Writes that must commit together, plus the future resolved when they do."""
+
+    __slots__ = ("writes", "future", "queued_at")
+
+    def __init__(self, writes: List[Tuple[str, Any, Optional[Dict[str, Any]]]]):
+        self.writes = writes
+        self.future: Future = Future()
+        self.queued_at = time.monotonic()
+
+
+class AlertWriter:
+    """Write-behind buffer that commits queued writes in Firestore WriteBatches.
+
+    A batch is committed once it holds max_batch_writes writes or flush_interval
+    seconds after the oldest queued write, whichever comes first. Each group
+    (e.g. an alert plus its image flag) always lands in one batch, so it is
+    applied atomically. Transient failures are retried with exponential backoff.
+    If a batch fails permanently, its groups are committed one by one so a single
+    bad write cannot take down the others.
+    """
+
+    def __init__(self, db, max_batch_writes: int = MAX_BATCH_WRITES, flush_interval: float = FLUSH_INTERVAL, max_retries: int = MAX_RETRIES):
+        self.db = db
+        self.max_batch_writes = max_batch_writes
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+
+        self._groups: List[_WriteGroup] = []
+        self._queued_writes = 0
+        self._flush_requested = False
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"commits": 0, "groups": 0, "writes": 0, "retries": 0, "failed_groups": 0}
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="firestore-writer", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, writes: List[Tuple[str, Any, Optional[Dict[str, Any]]]]) -> Future:
+        """Queue ("set"|"update"|"delete", document_ref, data) writes to commit atomically together."""
+        if not writes or len(writes) > self.max_batch_writes:
+            raise ValueError(f"A write group needs 1 to {self.max_batch_writes} writes.")
+        group = _WriteGroup(writes)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("AlertWriter is closed.")
+            self._ensure_started()
+            self._groups.append(group)
+            self._queued_writes += len(writes)
+            self._cond.notify()
+        return group.future
+
+    def create_alert(self, alert_fields: Dict[str, Any], image_ref=None) -> Tuple[str, Future]:
+        """Queue a new alert document (and flag its image) and return the alert id immediately."""
+        alert_ref = self.db.collection("alerts").document()  # Ids are generated client-side, no round trip
+        writes = [("set", alert_ref, {**alert_fields, "alert_id": alert_ref.id})]
+        if image_ref is not None:
+            writes.append(("update", image_ref, {"alert_status": "active"}))
+        return alert_ref.id, self.enqueue(writes)
+
+    def _take_batch(self) -> List[_WriteGroup]:
+        """Pop whole groups up to max_batch_writes. Caller holds the condition."""
+        taken, count = [], 0
+        while self._groups and count + len(self._groups[0].writes) <= self.max_batch_writes:
+            group = self._groups.pop(0)
+            count += len(group.writes)
+            taken.append(group)
+        self._queued_writes -= count
+        if not self._groups:
+            self._flush_requested = False
+        self._in_flight += len(taken)
+        return taken
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._groups and (
+                        self._closed
+                        or self._flush_requested
+                        or self._queued_writes >= self.max_batch_writes
+                        or time.monotonic() - self._groups[0].queued_at >= self.flush_interval
+                    ):
+                        break
+                    if self._closed and not self._groups:
+                        return
+                    timeout = None
+                    if self._groups:
+                        timeout = max(0.0, self.flush_interval - (time.monotonic() - self._groups[0].queued_at))
+                    self._cond.wait(timeout)
+                batch = self._take_batch()
+
+            self._commit_with_fallback(batch)
+            with self._cond:
+                self._in_flight -= len(batch)
+                self._cond.notify_all()
+
+    def _commit(self, groups: List[_WriteGroup]) -> None:
+        attempt = 0
+        while True:
+            batch = self.db.batch()
+            for group in groups:
+                for op, ref, data in group.writes:
+                    if op == "set":
+                        batch.set(ref, data)
+                    elif op == "update":
+                        batch.update(ref, data)
+                    else:
+                        batch.delete(ref)
+            try:
+                with span("firestore.batch_commit"):
+                    batch.commit()
+                return
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self._counters["retries"] += 1
+                delay = min(10.0, 0.1 * 2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"Firestore batch commit failed ({e}); retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _commit_with_fallback(self, groups: List[_WriteGroup]) -> None:
+        try:
+            self._commit(groups)
+        except Exception as e:
+            if len(groups) == 1:
+                logger.error(f"Firestore write group failed permanently: {e}", exc_info=True)
+                self._counters["failed_groups"] += 1
+                groups[0].future.set_exception(e)
+                return
+            logger.warning(f"Batch of {len(groups)} write groups failed ({e}); committing them individually")
+            for group in groups:
+                self._commit_with_fallback([group])
+            return
+
+        self._counters["commits"] += 1
+        self._counters["groups"] += len(groups)
+        self._counters["writes"] += sum(len(g.writes) for g in groups)
+        for group in groups:
+            group.future.set_result(None)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Commit everything queued so far; returns False if timeout expired first."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            if self._groups:
+                self._flush_requested = True
+            self._cond.notify_all()
+            while self._groups or self._in_flight:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._counters,
+                "queued_groups": len(self._groups),
+                "queued_writes": self._queued_writes,
+                "in_flight_groups": self._in_flight,
+            }
+
+
+alert_writer = AlertWriter(db)
@@ -0,0 +1,18 @@
+import os
+
+# gunicorn -c gunicorn.conf.py app.main:app
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+# Import the app (and with PRELOAD_MODEL the weights) once in the master, so the
+# forked workers share those pages copy-on-write. Importing starts no threads or
+# gRPC channels, so forking after it is safe; clients are created per worker.
+preload_app = os.getenv("PRELOAD_APP", "1") == "1"
+
+
+def on_starting(server):
+    if preload_app and os.getenv("PRELOAD_MODEL", "1") == "1":
+        from app.lifecycle import preload
+        preload()
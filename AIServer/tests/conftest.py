@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Run against the local stand-ins, never a real project
+os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+os.environ.setdefault("SMS_PROVIDER", "fake")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
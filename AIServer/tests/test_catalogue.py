@@ -0,0 +1,91 @@
+import pytest
+
+from firebase.catalogue import ImageCatalogue
+from firebase.local import InMemoryFirestore
+
+
+def _image(db, drone_id, doc_id, **fields):
+    data = {"image_url": f"https://example.com/{doc_id}.jpg", "latitude": 36.0, "longitude": 2.0, **fields}
+    db.document(f"forestLocations/L/drones/{drone_id}/images/{doc_id}").set(data)
+
+
+@pytest.fixture
+def db():
+    db = InMemoryFirestore()
+    for drone_id in ("d0", "d1"):
+        db.document(f"forestLocations/L/drones/{drone_id}").set({})
+        for i in range(3):
+            _image(db, drone_id, f"{drone_id}-i{i}", updated_at=i)
+    return db
+
+
+def _by_id(catalogue):
+    return {image["image_doc_id"]: image for image in catalogue.images("L")}
+
+
+def test_load_pages_through_every_drone_and_skips_invalid_documents(db):
+    db.document("forestLocations/L/drones/d0/images/broken").set({"image_url": "u", "filename": "broken.jpg"})
+    catalogue = ImageCatalogue(db, page_size=2, refresh_seconds=3600)
+
+    assert sorted(_by_id(catalogue)) == [f"{d}-i{i}" for d in ("d0", "d1") for i in range(3)]
+    assert catalogue.validation_failures[-1]["filename"] == "broken.jpg"
+    assert catalogue.validation_failures[-1]["missing_fields"] == ["latitude", "longitude"]
+
+
+def test_refresh_only_pulls_documents_past_the_cursor(db):
+    catalogue = ImageCatalogue(db, page_size=2, refresh_seconds=3600)
+    catalogue.images("L")
+
+    _image(db, "d0", "d0-i3", updated_at=3)  # Past d0's cursor (2)
+    _image(db, "d0", "d0-i1", updated_at=1, alert_status="confirmed")  # Changed without moving updated_at
+    db.document("forestLocations/L/drones/d2").set({})
+    _image(db, "d2", "d2-i0")  # New drone: scanned in full, even without updated_at
+    catalogue.refresh("L")
+
+    images = _by_id(catalogue)
+    assert "d0-i3" in images and "d2-i0" in images
+    assert "alert_status" not in images["d0-i1"]["original_data"]
+    assert catalogue._cursors[("L", "d0")] == 3
+
+
+def test_images_refreshes_only_after_refresh_seconds(db):
+    catalogue = ImageCatalogue(db, refresh_seconds=3600)
+    catalogue.images("L")
+    _image(db, "d0", "d0-i3", updated_at=3)
+    assert "d0-i3" not in _by_id(catalogue)
+
+    catalogue.refresh_seconds = 0
+    assert "d0-i3" in _by_id(catalogue)
+
+
+def test_mark_replaces_the_cached_image(db):
+    catalogue = ImageCatalogue(db, refresh_seconds=3600)
+    before = catalogue.images("L")
+    catalogue.mark("L", "d0", "d0-i0", {"alert_status": "pending"})
+    catalogue.mark("L", "d0", "missing", {"alert_status": "pending"})  # Unknown images are ignored
+
+    assert _by_id(catalogue)["d0-i0"]["original_data"]["alert_status"] == "pending"
+    # Readers holding the previous list never see it change
+    assert all("alert_status" not in image["original_data"] for image in before)
+    assert len(catalogue.images("L")) == 6
+
+
+@pytest.mark.parametrize("read", ["load", "refresh"])
+def test_mark_made_while_reading_survives_the_swap(db, read):
+    catalogue = ImageCatalogue(db, refresh_seconds=3600)
+    if read == "refresh":
+        catalogue.images("L")
+        _image(db, "d0", "d0-i0", updated_at=5)  # Re-read by the refresh, without the mark
+    fetch = catalogue._fetch
+
+    def fetch_then_mark(query, order_field="__name__"):
+        docs = fetch(query, order_field)
+        # The alert write lands after this page was read but before the results are swapped in
+        catalogue.mark("L", "d0", "d0-i0", {"alert_status": "pending"})
+        return docs
+
+    catalogue._fetch = fetch_then_mark
+    catalogue.refresh("L") if read == "refresh" else catalogue.images("L")
+
+    assert _by_id(catalogue)["d0-i0"]["original_data"]["alert_status"] == "pending"
+    assert catalogue._marks == {} and catalogue._reads == {}
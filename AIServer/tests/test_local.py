@@ -0,0 +1,66 @@
+import pytest
+from google.api_core.exceptions import NotFound
+
+from firebase.local import InMemoryFirestore
+
+
+@pytest.fixture
+def db():
+    db = InMemoryFirestore()
+    for i, score in enumerate([3, 1, 2, 2, 5, 2]):
+        db.collection("images").document(f"img{i}").set({"score": score, "i": i})
+    db.collection("images").document("unscored").set({"i": 99})
+    return db
+
+
+def _pages(query, size):
+    """Every page of `query`, resuming from the last snapshot of the previous one."""
+    pages, cursor = [], None
+    while True:
+        page = (query.start_after(cursor) if cursor is not None else query).limit(size).get()
+        if not page:
+            return pages
+        pages.append([snapshot.id for snapshot in page])
+        cursor = page[-1]
+
+
+def test_snapshot_cursor_pages_through_ties_once(db):
+    pages = _pages(db.collection("images").order_by("score"), 2)
+    ids = [doc_id for page in pages for doc_id in page]
+    # Ties on score are broken by document name; documents without the field are left out
+    assert ids == ["img1", "img2", "img3", "img5", "img0", "img4"]
+    assert pages == [["img1", "img2"], ["img3", "img5"], ["img0", "img4"]]
+
+
+def test_descending_cursor_breaks_ties_in_the_same_direction(db):
+    pages = _pages(db.collection("images").order_by("score", direction="DESCENDING"), 2)
+    assert [doc_id for page in pages for doc_id in page] == ["img4", "img0", "img5", "img3", "img2", "img1"]
+
+
+def test_field_value_cursor_skips_every_equal_row(db):
+    page = db.collection("images").order_by("score").start_after({"score": 2}).get()
+    assert [snapshot.id for snapshot in page] == ["img0", "img4"]
+
+
+def test_name_cursor_pages_a_whole_collection(db):
+    pages = _pages(db.collection("images").order_by("__name__"), 3)
+    assert [doc_id for page in pages for doc_id in page] == [f"img{i}" for i in range(6)] + ["unscored"]
+
+
+def test_filters_and_projection(db):
+    page = db.collection("images").where("score", "==", 2).select(["score"]).get()
+    assert [(snapshot.id, snapshot.to_dict()) for snapshot in page] == [
+        ("img2", {"score": 2}), ("img3", {"score": 2}), ("img5", {"score": 2})
+    ]
+
+
+def test_write_batch_applies_all_or_nothing(db):
+    batch = db.batch()
+    batch.set(db.document("alerts/a"), {"n": 1})
+    batch.update(db.document("images/img0"), {"alert_status": "active"})
+    batch.update(db.document("images/missing"), {"alert_status": "active"})
+    with pytest.raises(NotFound):
+        batch.commit()
+    assert not db.document("alerts/a").get().exists
+    assert "alert_status" not in db.document("images/img0").get().to_dict()
+    assert db.commits == 0
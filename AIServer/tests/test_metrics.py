@@ -0,0 +1,33 @@
+import pytest
+
+from app import metrics
+from app.metrics import drain_spans, keep_spans, record_spans, span
+
+
+def _count(name):
+    series = metrics.SPAN_SECONDS._series.get((name,))
+    return series[2] if series else 0
+
+
+def test_spans_kept_in_one_process_are_recorded_in_another(monkeypatch):
+    monkeypatch.setattr(metrics, "_span_log", None)
+    with span("test.ignored"):
+        pass
+    assert drain_spans() == []  # Nothing is logged until keep_spans()
+
+    keep_spans()
+    with span("test.ok"):
+        pass
+    with pytest.raises(ValueError):
+        with span("test.failed"):
+            raise ValueError
+    metrics.observe("test.measured", 0.25)
+    spans = drain_spans()
+    assert [(name, failed) for name, _, failed in spans] == [("test.ok", False), ("test.failed", True), ("test.measured", False)]
+    assert drain_spans() == []
+
+    before = _count("test.ok"), _count("test.measured")
+    record_spans(spans)
+    assert (_count("test.ok"), _count("test.measured")) == (before[0] + 1, before[1] + 1)
+    assert 'foresteye_span_errors_total{span="test.failed"} 2.0' in metrics.registry.render()
+
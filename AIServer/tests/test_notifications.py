@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+from app.notifications import MAX_SMS_LENGTH, FakeSMSProvider, SMSDispatcher, TokenBucket
+
+
+class FlakySMSProvider(FakeSMSProvider):
+    """Fails the first `failures` sends."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    def send(self, to, body):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("gateway down")
+        return super().send(to, body)
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            pytest.fail("timed out")
+        time.sleep(0.01)
+
+
+def test_jobs_for_one_recipient_are_coalesced():
+    provider = FakeSMSProvider()
+    dispatcher = SMSDispatcher(provider, coalesce_window=0.2, rate_per_second=100, burst=10)
+    jobs = [dispatcher.submit("+100", f"fire {i}") for i in range(3)] + [dispatcher.submit("+200", "smoke")]
+    _wait_for(lambda: all(dispatcher.job(job)["status"] == "sent" for job in jobs))
+
+    assert sorted(message["to"] for message in provider.sent) == ["+100", "+200"]
+    batched = next(message for message in provider.sent if message["to"] == "+100")
+    assert batched["body"].startswith("🚨 3 FIRE ALERTS")
+    assert dispatcher.job(jobs[0])["coalesced"] == 3
+
+
+def test_jobs_that_do_not_fit_in_one_message_go_out_in_another():
+    provider = FakeSMSProvider()
+    dispatcher = SMSDispatcher(provider, coalesce_window=0.2, rate_per_second=100, burst=10)
+    texts = [f"fire {i} " + "x" * 500 for i in range(5)]
+    jobs = [dispatcher.submit("+100", text) for text in texts]
+    _wait_for(lambda: all(dispatcher.job(job)["status"] == "sent" for job in jobs))
+
+    assert len(provider.sent) > 1
+    assert all(len(message["body"]) <= MAX_SMS_LENGTH for message in provider.sent)
+    delivered = "\n".join(message["body"] for message in provider.sent)
+    assert all(text in delivered for text in texts)
+    assert len({dispatcher.job(job)["message_sid"] for job in jobs}) == len(provider.sent)
+    assert dispatcher.job(jobs[0])["message_sid"] == dispatcher.job(jobs[2])["message_sid"]
+    assert dispatcher.stats()["messages_sent"] == 2
+
+
+def test_jobs_after_the_window_start_a_new_message():
+    provider = FakeSMSProvider()
+    dispatcher = SMSDispatcher(provider, coalesce_window=0.05, rate_per_second=100, burst=10)
+    first = dispatcher.submit("+100", "fire 1")
+    _wait_for(lambda: dispatcher.job(first)["status"] == "sent")
+    second = dispatcher.submit("+100", "fire 2")
+    _wait_for(lambda: dispatcher.job(second)["status"] == "sent")
+    assert [message["body"] for message in provider.sent] == ["fire 1", "fire 2"]
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=10, capacity=2)
+    for _ in range(2):
+        assert bucket.wait_time() == 0
+        bucket.take()
+    assert bucket.wait_time() == pytest.approx(0.1, abs=0.02)
+
+
+def test_dispatcher_sends_at_the_configured_rate():
+    provider = FakeSMSProvider()
+    dispatcher = SMSDispatcher(provider, coalesce_window=0, rate_per_second=20, burst=1)
+    start = time.monotonic()
+    jobs = [dispatcher.submit(f"+{i}", "fire") for i in range(5)]
+    _wait_for(lambda: all(dispatcher.job(job)["status"] == "sent" for job in jobs))
+    assert time.monotonic() - start >= 4 / 20 * 0.9  # One token up front, then one every 50 ms
+
+
+def test_failed_sends_are_retried():
+    provider = FlakySMSProvider(failures=1)
+    dispatcher = SMSDispatcher(provider, coalesce_window=0, rate_per_second=100, burst=10, max_retries=2)
+    job = dispatcher.submit("+100", "fire")
+    _wait_for(lambda: dispatcher.job(job)["status"] == "retrying")
+    dispatcher.close(timeout=5)  # Retries are due at once when closing
+    assert dispatcher.job(job)["status"] == "sent"
+    assert dispatcher.job(job)["attempts"] == 2
+    assert dispatcher.stats()["retries"] == 1
+
+
+def test_close_flushes_pending_batches_and_refuses_new_jobs():
+    provider = FakeSMSProvider()
+    dispatcher = SMSDispatcher(provider, coalesce_window=60, rate_per_second=100, burst=10)
+    jobs = [dispatcher.submit("+100", "fire 1"), dispatcher.submit("+100", "fire 2")]
+    dispatcher.close(timeout=5)
+    assert [dispatcher.job(job)["status"] for job in jobs] == ["sent", "sent"]
+    assert len(provider.sent) == 1
+    with pytest.raises(RuntimeError):
+        dispatcher.submit("+100", "fire 3")
+
+
+def test_a_closed_send_pool_fails_the_batch_without_killing_the_dispatcher():
+    dispatcher = SMSDispatcher(FakeSMSProvider(), coalesce_window=0, rate_per_second=100, burst=10, max_workers=1)
+    dispatcher._pool.shutdown()
+    jobs = [dispatcher.submit(f"+{i}", "fire") for i in range(3)]
+    _wait_for(lambda: all(dispatcher.job(job)["status"] == "failed" for job in jobs))
+    assert dispatcher._thread.is_alive()
+    assert dispatcher.stats()["in_flight_batches"] == 0
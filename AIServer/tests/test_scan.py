@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from app import scan
+from app.prefilter import AdaptiveSampler
+from app.scan import ScanScheduler
+
+
+def _catalogue(*location_ids, drones=1):
+    """One image per drone, so the frame a pick emits is fully determined."""
+    return {
+        location_id: [{"drone_id": f"{location_id}-d{d}", "image_url": f"{location_id}-d{d}.jpg"} for d in range(drones)]
+        for location_id in location_ids
+    }
+
+
+def _scheduler(risks, concurrency=100, per_location=100, min_interval=0.0, sampling_rate=None, drones=1):
+    images = _catalogue(*risks, drones=drones)
+    return ScanScheduler(
+        list_locations=lambda: list(risks.items()),
+        location_images=lambda location_id: images[location_id],
+        concurrency=concurrency,
+        per_location=per_location,
+        min_interval=min_interval,
+        sampling_rate=sampling_rate,
+        locations_refresh=3600,
+    )
+
+
+async def _take(scheduler, count):
+    frames = []
+    async for frame in scheduler.frames(lambda: len(frames) < count):
+        frames.append(frame)
+        if len(frames) == count:
+            break
+    return frames
+
+
+def test_locations_are_served_in_proportion_to_their_weight():
+    scheduler = _scheduler({"high": 2.0, "low": 1.0})
+    order = [frame["location_id"] for frame in asyncio.run(_take(scheduler, 30))]
+
+    # Both start at virtual time 0; each pick advances a tag by 1 / weight
+    assert order[:3] == ["high", "low", "high"]
+    assert order.count("high") == 20 and order.count("low") == 10
+    # The lower-weight location is never starved: at most two "high" picks in a row
+    assert all(order[i:i + 3] != ["high"] * 3 for i in range(len(order) - 2))
+
+
+def test_drones_of_a_location_are_scanned_round_robin():
+    scheduler = _scheduler({"a": 1.0}, drones=3)
+    frames = asyncio.run(_take(scheduler, 6))
+
+    assert [frame["image_data"]["drone_id"] for frame in frames] == ["a-d0", "a-d1", "a-d2"] * 2
+
+
+def test_global_budget_holds_frames_until_done():
+    async def run():
+        scheduler = _scheduler({"a": 1.0, "b": 1.0}, concurrency=2, per_location=2)
+        frames = scheduler.frames(lambda: True)
+        first, second = await frames.__anext__(), await frames.__anext__()
+        third = asyncio.ensure_future(frames.__anext__())
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert not third.done()  # Both budget units are held
+
+        scheduler.done(first)
+        frame = await asyncio.wait_for(third, 1)
+        assert scheduler.stats()["in_flight"] == 2
+        await frames.aclose()
+        return [first, second, frame]
+
+    assert len(asyncio.run(run())) == 3
+
+
+def test_per_location_cap_lets_other_locations_go_first():
+    scheduler = _scheduler({"busy": 10.0, "quiet": 1.0}, concurrency=4, per_location=1)
+    order = [frame["location_id"] for frame in asyncio.run(_take(scheduler, 3))]
+
+    # "busy" is at its cap after one frame, so "quiet" goes next despite the lower weight;
+    # with everyone capped the budget is still used rather than left idle
+    assert order == ["busy", "quiet", "busy"]
+
+
+def test_sampling_rate_stretches_the_rescan_interval(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(scan.time, "monotonic", lambda: clock[0])
+    sampler = AdaptiveSampler(min_rate=0.2, max_rate=1.0, decay=0.5)
+    scheduler = _scheduler({"a": 1.0, "b": 1.0}, min_interval=10, sampling_rate=sampler.rate)
+
+    async def picks():
+        await scheduler._refresh_locations()
+        frames = []
+        while True:
+            frame, wait = await scheduler._next_frame()
+            if frame is None:
+                return frames, wait
+            frames.append(frame["location_id"])
+
+    assert asyncio.run(picks()) == (["a", "b"], scan.SCAN_IDLE_SECONDS)
+
+    for _ in range(3):
+        sampler.record("b", positive=False)
+    assert sampler.rate("b") == 0.2  # 1.0 -> 0.5 -> 0.25 -> floored at min_rate
+
+    clock[0] += 11  # Past a's interval (10 s) but not b's (10 / 0.2 = 50 s)
+    assert asyncio.run(picks())[0] == ["a"]
+
+    sampler.record("b", positive=True)  # A detection restores the full rate
+    assert asyncio.run(picks())[0] == ["b"]
+
+
+def test_sampler_stats_report_the_interval_stretch():
+    sampler = AdaptiveSampler(min_rate=0.25, max_rate=1.0, decay=0.5)
+    sampler.record("a", positive=False)
+    sampler.record("b", positive=True)
+
+    stats = sampler.stats()
+    assert stats["rates"] == {"a": 0.5, "b": 1.0}
+    assert stats["interval_stretch"] == {"a": 2.0, "b": 1.0}
+    assert stats["mean_interval_stretch"] == pytest.approx(1.5)
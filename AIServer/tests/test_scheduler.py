@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.scheduler import MicroBatchScheduler, SchedulerBusy
+
+
+class StubRunner:
+    """Records every batch it is given; blocks while `gate` is clear."""
+
+    def __init__(self):
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+
+    def __call__(self, images):
+        self.started.set()
+        self.gate.wait()
+        self.batches.append(len(images))
+        return [{"index": int(image[0, 0])} for image in images]
+
+
+def _frame(index):
+    return np.full((2, 2), index, dtype=np.uint8)
+
+
+def test_batch_closes_at_max_batch_size():
+    runner = StubRunner()
+    scheduler = MicroBatchScheduler(max_batch_size=4, max_wait_ms=5000, runner=runner)
+    try:
+        futures = [scheduler.submit(_frame(i)) for i in range(8)]
+        results = [future.result(timeout=2) for future in futures]
+    finally:
+        scheduler.stop(timeout=2)
+
+    # Full batches go out without waiting for max_wait, and every caller gets its own result
+    assert runner.batches == [4, 4]
+    assert [result["index"] for result in results] == list(range(8))
+
+
+def test_batch_closes_after_max_wait():
+    runner = StubRunner()
+    scheduler = MicroBatchScheduler(max_batch_size=8, max_wait_ms=50, runner=runner)
+    try:
+        started = time.monotonic()
+        futures = [scheduler.submit(_frame(i)) for i in range(3)]
+        for future in futures:
+            future.result(timeout=2)
+        elapsed = time.monotonic() - started
+    finally:
+        scheduler.stop(timeout=2)
+
+    assert runner.batches == [3]
+    assert elapsed >= 0.05
+
+
+def test_runner_error_fails_every_request_in_the_batch():
+    def runner(images):
+        raise RuntimeError("model down")
+
+    scheduler = MicroBatchScheduler(max_batch_size=2, max_wait_ms=50, runner=runner)
+    try:
+        futures = [scheduler.submit(_frame(i)) for i in range(2)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="model down"):
+                future.result(timeout=2)
+        assert scheduler.stats()["failed"] == 2
+    finally:
+        scheduler.stop(timeout=2)
+
+
+def test_detect_raises_scheduler_busy_when_queue_stays_full():
+    runner = StubRunner()
+    runner.gate.clear()
+    scheduler = MicroBatchScheduler(max_batch_size=1, max_wait_ms=0, max_queue_size=1, runner=runner)
+    try:
+        in_batch = scheduler.submit(_frame(0))
+        assert runner.started.wait(2)  # The dispatcher holds the first frame, so one more fills the queue
+        queued = scheduler.submit(_frame(1))
+        with pytest.raises(SchedulerBusy):
+            asyncio.run(scheduler.detect(_frame(2), timeout=0.05))
+    finally:
+        runner.gate.set()
+        scheduler.stop(timeout=2)
+    assert in_batch.result(timeout=2)["index"] == 0
+    assert queued.done()
+
+
+def test_scheduler_busy_maps_to_503_with_retry_after():
+    from app.main import scheduler_busy_handler
+
+    response = asyncio.run(scheduler_busy_handler(None, SchedulerBusy("Inference queue full (1 requests)")))
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert b"Inference queue full" in response.body
+
+
+def test_stop_fails_queued_requests_without_blocking():
+    runner = StubRunner()
+    runner.gate.clear()
+    scheduler = MicroBatchScheduler(max_batch_size=1, max_wait_ms=0, max_queue_size=2, runner=runner)
+    in_batch = scheduler.submit(_frame(0))
+    assert runner.started.wait(2)
+    queued = [scheduler.submit(_frame(i)) for i in (1, 2)]  # The queue is now full
+
+    stopper = threading.Thread(target=scheduler.stop, kwargs={"timeout": 2})
+    stopper.start()
+    for future in queued:
+        with pytest.raises(SchedulerBusy):
+            future.result(timeout=2)
+    runner.gate.set()
+    stopper.join(timeout=5)
+
+    assert not stopper.is_alive()
+    # The batch already running still completes
+    assert in_batch.result(timeout=2)["index"] == 0
+    assert runner.batches == [1]
@@ -0,0 +1,83 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app import tiling
+from app.tiling import merge_boxes, tile_grid
+
+
+def _covered(tiles, height, width):
+    mask = np.zeros((height, width), dtype=bool)
+    for x0, y0, x1, y1 in tiles:
+        mask[y0:y1, x0:x1] = True
+    return mask.all()
+
+
+def test_tile_grid_covers_the_frame_with_overlap():
+    tiles = tile_grid(1080, 1920, tile_size=640, overlap=128)
+
+    assert _covered(tiles, 1080, 1920)
+    assert all((x1 - x0, y1 - y0) == (640, 640) for x0, y0, x1, y1 in tiles)
+    # The last column and row are aligned to the edge instead of running past it
+    assert max(x1 for _, _, x1, _ in tiles) == 1920
+    assert max(y1 for _, _, _, y1 in tiles) == 1080
+    columns = sorted({x0 for x0, _, _, _ in tiles})
+    assert all(b - a <= 640 - 128 for a, b in zip(columns, columns[1:]))
+
+
+def test_tile_grid_image_smaller_than_one_tile():
+    assert tile_grid(300, 500, tile_size=640, overlap=128) == [(0, 0, 500, 300)]
+    assert tile_grid(640, 640, tile_size=640, overlap=128) == [(0, 0, 640, 640)]
+
+
+def test_tile_grid_rejects_overlap_not_smaller_than_tile():
+    with pytest.raises(ValueError):
+        tile_grid(1000, 1000, tile_size=256, overlap=256)
+
+
+def test_merge_boxes_joins_a_box_clipped_at_a_seam():
+    boxes = np.array([
+        [400.0, 100.0, 700.0, 200.0],  # Full box from the right-hand tile
+        [400.0, 100.0, 640.0, 200.0],  # Same fire, clipped by the left tile's border
+    ])
+    kept = merge_boxes(boxes, np.array([0.9, 0.7]), np.array([0, 0]), threshold=0.6)
+
+    assert kept.tolist() == [0]
+
+
+def test_merge_boxes_drops_a_box_contained_in_a_better_one():
+    boxes = np.array([[0.0, 0.0, 100.0, 100.0], [40.0, 40.0, 60.0, 60.0]])
+    kept = merge_boxes(boxes, np.array([0.5, 0.8]), np.array([0, 0]), threshold=0.6)
+
+    # Containment is IoS 1.0 whichever box scores higher; the best score survives
+    assert kept.tolist() == [1]
+
+
+def test_merge_boxes_keeps_separate_boxes_and_other_classes():
+    boxes = np.array([
+        [0.0, 0.0, 100.0, 100.0],
+        [10.0, 10.0, 90.0, 90.0],  # Overlaps the first but is smoke, not fire
+        [500.0, 500.0, 600.0, 600.0],
+    ])
+    kept = merge_boxes(boxes, np.array([0.9, 0.8, 0.7]), np.array([0, 1, 0]), threshold=0.6)
+
+    assert kept.tolist() == [0, 1, 2]
+
+
+def test_tiled_detection_maps_boxes_to_frame_coordinates(monkeypatch):
+    calls = []
+
+    async def detect_many(crops):
+        calls.append([crop.shape for crop in crops])
+        # Every tile reports the same fire at its top-left corner
+        return [{"detections": [{"class": "fire", "confidence": 0.8, "bbox": [0, 0, 50, 50]}]} for _ in crops]
+
+    monkeypatch.setattr(tiling.scheduler, "detect_many", detect_many)
+    image = np.zeros((400, 1000, 3), dtype=np.uint8)
+    result = asyncio.run(tiling.run_detection_tiled(image, tile_size=400, overlap=100, prescreen=False))
+
+    assert calls == [[(400, 400, 3)] * 3]
+    # Tiles start at x = 0, 300 and 600, so three separate fires in frame coordinates
+    assert sorted(d["bbox"][0] for d in result["detections"]) == [0.0, 300.0, 600.0]
+    assert result["status"] == "fire detected"
@@ -0,0 +1,92 @@
+from app.tracker import ATTACHED, ESCALATED, METERS_PER_DEGREE, NEW, FireTracker
+
+LAT, LON = 36.0, 2.0
+
+
+def _north(meters):
+    """Latitude of a point `meters` north of the base point."""
+    return LAT + meters / METERS_PER_DEGREE
+
+
+def _smoke(confidence):
+    return [{"class": "smoke", "confidence": confidence}]
+
+
+def _fire(confidence):
+    return [{"class": "fire", "confidence": confidence}]
+
+
+def _tracker():
+    return FireTracker(radius_m=500, window_s=60, escalation_confidence=0.15)
+
+
+def test_first_detection_is_new_and_nearby_ones_attach():
+    tracker = _tracker()
+    fire, verdict = tracker.observe("forest-1", LAT, LON, _smoke(0.5), now=0)
+    assert verdict == NEW
+
+    same, verdict = tracker.observe("forest-1", _north(200), LON, _smoke(0.55), now=10)
+    assert (same, verdict) == (fire, ATTACHED)
+    assert fire.detections == 2
+    assert fire.confidence == 0.5  # Attaching doesn't change the fire's strongest detection
+
+
+def test_far_away_or_other_forest_is_a_new_fire():
+    tracker = _tracker()
+    fire, _ = tracker.observe("forest-1", LAT, LON, _smoke(0.5), now=0)
+
+    far, verdict = tracker.observe("forest-1", _north(800), LON, _smoke(0.5), now=1)
+    assert verdict == NEW and far is not fire
+    other, verdict = tracker.observe("forest-2", LAT, LON, _smoke(0.5), now=2)
+    assert verdict == NEW and other is not fire
+    assert tracker.stats()["active_fires"] == 3
+
+
+def test_escalation_on_severity_or_confidence():
+    tracker = _tracker()
+    fire, _ = tracker.observe("forest-1", LAT, LON, _smoke(0.4), now=0)
+
+    # Below the confidence margin at the same severity
+    assert tracker.observe("forest-1", LAT, LON, _smoke(0.5), now=1)[1] == ATTACHED
+    assert tracker.observe("forest-1", LAT, LON, _smoke(0.6), now=2)[1] == ESCALATED
+    assert fire.confidence == 0.6
+
+    # Smoke turning to fire escalates even at a lower confidence
+    assert tracker.observe("forest-1", LAT, LON, _fire(0.3), now=3)[1] == ESCALATED
+    assert (fire.detection_class, fire.severity) == ("fire", 2)
+    # Smoke again is less severe than the fire now on record
+    assert tracker.observe("forest-1", LAT, LON, _smoke(0.99), now=4)[1] == ATTACHED
+
+
+def test_fire_closes_after_the_window():
+    tracker = _tracker()
+    fire, _ = tracker.observe("forest-1", LAT, LON, _smoke(0.5), now=0)
+
+    # Each sighting extends the window
+    assert tracker.observe("forest-1", LAT, LON, _smoke(0.5), now=50)[1] == ATTACHED
+    assert tracker.observe("forest-1", LAT, LON, _smoke(0.5), now=110)[1] == ATTACHED
+
+    reopened, verdict = tracker.observe("forest-1", LAT, LON, _smoke(0.5), now=171)
+    assert verdict == NEW and reopened is not fire
+    assert tracker.stats()["expired"] == 1
+    assert tracker.stats()["active_fires"] == 1
+
+
+def test_forget_makes_the_next_detection_new():
+    tracker = _tracker()
+    fire, _ = tracker.observe("forest-1", LAT, LON, _smoke(0.5), now=0)
+    tracker.forget(fire)
+    tracker.forget(fire)  # A second call is a no-op
+
+    again, verdict = tracker.observe("forest-1", LAT, LON, _smoke(0.5), now=1)
+    assert verdict == NEW and again is not fire
+    assert tracker.stats()["forgotten"] == 1
+
+
+def test_detections_without_coordinates_are_never_clustered():
+    tracker = _tracker()
+    first, verdict = tracker.observe("forest-1", None, "n/a", _smoke(0.5), now=0)
+    assert verdict == NEW and first.cell is None
+
+    second, verdict = tracker.observe("forest-1", None, None, _smoke(0.5), now=1)
+    assert verdict == NEW and second is not first
@@ -0,0 +1,122 @@
+import pytest
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+
+from firebase.local import InMemoryFirestore, InMemoryWriteBatch
+from firebase.writer import AlertWriter
+
+
+class FlakyFirestore(InMemoryFirestore):
+    """Fails the first `failures` batch commits with a transient error."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    def batch(self):
+        client = self
+
+        class FlakyBatch(InMemoryWriteBatch):
+            def commit(self, timeout=None):
+                client.attempts += 1
+                if client.attempts <= client.failures:
+                    raise ServiceUnavailable("try again")
+                return super().commit(timeout)
+
+        return FlakyBatch(self)
+
+
+def _doc(db, path):
+    return db.document(path).get().to_dict()
+
+
+@pytest.fixture
+def db():
+    return InMemoryFirestore()
+
+
+def test_queued_groups_share_one_commit(db):
+    writer = AlertWriter(db, flush_interval=60)
+    futures = [writer.enqueue([("set", db.document(f"alerts/a{i}"), {"n": i})]) for i in range(5)]
+    assert writer.flush(timeout=5)
+    assert [future.result(timeout=1) for future in futures] == [None] * 5
+    assert db.commits == 1
+    assert _doc(db, "alerts/a3") == {"n": 3}
+    writer.close(timeout=1)
+
+
+def test_groups_are_never_split_across_batches(db):
+    writer = AlertWriter(db, max_batch_writes=3, flush_interval=60)
+    futures = [
+        writer.enqueue([("set", db.document(f"alerts/a{i}"), {"n": i}), ("set", db.document(f"images/i{i}"), {"n": i})])
+        for i in range(3)
+    ]
+    assert writer.flush(timeout=5)
+    for future in futures:
+        future.result(timeout=1)
+    assert db.commits == 3  # 2 + 2 writes would not fit in 3
+    assert writer.stats()["groups"] == 3
+
+
+def test_group_is_atomic(db):
+    writer = AlertWriter(db, flush_interval=60)
+    alert_id, future = writer.create_alert({"status": "active"}, image_ref=db.document("images/missing"))
+    writer.flush(timeout=5)
+    with pytest.raises(NotFound):
+        future.result(timeout=1)
+    assert _doc(db, f"alerts/{alert_id}") is None  # The alert did not land without its image flag
+
+
+def test_failed_batch_is_split_so_only_the_bad_group_fails(db):
+    db.document("images/ok").set({"alert_status": None})
+    writer = AlertWriter(db, flush_interval=60)
+    good = writer.enqueue([("set", db.document("alerts/good"), {"n": 1})])
+    bad = writer.enqueue([("update", db.document("images/missing"), {"alert_status": "active"})])
+    flagged = writer.enqueue([("update", db.document("images/ok"), {"alert_status": "active"})])
+    writer.flush(timeout=5)
+
+    good.result(timeout=1)
+    flagged.result(timeout=1)
+    with pytest.raises(NotFound):
+        bad.result(timeout=1)
+    assert _doc(db, "alerts/good") == {"n": 1}
+    assert _doc(db, "images/ok") == {"alert_status": "active"}
+    assert writer.stats()["failed_groups"] == 1
+
+
+def test_transient_errors_are_retried():
+    db = FlakyFirestore(failures=2)
+    writer = AlertWriter(db, flush_interval=60, max_retries=3)
+    future = writer.enqueue([("set", db.document("alerts/a"), {"n": 1})])
+    writer.flush(timeout=10)
+    future.result(timeout=1)
+    assert db.attempts == 3
+    assert writer.stats()["retries"] == 2
+    assert _doc(db, "alerts/a") == {"n": 1}
+
+
+def test_retries_give_up_after_max_retries():
+    db = FlakyFirestore(failures=100)
+    writer = AlertWriter(db, flush_interval=60, max_retries=1)
+    future = writer.enqueue([("set", db.document("alerts/a"), {"n": 1})])
+    writer.flush(timeout=10)
+    with pytest.raises(ServiceUnavailable):
+        future.result(timeout=1)
+    assert db.attempts == 2
+
+
+def test_close_commits_what_is_queued_then_refuses_writes(db):
+    writer = AlertWriter(db, flush_interval=60)
+    future = writer.enqueue([("set", db.document("alerts/a"), {"n": 1})])
+    writer.close(timeout=5)
+    future.result(timeout=1)
+    with pytest.raises(RuntimeError):
+        writer.enqueue([("set", db.document("alerts/b"), {"n": 2})])
+
+
+def test_group_size_is_checked(db):
+    writer = AlertWriter(db, max_batch_writes=2)
+    with pytest.raises(ValueError):
+        writer.enqueue([])
+    with pytest.raises(ValueError):
+        writer.enqueue([("delete", db.document(f"alerts/a{i}"), None) for i in range(3)])